@@ -0,0 +1,170 @@
+# app/config.py
+
+import os
+
+# --- Configuration: Environment Variables ---
+# Every setting can be overridden from the environment (e.g. in the Dockerfile
+# or `docker run -e ...`). Defaults keep the single-process dev setup working.
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.getenv(name, default) or default
+
+
+UPLOAD_DIR = _env_str("RECEIPTS_UPLOAD_DIR", "uploads")
+
+# --- Upload Storage (see app/services/storage.py) ---
+# Levels of hash-prefix subdirectories (2 = uploads/ab/cd/...); 0 keeps the flat layout.
+STORAGE_SHARD_DEPTH = _env_int("RECEIPTS_STORAGE_SHARD_DEPTH", 2)
+# Stored files older than this many seconds are deleted; 0 keeps them forever.
+STORAGE_MAX_AGE_SECONDS = _env_float("RECEIPTS_STORAGE_MAX_AGE_SECONDS", 0.0)
+# Oldest files are deleted while the store is over this many bytes; 0 disables the budget.
+STORAGE_MAX_BYTES = _env_int("RECEIPTS_STORAGE_MAX_BYTES", 0)
+# Seconds between garbage collection passes.
+STORAGE_GC_INTERVAL = _env_float("RECEIPTS_STORAGE_GC_INTERVAL", 300.0)
+# Seconds between batched writes to the storage index.
+STORAGE_INDEX_FLUSH_INTERVAL = _env_float("RECEIPTS_STORAGE_INDEX_FLUSH_INTERVAL", 2.0)
+
+# --- Processing Worker Pool ---
+# "thread" keeps everything in one process (OpenCV releases the GIL for its
+# heavy calls); "process" side-steps the GIL entirely at the cost of pickling
+# arguments across the process boundary.
+PROCESSING_POOL_KIND = _env_str("RECEIPTS_POOL_KIND", "thread")
+# 0 derives it from the core budget below.
+PROCESSING_POOL_SIZE = _env_int("RECEIPTS_POOL_SIZE", 0)
+
+# --- Core Budget (see app/services/thread_budget.py) ---
+# Cores shared by all web workers, pool workers and OpenCV threads; 0 = all
+# cores available to the container/process.
+CPU_BUDGET = _env_int("RECEIPTS_CPU_BUDGET", 0)
+# Uvicorn worker processes (`python -m app.serve`); 0 derives it from the
+# budget. Uvicorn's own WEB_CONCURRENCY is honoured when set.
+WEB_WORKERS = _env_int("RECEIPTS_WEB_WORKERS", _env_int("WEB_CONCURRENCY", 0))
+# cv2.setNumThreads per pipeline process; 0 derives it, -1 keeps OpenCV's default.
+OPENCV_THREADS = _env_int("RECEIPTS_OPENCV_THREADS", 0)
+HOST = _env_str("RECEIPTS_HOST", "0.0.0.0")
+PORT = _env_int("RECEIPTS_PORT", 8000)
+
+# --- Paper Detection ---
+# "full", "downscale" or "thumbnail" (HEIC; see app/services/pipeline.py). Can be overridden per
+# request with the `detection_mode` query parameter.
+DETECTION_MODE = _env_str("RECEIPTS_DETECTION_MODE", "full")
+DETECTION_MAX_SIDE = _env_int("RECEIPTS_DETECTION_MAX_SIDE", 1024)
+DETECTION_SCALE = _env_float("RECEIPTS_DETECTION_SCALE", 0.0)
+DETECTION_REFINE = _env_bool("RECEIPTS_DETECTION_REFINE", True)
+# Detector engine ("contour" or "projection", see app/services/detectors.py).
+# Can be overridden per request with the `detector` query parameter.
+DETECTOR_ENGINE = _env_str("RECEIPTS_DETECTOR", "contour")
+# Multi-receipt photos (`multiple=true` on /api/process_image/): every paper region covering
+# at least this fraction of the frame is cropped, largest first, up to DETECTION_MAX_REGIONS.
+DETECTION_MIN_AREA = _env_float("RECEIPTS_DETECTION_MIN_AREA", 0.02)
+DETECTION_MAX_REGIONS = _env_int("RECEIPTS_DETECTION_MAX_REGIONS", 20)
+# "thumbnail" mode: embedded thumbnails with a longest side below this are ignored (the
+# image is detected as in "downscale"); small thumbnails cost accuracy, see pipeline.py.
+DETECTION_THUMBNAIL_MIN_SIDE = _env_int("RECEIPTS_DETECTION_THUMBNAIL_MIN_SIDE", 512)
+
+# --- Startup ---
+# Run a tiny synthetic image through every decoder, the detector and the
+# encoder on each pool worker before the app reports ready (GET /api/ready).
+WARM_UP = _env_bool("RECEIPTS_WARM_UP", True)
+
+# --- Upload Pipeline ---
+# "disk":   save the upload, then decode it back from uploads/ (original flow).
+# "memory": decode straight from the upload buffer; only the crop is written.
+PIPELINE_MODE = _env_str("RECEIPTS_PIPELINE_MODE", "disk")
+# What happens to the untouched original (needed by /api/crop_image/ once it
+# has left the decoded-image cache): "off" (not kept), "sync" (written before
+# responding) or "background". "disk" mode writes it anyway; "off" deletes it.
+PERSIST_ORIGINALS = _env_str("RECEIPTS_PERSIST_ORIGINALS", "background")
+
+# --- Output Encoding ---
+# Format of written crops: "source" (keep the upload's format, HEIC -> JPEG),
+# "jpeg", "webp" or "png". See app/services/encoder.py.
+OUTPUT_FORMAT = _env_str("RECEIPTS_OUTPUT_FORMAT", "source")
+# JPEG/WebP quality 1-100; 0 keeps the OpenCV default (95 for JPEG).
+OUTPUT_QUALITY = _env_int("RECEIPTS_OUTPUT_QUALITY", 0)
+OUTPUT_GRAYSCALE = _env_bool("RECEIPTS_OUTPUT_GRAYSCALE", False)
+OUTPUT_PROGRESSIVE = _env_bool("RECEIPTS_OUTPUT_PROGRESSIVE", False)
+OUTPUT_OPTIMIZE = _env_bool("RECEIPTS_OUTPUT_OPTIMIZE", False)
+# PNG zlib level 0-9; -1 keeps the OpenCV default.
+OUTPUT_PNG_COMPRESSION = _env_int("RECEIPTS_OUTPUT_PNG_COMPRESSION", -1)
+# Budgets per crop; 0 disables each.
+OUTPUT_MAX_SIDE = _env_int("RECEIPTS_OUTPUT_MAX_SIDE", 0)
+OUTPUT_MAX_BYTES = _env_int("RECEIPTS_OUTPUT_MAX_BYTES", 0)
+
+# --- Upload Limits ---
+# Uploads are streamed to disk in chunks of this size (constant memory per request).
+UPLOAD_CHUNK_SIZE = _env_int("RECEIPTS_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+# Largest accepted upload body in bytes; 0 disables the limit.
+MAX_UPLOAD_BYTES = _env_int("RECEIPTS_MAX_UPLOAD_BYTES", 50 * 1024 * 1024)
+# Largest accepted width x height, read from the file header before decoding
+# (a 48 MP phone photo passes, a 100 MP panorama or decompression bomb does
+# not); 0 disables the limit.
+MAX_IMAGE_PIXELS = _env_int("RECEIPTS_MAX_IMAGE_PIXELS", 60_000_000)
+
+# --- Result Cache ---
+# In-memory LRU of results keyed by upload hash + detector parameters: at most
+# this many entries (0 disables the cache) ...
+RESULT_CACHE_ENTRIES = _env_int("RECEIPTS_RESULT_CACHE_ENTRIES", 1024)
+# ... and at most this many bytes (entries measured as JSON; 0 = count only).
+RESULT_CACHE_BYTES = _env_int("RECEIPTS_RESULT_CACHE_BYTES", 16 * 1024 * 1024)
+# Directory for the persistent tier (survives restarts); empty disables it.
+RESULT_CACHE_DIR = _env_str("RECEIPTS_RESULT_CACHE_DIR", "")
+# Most files kept in that directory (~1 KB each); the least recently used go first.
+RESULT_CACHE_DISK_ENTRIES = _env_int("RECEIPTS_RESULT_CACHE_DISK_ENTRIES", 100_000)
+# Memory budget of the LRU of decoded originals used by /api/crop_image/
+# (a 12 MP photo decodes to ~36 MB); 0 disables it.
+DECODED_CACHE_BYTES = _env_int("RECEIPTS_DECODED_CACHE_BYTES", 256 * 1024 * 1024)
+
+# --- Admission Control ---
+# Requests allowed to run at once per endpoint class, and how many more may
+# wait (FIFO) before new ones are shed with 429. A request that waits longer
+# than the timeout (seconds, 0 = forever) is shed with 503. "process" covers
+# process_image, process_batch and crop_image; "submit" the final upload.
+# 0 in-flight for "process" means twice the worker pool size.
+PROCESS_MAX_IN_FLIGHT = _env_int("RECEIPTS_PROCESS_MAX_IN_FLIGHT", 0)
+PROCESS_MAX_QUEUE = _env_int("RECEIPTS_PROCESS_MAX_QUEUE", 16)
+PROCESS_QUEUE_TIMEOUT = _env_float("RECEIPTS_PROCESS_QUEUE_TIMEOUT", 15.0)
+SUBMIT_MAX_IN_FLIGHT = _env_int("RECEIPTS_SUBMIT_MAX_IN_FLIGHT", 32)
+SUBMIT_MAX_QUEUE = _env_int("RECEIPTS_SUBMIT_MAX_QUEUE", 64)
+SUBMIT_QUEUE_TIMEOUT = _env_float("RECEIPTS_SUBMIT_QUEUE_TIMEOUT", 5.0)
+
+# --- Async Jobs ---
+# SQLite file of the /api/jobs/ queue; empty puts a hidden .jobs.sqlite3 in
+# UPLOAD_DIR (next to the saved uploads the jobs refer to).
+JOBS_DB = _env_str("RECEIPTS_JOBS_DB", "")
+# Jobs cropped at once; 0 means the worker pool size.
+JOB_WORKERS = _env_int("RECEIPTS_JOB_WORKERS", 0)
+
+# --- Outcome Index ---
+# Record every processing outcome in a queryable SQLite index (GET /api/outcomes/).
+OUTCOMES_ENABLED = _env_bool("RECEIPTS_OUTCOMES_ENABLED", True)
+# SQLite file of the index; empty puts a hidden .outcomes.sqlite3 in UPLOAD_DIR.
+OUTCOMES_DB = _env_str("RECEIPTS_OUTCOMES_DB", "")
+# Seconds between batched writes; a full batch is written straight away.
+OUTCOMES_FLUSH_INTERVAL = _env_float("RECEIPTS_OUTCOMES_FLUSH_INTERVAL", 2.0)
+OUTCOMES_BATCH_SIZE = _env_int("RECEIPTS_OUTCOMES_BATCH_SIZE", 256)
+
+# --- Batch Processing ---
+# Most files (or zip members) accepted by one /api/process_batch/ request.
+BATCH_MAX_FILES = _env_int("RECEIPTS_BATCH_MAX_FILES", 500)
+# Largest accepted /api/process_batch/ body in bytes (every file in it is still
+# capped by RECEIPTS_MAX_UPLOAD_BYTES); 0 disables the limit.
+BATCH_MAX_BYTES = _env_int("RECEIPTS_BATCH_MAX_BYTES", 2 * 1024 * 1024 * 1024)
@@ -1,15 +1,44 @@
 # app/main.py
+import time
+# Taken before the imports below, for the import-to-ready measurement (GET /api/ready)
+IMPORT_STARTED = time.perf_counter()
+
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, UploadFile, File, Depends, Response
+from fastapi import FastAPI, UploadFile, File, Depends, Response, HTTPException, Query, Request, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, FileResponse
 import uvicorn
+import asyncio
+import cv2
 import logging
+import mimetypes
 import os
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import unquote
 # FIX: Import Dict from typing along with Optional
-from typing import Optional, Dict
-from app.services.image_service import ImageService
-from app.models.image_models import CoordinatesResponse
+from typing import Optional, Dict, List, Any, Tuple
+from app import config
+from app.services.image_service import ImageService, UploadTooLargeError, OriginalNotFoundError
+from app.services.worker_pool import WorkerPool
+from app.services.result_cache import ResultCache
+from app.services.image_cache import DecodedImageCache
+from app.services.encoder import EncodeOptions
+from app.services.probe import ImageRejectedError, ImageDimensionsError
+from app.services.admission import AdmissionLimiter, AdmissionRejected
+from app.services.job_queue import JobQueue, JobRunner, JOB_PRIORITIES
+from app.services.storage import UploadStore
+from app.services.outcome_index import OutcomeIndex, OUTCOME_KINDS, OUTCOME_STATUSES
+from app.services.thread_budget import plan_threads, apply_opencv_threads
+from app.services import pipeline
+from app.services.pipeline import DetectionOptions, DETECTION_MODES
+from app.services.decoders import loaded_codecs
+from app.services.detectors import DETECTORS
+from app.services import metrics
+from app.models.image_models import CoordinatesResponse, BatchItemResponse, CropSubmission, CropResultResponse, JobResponse, \
+    OutcomeRecord, OutcomePage, RegionResponse
 
 # --- Configuration: Logging Setup ---
 logging.basicConfig(
@@ -21,24 +50,269 @@ logger = logging.getLogger(__name__)
 # --- Configuration: Environment Variable ---
 API_BASE_URL = "http://localhost:8000"
 
+# --- Core Budget ---
+# `python -m app.serve` exports the worker count it launched with; a plain
+# `uvicorn app.main:app` is one worker.
+thread_layout = plan_threads(
+    cores=config.CPU_BUDGET,
+    web_workers=config.WEB_WORKERS or 1,
+    pool_kind=config.PROCESSING_POOL_KIND,
+    pool_size=config.PROCESSING_POOL_SIZE,
+    opencv_threads=config.OPENCV_THREADS,
+)
+apply_opencv_threads(thread_layout.opencv_threads)
+
+# --- Initialize Service Instance ---
+worker_pool = WorkerPool(kind=thread_layout.pool_kind, size=thread_layout.pool_size,
+                         initializer=apply_opencv_threads, initargs=(thread_layout.opencv_threads,))
+detection_options = DetectionOptions(
+    mode=config.DETECTION_MODE,
+    max_side=config.DETECTION_MAX_SIDE,
+    scale=config.DETECTION_SCALE,
+    refine=config.DETECTION_REFINE,
+    engine=config.DETECTOR_ENGINE,
+    min_area=config.DETECTION_MIN_AREA,
+    max_regions=config.DETECTION_MAX_REGIONS,
+    thumbnail_min_side=config.DETECTION_THUMBNAIL_MIN_SIDE,
+)
+result_cache = None
+if config.RESULT_CACHE_ENTRIES > 0 or config.RESULT_CACHE_DIR:
+    result_cache = ResultCache(max_entries=config.RESULT_CACHE_ENTRIES, disk_dir=config.RESULT_CACHE_DIR or None,
+                               max_disk_entries=config.RESULT_CACHE_DISK_ENTRIES,
+                               max_bytes=config.RESULT_CACHE_BYTES)
+encode_options = EncodeOptions(
+    format=config.OUTPUT_FORMAT,
+    quality=config.OUTPUT_QUALITY,
+    grayscale=config.OUTPUT_GRAYSCALE,
+    progressive=config.OUTPUT_PROGRESSIVE,
+    optimize=config.OUTPUT_OPTIMIZE,
+    png_compression=config.OUTPUT_PNG_COMPRESSION,
+    max_side=config.OUTPUT_MAX_SIDE,
+    max_bytes=config.OUTPUT_MAX_BYTES,
+)
+upload_store = UploadStore(
+    config.UPLOAD_DIR,
+    shard_depth=config.STORAGE_SHARD_DEPTH,
+    max_age_seconds=config.STORAGE_MAX_AGE_SECONDS,
+    max_bytes=config.STORAGE_MAX_BYTES,
+)
+outcome_index = OutcomeIndex(
+    config.OUTCOMES_DB or os.path.join(config.UPLOAD_DIR, ".outcomes.sqlite3"),
+    batch_size=config.OUTCOMES_BATCH_SIZE,
+) if config.OUTCOMES_ENABLED else None
+decoded_cache = DecodedImageCache(max_bytes=config.DECODED_CACHE_BYTES) if config.DECODED_CACHE_BYTES > 0 else None
+image_service_instance = ImageService(
+    upload_dir=config.UPLOAD_DIR,
+    worker_pool=worker_pool,
+    detection=detection_options,
+    pipeline_mode=config.PIPELINE_MODE,
+    persist_originals=config.PERSIST_ORIGINALS,
+    chunk_size=config.UPLOAD_CHUNK_SIZE,
+    max_upload_bytes=config.MAX_UPLOAD_BYTES,
+    result_cache=result_cache,
+    decoded_cache=decoded_cache,
+    encoding=encode_options,
+    max_image_pixels=config.MAX_IMAGE_PIXELS,
+    store=upload_store,
+    outcomes=outcome_index,
+)
+logger.info("ImageService instance created outside of routing.")
+
+# --- Async Jobs (see app/services/job_queue.py) ---
+job_runner = JobRunner(
+    JobQueue(config.JOBS_DB or os.path.join(config.UPLOAD_DIR, ".jobs.sqlite3")),
+    image_service_instance,
+    concurrency=config.JOB_WORKERS,
+    on_result=metrics.observe_result,
+)
+
+# --- Admission Control (see app/services/admission.py) ---
+admission_limiters: Dict[str, AdmissionLimiter] = {
+    "process": AdmissionLimiter(
+        "process",
+        max_in_flight=config.PROCESS_MAX_IN_FLIGHT or worker_pool.size * 2,
+        max_queue=config.PROCESS_MAX_QUEUE,
+        queue_timeout=config.PROCESS_QUEUE_TIMEOUT,
+    ),
+    "submit": AdmissionLimiter(
+        "submit",
+        max_in_flight=config.SUBMIT_MAX_IN_FLIGHT,
+        max_queue=config.SUBMIT_MAX_QUEUE,
+        queue_timeout=config.SUBMIT_QUEUE_TIMEOUT,
+        default_service_seconds=0.1,
+    ),
+}
+# POST routes -> admission class
+ADMISSION_ROUTES = {
+    "/api/process_image/": "process",
+    "/api/process_image/raw": "process",
+    "/api/process_batch/": "process",
+    "/api/crop_image/": "process",
+    "/api/submit_cropped_image/": "submit",
+    "/api/jobs/": "submit",
+}
+
+
+# Milliseconds from IMPORT_STARTED to the end of each startup phase; "ready" is set last
+startup_timings: Dict[str, Any] = {}
+
+
+async def warm_up_workers() -> Dict[str, float]:
+    """One warm-up per pool worker, so each process of a process pool is warmed too. Slowest run per decoder."""
+    runs = await asyncio.gather(*(worker_pool.run(pipeline.warm_up, detection_options, encode_options)
+                                  for _ in range(worker_pool.size)))
+    return {name: max(run[name] for run in runs) for name in runs[0]}
+
+
+def startup_phase(phase: str) -> None:
+    elapsed = time.perf_counter() - IMPORT_STARTED
+    startup_timings[phase] = round(elapsed * 1000, 3)
+    metrics.STARTUP_SECONDS.set(elapsed, phase=phase)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_phase("import")
+    logger.info(f"{thread_layout.report()} (pid {os.getpid()})")
+    if config.WARM_UP:
+        startup_timings['warm_up_decoders'] = await warm_up_workers()
+        startup_phase("warm_up")
+    # Resume jobs queued before a restart; otherwise workers start on the first submission
+    if job_runner.queue.exists():
+        await job_runner.start()
+    collector = None
+    if upload_store.max_age_seconds or upload_store.max_bytes:
+        collector = asyncio.create_task(upload_store.collect_periodically(config.STORAGE_GC_INTERVAL))
+    index_flusher = None
+    if upload_store.indexed:
+        index_flusher = asyncio.create_task(upload_store.flush_periodically(config.STORAGE_INDEX_FLUSH_INTERVAL))
+    # Leftovers of writes interrupted by a crash; does not hold up readiness
+    sweeper = asyncio.create_task(asyncio.to_thread(upload_store.sweep_temporary_files))
+    flusher = None
+    if outcome_index is not None:
+        flusher = asyncio.create_task(outcome_index.flush_periodically(config.OUTCOMES_FLUSH_INTERVAL))
+    startup_phase("ready")
+    logger.info(f"Ready {startup_timings['ready']} ms after import "
+                f"(import {startup_timings['import']} ms, warm-up {config.WARM_UP})")
+    yield
+    startup_timings.clear()
+    if collector is not None:
+        collector.cancel()
+    await job_runner.stop()
+    # Finish deferred original writes, then release the worker threads/processes
+    await image_service_instance.drain_background_writes()
+    image_service_instance.shutdown()
+    if flusher is not None:
+        flusher.cancel()
+        # Outcomes of the requests drained above
+        await asyncio.to_thread(outcome_index.flush)
+    if index_flusher is not None:
+        index_flusher.cancel()
+        await asyncio.to_thread(upload_store.flush)
+    await asyncio.gather(sweeper, return_exceptions=True)
+
+
 # --- FastAPI App Instance ---
-app = FastAPI(title="Vue-FastAPI Cropping App (Final)")
+app = FastAPI(title="Vue-FastAPI Cropping App (Final)", lifespan=lifespan)
 origins = [
     "*"
 ]
 
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware (not BaseHTTPMiddleware) so that a request is shed
+    before its body is read, and a streamed batch response keeps its slot
+    until the last line is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            limiter = admission_limiters.get(ADMISSION_ROUTES.get(scope["path"], ""))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            # Only acquiring the slot can raise AdmissionRejected
+            async with limiter.slot():
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            logger.warning(f"Shedding {scope['path']}: {e}")
+            metrics.ADMISSION_REJECTED.inc(endpoint=limiter.name, reason=e.reason)
+            response = JSONResponse(status_code=e.status_code, content={"detail": str(e)},
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+
+
+app.add_middleware(AdmissionMiddleware)
+
+# Room for multipart boundaries/part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+# Carries many files per body, so it has a limit of its own
+BATCH_PATH = "/api/process_batch/"
+
+# How /api/process_image/ can hand back the crop it wrote (see `return_image`)
+RETURN_IMAGE_MODES = ("multipart", "url")
+# Crops are never rewritten under the same (uuid) name, so clients may keep them
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@app.middleware("http")
+async def reject_oversized_bodies(request: Request, call_next):
+    """
+    Rejects uploads whose declared Content-Length is already over the limit,
+    before the multipart body is parsed or spooled anywhere. Bodies without a
+    Content-Length (chunked) are capped by ImageService while streaming.
+    A batch is checked against BATCH_MAX_BYTES instead; each file in it is
+    still capped by ImageService.
+    """
+    if request.url.path == BATCH_PATH:
+        limit = config.BATCH_MAX_BYTES
+    else:
+        limit = config.MAX_UPLOAD_BYTES and config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if limit and content_length and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(status_code=413, content={"detail": "Upload too large"})
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Request counts by status, body bytes, latency and the in-flight gauge."""
+    metrics.IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.IN_FLIGHT.dec()
+        # Label by route template (not raw URL) to keep cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.REQUESTS.inc(path=path, code=str(status_code))
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, path=path)
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit():
+            metrics.UPLOAD_BYTES.inc(int(content_length), path=path)
+
+
+# Added last so that it is the outermost layer: the 413/429/503 responses
+# built by the middlewares above carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,         # Allow all origins
     allow_credentials=True,        # Allow cookies/auth headers (if needed)
     allow_methods=["*"],           # Allow all HTTP methods (GET, POST, PUT, etc.)
     allow_headers=["*"],           # Allow all headers
+    expose_headers=["Retry-After", "Server-Timing"],  # Readable by the frontend (backoff, stage timings)
 )
 
-# --- Initialize Service Instance ---
-image_service_instance = ImageService()
-logger.info("ImageService instance created outside of routing.")
-
 
 # Dependency function to provide the shared ImageService instance
 def get_image_service() -> ImageService:
@@ -46,33 +320,294 @@ def get_image_service() -> ImageService:
     return image_service_instance
 
 
+# Dependency function to provide the async job runner (and its queue)
+def get_job_runner() -> JobRunner:
+    return job_runner
+
+
+def build_coordinates_response(original_filename: str, process_result: Dict[str, Any]) -> CoordinatesResponse:
+    """Maps an ImageService result dict onto the public response schema."""
+    base_name, original_ext = os.path.splitext(original_filename)
+    output_filename_display = f"{base_name}_cropped{original_ext}"
+
+    return CoordinatesResponse(
+        filename=original_filename,
+        output_filename=output_filename_display,
+        x=process_result.get('x', 0),
+        y=process_result.get('y', 0),
+        w=process_result.get('w', 0),
+        h=process_result.get('h', 0),
+        status=process_result.get('status', 'Processing Failed'),
+        detection_mode=process_result.get('detection_mode'),
+        detection_scale=process_result.get('detection_scale'),
+        detector=process_result.get('detector'),
+        source_filename=process_result.get('source_filename'),
+        output_bytes=process_result.get('output_bytes'),
+        regions=[RegionResponse(**region) for region in process_result['regions']]
+        if process_result.get('regions') else None
+    )
+
+
+async def build_job_response(job: Dict[str, Any], queue: JobQueue) -> JobResponse:
+    """The job as returned by the API; its queue position is read off the loop (SQLite)."""
+    position = await asyncio.to_thread(queue.position, job) if job['status'] == "queued" else None
+    return JobResponse(
+        job_id=job['id'],
+        status=job['status'],
+        priority=job['priority'],
+        filename=job['filename'],
+        status_url=app.url_path_for("get_job", job_id=job['id']),
+        position=position,
+        created_at=job['created_at'],
+        started_at=job['started_at'],
+        finished_at=job['finished_at'],
+        result=build_coordinates_response(job['filename'], job['result']) if job['result'] else None,
+        error=job['error']
+    )
+
+
+def image_url_for(saved_filename: str) -> str:
+    return app.url_path_for("get_stored_image", filename=saved_filename)
+
+
+def build_multipart_response(metadata: CoordinatesResponse, images: List[Tuple[str, bytes]],
+                             headers: Dict[str, str]) -> Response:
+    """
+    multipart/mixed body: the JSON metadata part, then each encoded crop
+    (one per receipt with multiple=true), so a client gets coordinates and
+    pixels from a single request.
+    """
+    boundary = uuid.uuid4().hex
+    parts = [f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+             metadata.model_dump_json().encode()]
+    for filename, image in images:
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        parts += [f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Disposition: attachment; filename=\"{filename}\"\r\n\r\n".encode(),
+                  image]
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    return Response(b"".join(parts), media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
+
+
+def locate_stored_image(service: ImageService, filename: str) -> Optional[Tuple[str, os.stat_result]]:
+    """Path and stat of a stored file, or None if there is none (blocking; run off the loop)."""
+    path = service.stored_image_path(filename)
+    if path is None:
+        return None
+    try:
+        return path, os.stat(path)
+    except FileNotFoundError:
+        # Collected between the lookup and the stat
+        return None
+
+
+async def require_stored_image(service: ImageService, filename: str) -> str:
+    """Path of a crop just written; 410 if it was collected or removed since."""
+    path = await asyncio.to_thread(service.stored_image_path, filename)
+    if path is None:
+        raise HTTPException(status_code=410, detail=f"Crop '{filename}' is no longer available")
+    return path
+
+
+async def read_stored_image(service: ImageService, filename: str) -> bytes:
+    path = await require_stored_image(service, filename)
+    try:
+        return await asyncio.to_thread(Path(path).read_bytes)
+    except FileNotFoundError:
+        # Collected between the lookup and the read
+        raise HTTPException(status_code=410, detail=f"Crop '{filename}' is no longer available")
+
+
+def rejection_status(error: ImageRejectedError) -> int:
+    """413 for images over the pixel limit, 415 for unsupported content."""
+    return 413 if isinstance(error, ImageDimensionsError) else 415
+
+
+def validate_detection_params(detection_mode: Optional[str], detector: Optional[str]) -> None:
+    if detection_mode is not None and detection_mode not in DETECTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown detection_mode. Expected one of {DETECTION_MODES}.")
+    if detector is not None and detector not in DETECTORS:
+        raise HTTPException(status_code=400, detail=f"Unknown detector. Expected one of {tuple(DETECTORS)}.")
+
+
 # ====================================================================
 # I. Endpoint Functions
 # ====================================================================
 
 @app.post("/api/process_image/", response_model=CoordinatesResponse)
 async def process_image_and_get_coords(
+        response: Response,
         file: UploadFile = File(...),
+        detection_mode: Optional[str] = Query(None, description=f"One of {DETECTION_MODES}"),
+        detector: Optional[str] = Query(None, description=f"One of {tuple(DETECTORS)}"),
+        return_image: Optional[str] = Query(
+            None, description="'multipart' to receive the crop in the response, 'url' for an image_url"),
+        multiple: bool = Query(False, description="Crop every receipt in the photo (listed in `regions`)"),
         service: ImageService = Depends(get_image_service)
-) -> CoordinatesResponse:
+):
+    """
+    Finds the paper in the upload and writes the crop. With return_image the
+    crop itself comes back as well: inline as a multipart/mixed part, or as an
+    `image_url` served by GET /api/images/{filename} (ETag + Range). With
+    multiple=true the photo is decoded once and every receipt in it is
+    cropped; each one gets its own part or image_url.
+    """
     logger.info(f"Received request to process and save initial image: {file.filename}")
 
-    process_result = await service.image_cropping(file)
+    validate_detection_params(detection_mode, detector)
+    if return_image is not None and return_image not in RETURN_IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown return_image. Expected one of {RETURN_IMAGE_MODES}.")
 
-    original_filename = file.filename
-    base_name, original_ext = os.path.splitext(original_filename)
-    output_filename_display = f"{base_name}_cropped{original_ext}"
+    try:
+        process_result = await service.image_cropping(file, detection_mode=detection_mode, detector=detector,
+                                                      multiple=multiple)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=rejection_status(e), detail=str(e))
 
     logger.info(f"Processing complete. Status: {process_result.get('status', 'Failed')}")
 
-    return CoordinatesResponse(
-        filename=original_filename,
-        output_filename=output_filename_display,
-        x=process_result.get('x', 0),
-        y=process_result.get('y', 0),
-        w=process_result.get('w', 0),
-        h=process_result.get('h', 0),
-        status=process_result.get('status', 'Processing Failed')
+    metrics.observe_result(process_result)
+    response.headers["Server-Timing"] = metrics.server_timing_header(process_result)
+
+    coordinates = build_coordinates_response(file.filename, process_result)
+    saved_filename = process_result.get('saved_filename')
+    if return_image is None or process_result.get('status', '').startswith("Error") or not saved_filename:
+        return coordinates
+
+    filenames = [region.saved_filename for region in coordinates.regions] if coordinates.regions else [saved_filename]
+    if return_image == "url":
+        for filename in filenames:
+            await require_stored_image(service, filename)
+        coordinates.image_url = image_url_for(saved_filename)
+        for region in coordinates.regions or []:
+            region.image_url = image_url_for(region.saved_filename)
+        return coordinates
+
+    images = [(filename, await read_stored_image(service, filename)) for filename in filenames]
+    return build_multipart_response(coordinates, images, dict(response.headers))
+
+
+@app.post("/api/process_image/raw", response_model=CoordinatesResponse)
+async def process_raw_image(
+        request: Request,
+        response: Response,
+        x_filename: Optional[str] = Header(None, description="Name of the uploaded file, percent-encoded"),
+        detection_mode: Optional[str] = Query(None, description=f"One of {DETECTION_MODES}"),
+        detector: Optional[str] = Query(None, description=f"One of {tuple(DETECTORS)}"),
+        multiple: bool = Query(False, description="Crop every receipt in the photo (listed in `regions`)"),
+        service: ImageService = Depends(get_image_service)
+):
+    """
+    Same as /api/process_image/, but the request body is the image itself
+    (application/octet-stream or image/*) and the filename comes from the
+    X-Filename header. The body is read straight from the socket into one
+    buffer sized from Content-Length: no multipart parsing, no spooled file.
+    """
+    if not x_filename:
+        raise HTTPException(status_code=400, detail="X-Filename header is required.")
+    content_type = request.headers.get("content-type", "application/octet-stream")
+    if not (content_type.startswith("application/octet-stream") or content_type.startswith("image/")):
+        raise HTTPException(status_code=415, detail="Send the image as application/octet-stream or image/*; "
+                                                    "multipart uploads go to /api/process_image/.")
+    validate_detection_params(detection_mode, detector)
+
+    filename = os.path.basename(unquote(x_filename))
+    content_length = request.headers.get("content-length")
+    logger.info(f"Received raw upload: {filename}")
+
+    try:
+        process_result = await service.image_cropping_stream(
+            request.stream(), filename,
+            content_length=int(content_length) if content_length and content_length.isdigit() else None,
+            detection_mode=detection_mode, detector=detector, multiple=multiple)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=rejection_status(e), detail=str(e))
+
+    logger.info(f"Processing complete. Status: {process_result.get('status', 'Failed')}")
+
+    metrics.observe_result(process_result)
+    response.headers["Server-Timing"] = metrics.server_timing_header(process_result)
+    return build_coordinates_response(filename, process_result)
+
+
+def is_zip_upload(file: UploadFile) -> bool:
+    return file.content_type in ("application/zip", "application/x-zip-compressed") \
+        or (file.filename or "").lower().endswith(".zip")
+
+
+@app.post(BATCH_PATH)
+async def process_batch(
+        files: List[UploadFile] = File(...),
+        detection_mode: Optional[str] = Query(None, description=f"One of {DETECTION_MODES}"),
+        detector: Optional[str] = Query(None, description=f"One of {tuple(DETECTORS)}"),
+        service: ImageService = Depends(get_image_service)
+) -> StreamingResponse:
+    """
+    Accepts many image files (or a single .zip of them) and streams one
+    BatchItemResponse JSON line per image as each one finishes.
+    A failing image produces an error line; the rest of the batch continues.
+    """
+    validate_detection_params(detection_mode, detector)
+
+    if len(files) == 1 and is_zip_upload(files[0]):
+        try:
+            files = service.open_zip_upload(files[0])
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Uploaded archive is not a valid zip file.")
+
+    if len(files) > config.BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {config.BATCH_MAX_FILES} files.")
+
+    logger.info(f"Received batch of {len(files)} images")
+
+    async def ndjson_lines():
+        async for index, file, process_result in service.image_cropping_batch(files, detection_mode, detector):
+            metrics.observe_result(process_result)
+            item = BatchItemResponse(index=index, **build_coordinates_response(file.filename, process_result).model_dump())
+            yield item.model_dump_json() + "\n"
+        logger.info(f"Batch of {len(files)} images complete")
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+
+@app.post("/api/crop_image/", response_model=CropResultResponse)
+async def crop_image(
+        response: Response,
+        submission: CropSubmission,
+        service: ImageService = Depends(get_image_service)
+) -> CropResultResponse:
+    """
+    Applies the Cropper.js box to the original uploaded through
+    /api/process_image/ (originalFileName = its `source_filename`) and saves
+    the final crop, replacing the second upload of the cropped image.
+    """
+    logger.info(f"Received crop submission for: {submission.originalFileName}")
+
+    try:
+        crop_result = await service.crop_from_submission(
+            submission.originalFileName, submission.x, submission.y, submission.width, submission.height,
+            rotate=submission.rotate, scale_x=submission.scaleX, scale_y=submission.scaleY
+        )
+    except OriginalNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    logger.info(f"Crop submission result: {crop_result['status']}")
+    response.headers["Server-Timing"] = metrics.server_timing_header(crop_result)
+
+    return CropResultResponse(
+        filename=submission.originalFileName,
+        saved_filename=crop_result['saved_filename'],
+        x=crop_result['x'],
+        y=crop_result['y'],
+        w=crop_result['w'],
+        h=crop_result['h'],
+        status=crop_result['status']
     )
 
 
@@ -87,13 +622,175 @@ async def submit_cropped_image(
     logger.info(f"Received final cropped image file: {cropped_file.filename}")
 
     # Call the service method to save the file
-    message = await service.save_cropped_file(cropped_file)
+    try:
+        message = await service.save_cropped_file(cropped_file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
     logger.info(f"Cropped image submission result: {message}")
 
     return {"message": message}
 
 
+@app.post("/api/jobs/", response_model=JobResponse, status_code=202)
+async def submit_job(
+        file: UploadFile = File(...),
+        detection_mode: Optional[str] = Query(None, description=f"One of {DETECTION_MODES}"),
+        detector: Optional[str] = Query(None, description=f"One of {tuple(DETECTORS)}"),
+        priority: str = Query("normal", description=f"One of {tuple(JOB_PRIORITIES)}; 'interactive' runs first"),
+        runner: JobRunner = Depends(get_job_runner)
+) -> JobResponse:
+    """
+    Asynchronous counterpart of /api/process_image/: saves the upload, queues
+    it and returns straight away. Poll `status_url` for the result.
+    """
+    validate_detection_params(detection_mode, detector)
+    if priority not in JOB_PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority. Expected one of {tuple(JOB_PRIORITIES)}.")
+
+    try:
+        stored = await runner.service.store_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageRejectedError as e:
+        raise HTTPException(status_code=rejection_status(e), detail=str(e))
+
+    job_id = await runner.submit(file.filename, {**stored, 'detection_mode': detection_mode, 'detector': detector},
+                                 priority)
+    logger.info(f"Queued job {job_id} for {file.filename} (priority {priority})")
+    return await build_job_response(await asyncio.to_thread(runner.queue.get, job_id), runner.queue)
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, runner: JobRunner = Depends(get_job_runner)) -> JobResponse:
+    """Status of a job, with its CoordinatesResponse once done."""
+    job = await asyncio.to_thread(runner.queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await build_job_response(job, runner.queue)
+
+
+@app.get("/api/jobs/")
+async def get_job_stats(runner: JobRunner = Depends(get_job_runner)) -> Dict:
+    """Jobs per status and whether the workers are running."""
+    counts = await asyncio.to_thread(runner.queue.counts)
+    return {'counts': counts, 'workers': runner.concurrency, 'running': runner.running}
+
+
+@app.get("/api/images/{filename}")
+async def get_stored_image(
+        filename: str,
+        request: Request,
+        service: ImageService = Depends(get_image_service)
+) -> Response:
+    """
+    Serves a crop (or kept original) from the upload directory, with an ETag
+    for conditional requests and byte-range support for resumable downloads.
+    """
+    try:
+        found = await asyncio.to_thread(locate_stored_image, service, filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if found is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    path, stat_result = found
+    file_response = FileResponse(path, stat_result=stat_result, headers={"Cache-Control": IMAGE_CACHE_CONTROL})
+    if request.headers.get("if-none-match") == file_response.headers["etag"]:
+        return Response(status_code=304, headers={"ETag": file_response.headers["etag"],
+                                                  "Cache-Control": IMAGE_CACHE_CONTROL})
+    return file_response
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(service: ImageService = Depends(get_image_service)) -> Dict:
+    """Hit/miss/eviction counters of the result and decoded-image caches, for sizing them."""
+    return service.cache_stats()
+
+
+@app.get("/api/storage")
+async def get_storage_stats(service: ImageService = Depends(get_image_service)) -> Dict:
+    """Files and bytes in the upload store (from its index) and what the collector evicted."""
+    return await asyncio.to_thread(service.store.stats)
+
+
+def require_outcomes(service: ImageService) -> OutcomeIndex:
+    if service.outcomes is None:
+        raise HTTPException(status_code=404, detail="The outcome index is disabled.")
+    return service.outcomes
+
+
+@app.get("/api/outcomes/", response_model=OutcomePage)
+async def list_outcomes(
+        since: Optional[float] = Query(None, description="Epoch seconds, inclusive"),
+        until: Optional[float] = Query(None, description="Epoch seconds, exclusive"),
+        status: Optional[str] = Query(None, description=f"One of {OUTCOME_STATUSES}"),
+        digest: Optional[str] = Query(None, description="SHA-256 hex of the uploaded bytes"),
+        kind: Optional[str] = Query(None, description=f"One of {OUTCOME_KINDS}"),
+        saved_filename: Optional[str] = Query(None),
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        service: ImageService = Depends(get_image_service)
+) -> OutcomePage:
+    """
+    Recorded outcomes, newest first, filtered by time range, status, content
+    hash, kind or crop name, a page at a time.
+    """
+    outcomes = require_outcomes(service)
+    try:
+        items, next_cursor = await asyncio.to_thread(
+            outcomes.query, since=since, until=until, status=status, digest=digest, kind=kind,
+            saved_filename=saved_filename, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return OutcomePage(items=[OutcomeRecord(**item) for item in items], next_cursor=next_cursor)
+
+
+@app.get("/api/outcomes/{outcome_id}", response_model=OutcomeRecord)
+async def get_outcome(outcome_id: int, service: ImageService = Depends(get_image_service)) -> OutcomeRecord:
+    item = await asyncio.to_thread(require_outcomes(service).get, outcome_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Outcome not found")
+    return OutcomeRecord(**item)
+
+
+@app.get("/api/ready")
+async def get_readiness() -> JSONResponse:
+    """
+    Readiness probe: 503 until startup (including the decoder warm-up) has
+    finished, then 200 with the import-to-ready timings.
+    """
+    ready = "ready" in startup_timings
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={'ready': ready, 'startup_ms': startup_timings, 'codecs': loaded_codecs()})
+
+
+@app.get("/api/runtime")
+async def get_runtime_layout() -> Dict:
+    """The core budget split chosen at startup, as this worker applied it."""
+    return {**thread_layout.as_dict(), 'pid': os.getpid(), 'opencv_threads_effective': cv2.getNumThreads()}
+
+
+@app.get("/api/admission")
+async def get_admission_stats() -> Dict:
+    """Current occupancy, queue length and shed counts per admission class."""
+    return {name: limiter.stats() for name, limiter in admission_limiters.items()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(service: ImageService = Depends(get_image_service)) -> PlainTextResponse:
+    """Prometheus scrape endpoint."""
+    metrics.POOL_BUSY.set(service.worker_pool.busy)
+    metrics.QUEUE_DEPTH.set(service.worker_pool.queue_depth)
+    for name, limiter in admission_limiters.items():
+        metrics.ADMISSION_IN_FLIGHT.set(limiter.in_flight, endpoint=name)
+        metrics.ADMISSION_QUEUED.set(limiter.queued, endpoint=name)
+    if job_runner.queue.exists():
+        for status, count in (await asyncio.to_thread(job_runner.queue.counts)).items():
+            metrics.JOBS.set(count, status=status)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 # --- Static File Serving and Root Route ---
 
 @app.get("/", response_class=HTMLResponse)
@@ -1,5 +1,16 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
+
+# One receipt of a multi-receipt photo (CoordinatesResponse.regions, multiple=true)
+class RegionResponse(BaseModel):
+    x: int
+    y: int
+    w: int
+    h: int
+    saved_filename: str
+    output_bytes: Optional[int] = None
+    # Set with return_image=url
+    image_url: Optional[str] = None
 
 # 1. Response model for initial coordinate finding (API Response: /submit_image/)
 # Note: Uses 'w' and 'h' as these match the OpenCV output names directly.
@@ -15,6 +26,77 @@ class CoordinatesResponse(BaseModel):
     w: int
     h: int
     status: str
+    # Which detection mode ran and the resize factor it used (1.0 = full resolution)
+    detection_mode: Optional[str] = None
+    detection_scale: Optional[float] = None
+    # Detector engine that produced the box (e.g. "contour", "projection")
+    detector: Optional[str] = None
+    # Server-side name of the upload; send it back as CropSubmission.originalFileName
+    source_filename: Optional[str] = None
+    # Size of the encoded crop as written (see RECEIPTS_OUTPUT_* settings)
+    output_bytes: Optional[int] = None
+    # Where the encoded crop can be fetched (process_image with return_image=url)
+    image_url: Optional[str] = None
+    # With multiple=true: every receipt found, largest first (x/y/w/h above are the first)
+    regions: Optional[List[RegionResponse]] = None
+
+# 1b. One line of the NDJSON stream returned by /api/process_batch/
+class BatchItemResponse(CoordinatesResponse):
+    """
+    CoordinatesResponse plus the position of the file in the submitted batch,
+    since results are streamed in completion order rather than upload order.
+    """
+    index: int
+
+# 1c. Status of an asynchronous job (API Response: /jobs/)
+class JobResponse(BaseModel):
+    """
+    Schema for a job submitted to /api/jobs/. `status` is queued, running,
+    done or failed; `result` is set once the job has run.
+    """
+    job_id: str
+    status: str
+    priority: str
+    filename: str
+    status_url: str
+    # Queued jobs that will run first (queued jobs only)
+    position: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[CoordinatesResponse] = None
+    error: Optional[str] = None
+
+# 1d. One recorded outcome (API Response: /outcomes/)
+class OutcomeRecord(BaseModel):
+    """
+    Schema for a row of the outcome index. `kind` is process, job, crop or
+    submission; `outcome` is success, error or rejected. The files named
+    may have been collected from the upload store since.
+    """
+    id: int
+    created_at: float
+    kind: str
+    outcome: str
+    status: str
+    filename: Optional[str] = None
+    saved_filename: Optional[str] = None
+    source_filename: Optional[str] = None
+    original_filename: Optional[str] = None
+    digest: Optional[str] = None
+    x: Optional[int] = None
+    y: Optional[int] = None
+    w: Optional[int] = None
+    h: Optional[int] = None
+    detector: Optional[str] = None
+    detection_mode: Optional[str] = None
+    output_bytes: Optional[int] = None
+    timings: Dict[str, float] = {}
+
+# 1e. A page of outcomes; pass next_cursor back as `cursor` for the next one
+class OutcomePage(BaseModel):
+    items: List[OutcomeRecord]
+    next_cursor: Optional[str] = None
 
 # 2. Input model for final cropped data submission (API Request: /submit_cropped_data/)
 # Note: Uses 'width' and 'height' as this matches the Cropper.js output property names.
@@ -31,4 +113,18 @@ class CropSubmission(BaseModel):
     scaleX: float
     scaleY: float
     originalFileName: str
-    targetEndpoint: str
\ No newline at end of file
+    targetEndpoint: str
+
+# 3. Response model for a crop produced on the server (API Response: /crop_image/)
+class CropResultResponse(BaseModel):
+    """
+    Schema for the response after applying a CropSubmission to the stored
+    original. x/y/w/h are the final box in the rotated/flipped frame.
+    """
+    filename: str
+    saved_filename: str
+    x: int
+    y: int
+    w: int
+    h: int
+    status: str
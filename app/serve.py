@@ -0,0 +1,48 @@
+# app/serve.py
+"""
+Production entry point: `python -m app.serve`.
+
+Plans the core budget once (see app/services/thread_budget.py), exports
+the chosen worker count so every uvicorn worker derives the same pool and
+OpenCV sizes, and starts uvicorn with that many workers. `python -m
+app.serve --dry-run` only prints the layout.
+"""
+
+import argparse
+import logging
+import os
+from typing import List, Optional
+
+import uvicorn
+
+from app import config
+from app.services.thread_budget import plan_threads
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Start the API with web workers, pool and OpenCV threads "
+                                                 "sized from one core budget.")
+    parser.add_argument("--dry-run", action="store_true", help="print the layout and exit")
+    args = parser.parse_args(argv)
+
+    layout = plan_threads(
+        cores=config.CPU_BUDGET,
+        web_workers=config.WEB_WORKERS,
+        pool_kind=config.PROCESSING_POOL_KIND,
+        pool_size=config.PROCESSING_POOL_SIZE,
+        opencv_threads=config.OPENCV_THREADS,
+    )
+    print(layout.report())
+    if args.dry_run:
+        return
+
+    # Inherited by the workers, which re-plan from the same numbers
+    os.environ["RECEIPTS_CPU_BUDGET"] = str(layout.cores)
+    os.environ["RECEIPTS_WEB_WORKERS"] = str(layout.web_workers)
+    uvicorn.run("app.main:app", host=config.HOST, port=config.PORT, workers=layout.web_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# app/services/admission.py
+"""
+Admission control in front of the processing pipeline.
+
+An AdmissionLimiter lets at most `max_in_flight` requests run and parks at
+most `max_queue` more in a FIFO wait queue. Anything beyond that is shed
+straight away (429), and a request that waits longer than `queue_timeout`
+seconds is shed too (503), both with a Retry-After hint derived from recent
+service times. Shedding early keeps latency and memory bounded for the
+requests that are admitted.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+# Weight of the newest sample in the moving average of service time
+EWMA_WEIGHT = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed. `status_code` is 429 (queue full) or 503 (waited too long)."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}); retry in {retry_after}s")
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """
+    Bounded in-flight + bounded FIFO queue. Plain futures rather than an
+    asyncio.Semaphore, so one limiter works across event loops (tests).
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int = 0, queue_timeout: float = 0.0,
+                 default_service_seconds: float = 1.0):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        # 0 waits as long as it takes
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._service_seconds = default_service_seconds
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {'queue_full': 0, 'queue_timeout': 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: the queue ahead drained at the current rate."""
+        return max(1, math.ceil(self._service_seconds * (self.queued + 1) / self.max_in_flight))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._service_seconds += EWMA_WEIGHT * (time.perf_counter() - started - self._service_seconds)
+            self.release()
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            raise AdmissionRejected(429, "queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.rejected['queue_timeout'] += 1
+            raise AdmissionRejected(503, "queue timeout", self.retry_after()) from None
+        except asyncio.CancelledError:
+            self._discard(waiter)
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the client went away
+                self.release()
+            raise
+        self.admitted += 1
+
+    def release(self) -> None:
+        # Hand the slot straight to the next waiter; in_flight stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'retry_after': self.retry_after(),
+        }
@@ -0,0 +1,69 @@
+# app/services/decoders.py
+"""
+Registry of image decoders and the codec module each one needs.
+
+Codec modules are imported on first use (the first upload of that format,
+or the warm-up in the app's lifespan) rather than when the app is imported,
+so a worker that never sees a HEIC never pays for pillow_heif. OpenCV is
+the pipeline's array library for every stage and is always loaded; the
+"opencv" decoder just names it.
+"""
+
+import importlib
+import threading
+import time
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Dict, Optional
+
+
+@dataclass(frozen=True)
+class Decoder:
+    name: str
+    # Module imported on first use
+    module: str
+    # Extension of the warm-up sample (see pipeline.warm_up)
+    sample_ext: str
+
+
+DECODERS: Dict[str, Decoder] = {}
+
+_modules: Dict[str, ModuleType] = {}
+# Milliseconds each codec module took to import, in load order
+_import_ms: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def register_decoder(decoder: Decoder) -> Decoder:
+    DECODERS[decoder.name] = decoder
+    return decoder
+
+
+def get_decoder(name: str) -> Decoder:
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown decoder '{name}'. Expected one of {tuple(DECODERS)}.") from None
+
+
+def codec_module(name: str) -> ModuleType:
+    """The codec module of decoder `name`, imported on the first call."""
+    module_name = get_decoder(name).module
+    module = _modules.get(module_name)
+    if module is not None:
+        return module
+    with _lock:
+        if module_name not in _modules:
+            started = time.perf_counter()
+            _modules[module_name] = importlib.import_module(module_name)
+            _import_ms[module_name] = round((time.perf_counter() - started) * 1000, 3)
+        return _modules[module_name]
+
+
+def loaded_codecs() -> Dict[str, Optional[float]]:
+    """Codec module -> import milliseconds, or None while it has not been loaded."""
+    return {decoder.module: _import_ms.get(decoder.module) for decoder in DECODERS.values()}
+
+
+register_decoder(Decoder("opencv", "cv2", ".jpg"))
+register_decoder(Decoder("heic", "pillow_heif", ".heic"))
@@ -0,0 +1,165 @@
+# app/services/encoder.py
+"""
+Output encoding of crops.
+
+Crops are encoded in memory with cv2.imencode so the bytes can be written to
+disk or streamed. EncodeOptions picks the format and codec flags and an
+optional budget:
+
+- max_side:  the longest output side; larger crops are downscaled first.
+- max_bytes: for JPEG/WebP the highest quality that fits is searched for
+             (down to MIN_QUALITY); if even that is too large, or the format
+             is lossless, the crop is shrunk step by step until it fits.
+"""
+
+import cv2
+import logging
+import os
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.services.timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+# "source" keeps the upload's own format (HEIC, which OpenCV cannot write, becomes JPEG)
+OUTPUT_FORMATS = ("source", "jpeg", "webp", "png")
+FORMAT_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+LOSSY_EXTENSIONS = (".jpg", ".jpeg", ".webp")
+# Extensions of each sniffed format (see probe.py); the first one names files
+# whose extension is missing or names another format
+SOURCE_EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg", ".jpe"),
+    "png": (".png",),
+    "webp": (".webp",),
+    "bmp": (".bmp",),
+    "tiff": (".tif", ".tiff"),
+    "heic": (".heic", ".heif"),
+}
+
+# Lowest quality the max_bytes search may go to before shrinking the image
+MIN_QUALITY = 40
+# Per-step size factor once quality alone cannot meet max_bytes
+SHRINK_FACTOR = 0.75
+MIN_SIDE = 16
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """How crops are encoded. Frozen so it is hashable/picklable (and part of the result cache key)."""
+    format: str = "source"
+    # JPEG/WebP quality 1-100; 0 keeps the codec default.
+    quality: int = 0
+    grayscale: bool = False
+    # JPEG only: progressive scan and optimized Huffman tables.
+    progressive: bool = False
+    optimize: bool = False
+    # PNG zlib level 0-9; -1 keeps the codec default.
+    png_compression: int = -1
+    # Budgets; 0 disables each.
+    max_side: int = 0
+    max_bytes: int = 0
+
+    def __post_init__(self):
+        if self.format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{self.format}'. Expected one of {OUTPUT_FORMATS}.")
+        if not 0 <= self.quality <= 100:
+            raise ValueError("Output quality must be between 1 and 100 (0 = codec default).")
+
+
+def source_extension(filename: str, source_format: Optional[str] = None) -> str:
+    """The extension of `filename`, or that of `source_format` when it is missing or does not match."""
+    ext = os.path.splitext(filename)[1]
+    extensions = SOURCE_EXTENSIONS.get(source_format)
+    if extensions and ext.lower() not in extensions:
+        return extensions[0]
+    return ext
+
+
+def output_extension(filename: str, options: EncodeOptions = EncodeOptions(),
+                     source_format: Optional[str] = None) -> str:
+    if options.format != "source":
+        return FORMAT_EXTENSIONS[options.format]
+    ext = source_extension(filename, source_format)
+    return ".jpg" if ext.lower() in (".heic", ".heif") else ext
+
+
+def imencode_params(ext: str, options: EncodeOptions, quality: int = 0) -> List[int]:
+    quality = quality or options.quality
+    ext = ext.lower()
+    params: List[int] = []
+    if ext in (".jpg", ".jpeg"):
+        if quality:
+            params += [cv2.IMWRITE_JPEG_QUALITY, quality]
+        if options.progressive:
+            params += [cv2.IMWRITE_JPEG_PROGRESSIVE, 1]
+        if options.optimize:
+            params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+    elif ext == ".webp":
+        if quality:
+            params += [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif ext == ".png" and options.png_compression >= 0:
+        params += [cv2.IMWRITE_PNG_COMPRESSION, options.png_compression]
+    return params
+
+
+def _shrink(img: np.ndarray, factor: float) -> np.ndarray:
+    img_h, img_w = img.shape[:2]
+    return cv2.resize(img, (max(1, round(img_w * factor)), max(1, round(img_h * factor))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def _encode(img: np.ndarray, ext: str, params: List[int]) -> Optional[np.ndarray]:
+    try:
+        success, encoded = cv2.imencode(ext, img, params)
+    except cv2.error as e:
+        # e.g. no encoder for the extension
+        logger.error(f"Could not encode {ext or 'extensionless'} output: {e}")
+        return None
+    return encoded if success else None
+
+
+def encode_image(img: np.ndarray, ext: str, options: EncodeOptions = EncodeOptions(),
+                 timer: Optional[StageTimer] = None) -> Optional[np.ndarray]:
+    """Encodes `img` as `ext` within the options' budget. None if the codec fails."""
+    timer = timer or StageTimer()
+    if options.max_side and max(img.shape[:2]) > options.max_side:
+        with timer.stage("resize_output"):
+            img = _shrink(img, options.max_side / max(img.shape[:2]))
+    if options.grayscale and img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    with timer.stage("encode"):
+        encoded = _encode(img, ext, imencode_params(ext, options))
+        if encoded is None or not options.max_bytes or encoded.size <= options.max_bytes:
+            return encoded
+        return _fit_budget(img, ext, options, encoded)
+
+
+def _fit_budget(img: np.ndarray, ext: str, options: EncodeOptions, encoded: np.ndarray) -> np.ndarray:
+    quality = 0
+    if ext.lower() in LOSSY_EXTENSIONS:
+        # Highest quality under max_bytes; size grows monotonically with quality
+        low, high = MIN_QUALITY, (options.quality or 95) - 1
+        best = None
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = _encode(img, ext, imencode_params(ext, options, mid))
+            if candidate is not None and candidate.size <= options.max_bytes:
+                best, low = candidate, mid + 1
+            else:
+                high = mid - 1
+        if best is not None:
+            return best
+        quality = MIN_QUALITY
+
+    while encoded.size > options.max_bytes and min(img.shape[:2]) > MIN_SIDE:
+        img = _shrink(img, SHRINK_FACTOR)
+        candidate = _encode(img, ext, imencode_params(ext, options, quality))
+        if candidate is None:
+            break
+        encoded = candidate
+    if encoded.size > options.max_bytes:
+        logger.warning(f"Could not encode within {options.max_bytes} bytes; wrote {encoded.size}")
+    return encoded
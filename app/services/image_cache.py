@@ -0,0 +1,67 @@
+# app/services/image_cache.py
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class DecodedImageCache:
+    """
+    LRU cache of decoded originals (BGR frames) keyed by saved filename,
+    bounded by the total bytes of the cached arrays rather than by count:
+    one 12 MP frame is ~36 MB, a thumbnail-sized PNG a few hundred KB.
+
+    Frames are stored read-only so a caller cannot corrupt the cached copy.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            img = self._entries.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key: str, img: np.ndarray) -> None:
+        if img.nbytes > self.max_bytes:
+            return  # Would evict everything and still not fit
+        img.setflags(write=False)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._entries[key] = img
+            self.current_bytes += img.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            img = self._entries.pop(key, None)
+            if img is not None:
+                self.current_bytes -= img.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -4,10 +4,12 @@ import os
 from fastapi import UploadFile
 from typing import Tuple, Dict, Any
 
+from app.services.detectors import get_detector, PAPER_LOWER_BOUND, PAPER_UPPER_BOUND
+
 # --- Configuration ---
 STORAGE_DIR = "uploads"
-RGB_LOWER_BOUND = np.array([190, 190, 190])
-RGB_UPPER_BOUND = np.array([255, 255, 255])
+RGB_LOWER_BOUND = PAPER_LOWER_BOUND
+RGB_UPPER_BOUND = PAPER_UPPER_BOUND
 CROP_SUFFIX = "_processed"
 
 
@@ -39,26 +41,13 @@ def find_paper_and_crop(
     if img is None:
         return {"status": "Error: Could not decode image.", "x": 0, "y": 0, "w": 0, "h": 0}, False
 
-    # --- 2. Image Processing Logic (Same as your initial request) ---
-
-    # Apply Color Thresholding (Masking)
-    mask = cv2.inRange(img, RGB_LOWER_BOUND, RGB_UPPER_BOUND)
-
-    # Noise reduction and gap closing
-    kernel = np.ones((5, 5), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    # --- 2. Image Processing Logic (shared contour detector) ---
+    bounding_box = get_detector("contour").detect(img)
 
-    # Find Contours
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    if not contours:
+    if not bounding_box:
         return {"status": "Warning: No paper contours found.", "x": 0, "y": 0, "w": 0, "h": 0}, False
 
-    # Select the largest contour
-    largest_contour = max(contours, key=cv2.contourArea)
-
-    # Calculate the Bounding Box
-    x, y, w, h = cv2.boundingRect(largest_contour)
+    x, y, w, h = bounding_box
 
     # 3. Crop and Save Logic
 
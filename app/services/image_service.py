@@ -1,27 +1,129 @@
 # app/services/image_service.py
 
-import cv2
+import asyncio
+import hashlib
 import numpy as np
 import os
 import uuid
+import zipfile
 import logging
-import pillow_heif  # <--- NEW: Required for HEIC support
-from typing import Tuple, Optional, Dict, Any
+from dataclasses import replace
+from typing import Tuple, Optional, Dict, Any, Set, List, AsyncIterator, BinaryIO
 from fastapi import UploadFile
 
+from app.services import pipeline
+from app.services.worker_pool import WorkerPool
+from app.services.result_cache import ResultCache, make_key
+from app.services.image_cache import DecodedImageCache
+from app.services.encoder import EncodeOptions, source_extension
+from app.services.probe import MAX_HEADER_BYTES, PROBE_BYTES, ImageProbe, ImageRejectedError, probe_image, \
+    check_pixels
+from app.services.storage import UploadStore, temporary_path
+from app.services.outcome_index import OutcomeIndex
+from app.services.timing import StageTimer
+
 logger = logging.getLogger(__name__)
 
 DEFAULT_UPLOAD_DIR = "uploads"
 
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Most of a declared Content-Length preallocated without an upload cap; the rest grows as it arrives
+MAX_PREALLOCATE_BYTES = 64 * 1024 * 1024
+
+PIPELINE_MODES = ("disk", "memory")
+PERSIST_ORIGINALS_MODES = ("off", "sync", "background")
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the service's max_upload_bytes."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the maximum size of {limit} bytes")
+        self.limit = limit
+
+
+class OriginalNotFoundError(LookupError):
+    """Raised when a crop refers to an original that is neither cached nor on disk."""
+
+    def __init__(self, source_filename: str):
+        super().__init__(f"Original image '{source_filename}' is no longer available")
+        self.source_filename = source_filename
+
+
+# Run through asyncio.to_thread: hashing a 50 MB upload takes ~100 ms, and
+# hashlib releases the GIL while it does
+def _sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _hash_and_write(f: BinaryIO, sha256: Any, chunk: bytes) -> None:
+    sha256.update(chunk)
+    f.write(chunk)
+
 
 class ImageService:
     """
     Service class responsible for handling image uploads,
     processing (OpenCV), and file management.
+
+    The OpenCV/HEIC stages run on `worker_pool` so the event loop stays free
+    to serve other requests while an image is being decoded and cropped.
+
+    In "memory" pipeline mode the upload is decoded from its buffer instead of
+    being written to disk and read back; the original is then persisted
+    according to `persist_originals`.
+
+    Uploads are streamed in `chunk_size` pieces and rejected with
+    UploadTooLargeError as soon as they exceed `max_upload_bytes`. Before
+    that, the first PROBE_BYTES are sniffed: unrecognised content and images
+    over `max_image_pixels` raise ImageRejectedError without being decoded,
+    and the sniffed format (not the extension) picks the decoder.
+
+    With a `result_cache`, re-uploads of identical bytes return the stored
+    coordinates and the already written crop without running the pipeline.
+
+    Every result names its `source_filename`; crop_from_submission() applies a
+    user-adjusted box to that original, taken from `decoded_cache` when it is
+    still there (thread pool only: frames are never pickled to a process).
+
+    Files are laid out, written and indexed by `store` (see storage.py); the
+    default is the flat, unindexed `upload_dir`. With `outcomes`, every
+    result (and rejection) is recorded there (see outcome_index.py).
     """
 
-    def __init__(self, upload_dir: str = DEFAULT_UPLOAD_DIR):
-        self.upload_dir = upload_dir
+    def __init__(self, upload_dir: str = DEFAULT_UPLOAD_DIR, worker_pool: Optional[WorkerPool] = None,
+                 detection: Optional[pipeline.DetectionOptions] = None,
+                 pipeline_mode: str = "disk", persist_originals: str = "background",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, max_upload_bytes: int = 0,
+                 result_cache: Optional[ResultCache] = None,
+                 decoded_cache: Optional[DecodedImageCache] = None,
+                 encoding: Optional[EncodeOptions] = None, max_image_pixels: int = 0,
+                 store: Optional[UploadStore] = None, outcomes: Optional[OutcomeIndex] = None):
+        if pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{pipeline_mode}'. Expected one of {PIPELINE_MODES}.")
+        if persist_originals not in PERSIST_ORIGINALS_MODES:
+            raise ValueError(f"Unknown persist_originals '{persist_originals}'. "
+                             f"Expected one of {PERSIST_ORIGINALS_MODES}.")
+        self.store = store or UploadStore(upload_dir, shard_depth=0, indexed=False)
+        self.upload_dir = self.store.root
+        self.worker_pool = worker_pool or WorkerPool()
+        self.detection = detection or pipeline.DetectionOptions()
+        # Output format/quality/budget of every crop written
+        self.encoding = encoding or EncodeOptions()
+        self.pipeline_mode = pipeline_mode
+        self.persist_originals = persist_originals
+        self.chunk_size = chunk_size
+        # 0 disables the limit
+        self.max_upload_bytes = max_upload_bytes
+        # Width x height cap read from the header; 0 disables it
+        self.max_image_pixels = max_image_pixels
+        # Results of earlier uploads keyed by content hash + detector parameters
+        self.result_cache = result_cache
+        # Decoded originals keyed by source filename, for crop_from_submission()
+        self.decoded_cache = decoded_cache if self.worker_pool.kind == "thread" else None
+        self.outcomes = outcomes
+        # Strong references to in-flight background writes (asyncio only keeps weak ones)
+        self._background_writes: Set[asyncio.Task] = set()
         self._initialize_upload_dir()
 
     def _initialize_upload_dir(self) -> None:
@@ -32,131 +134,509 @@ class ImageService:
     # Public API Methods
     # ==========================================
 
-    async def image_cropping(self, file: UploadFile) -> Dict[str, Any]:
+    async def image_cropping(self, file: UploadFile, detection_mode: Optional[str] = None,
+                             detector: Optional[str] = None, multiple: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Saves the upload, then finds and writes the paper crop (with
+        `multiple`, one crop per receipt in the photo, listed in `regions`).
+        `detection_mode`, `detector` and `multiple` override the service
+        defaults for this call.
+        """
         try:
-            # 1. Save Initial File
-            filename, file_path = await self._save_initial_upload(file)
-
-            # 2. Load Image (Now supports HEIC)
-            img = self._load_cv2_image(file_path)
-            if img is None:
-                return self._error_response("Could not load image (unsupported format?)", filename)
-
-            # 3. Calculate Crop Coordinates
-            coordinates = self._get_crop_coordinates(img)
-            if not coordinates:
-                logger.warning(f"No contours found for {filename}")
-                return self._error_response("No contours found", filename)
-
-            # 4. Crop and Save
-            x, y, w, h = coordinates
-
-            # --- NEW: Handle HEIC Output ---
-            # OpenCV cannot save/write .heic files. We must convert the output path to .jpg
-            if filename.lower().endswith(('.heic', '.heif')):
-                base_name = os.path.splitext(filename)[0]
-                filename = f"{base_name}.jpg"
-                file_path = os.path.join(self.upload_dir, filename)
-                logger.info(f"Converted HEIC output to JPG: {filename}")
-            # -------------------------------
-
-            success = self._crop_and_overwrite(img, file_path, x, y, w, h)
-
-            if not success:
-                return self._error_response("Failed to save cropped image", filename)
-
-            return {
-                'x': x, 'y': y, 'w': w, 'h': h,
-                'status': 'Processed and Coordinates Found',
-                'saved_filename': filename
-            }
+            detection = self._detection_for(detection_mode, detector, multiple)
+
+            timer = StageTimer()
+            if self.pipeline_mode == "memory":
+                result = await self._image_cropping_in_memory(file, detection, timer)
+            else:
+                result = await self._image_cropping_on_disk(file, detection, timer)
+
+            # Upload timing first, then the pipeline stages from the worker
+            result['timings'] = {**timer.rounded(), **result.get('timings', {})}
 
+        except (UploadTooLargeError, ImageRejectedError) as e:
+            self._index_rejection("process", file.filename, e)
+            raise
         except Exception as e:
             logger.error(f"Service: Critical error: {e}", exc_info=True)
-            return self._error_response(str(e))
+            result = self._error_response(str(e))
+        self._index_outcome("process", file.filename, result)
+        return result
+
+    async def image_cropping_batch(self, files: List[UploadFile], detection_mode: Optional[str] = None,
+                                   detector: Optional[str] = None, concurrency: int = 0) -> AsyncIterator[Tuple[int, UploadFile, Dict[str, Any]]]:
+        """
+        Crops many uploads concurrently and yields (index, file, result) in
+        completion order, so callers can stream each result as soon as it is
+        ready. At most `concurrency` files (default: worker pool size) are in
+        flight at once; a failing item yields an error result instead of
+        aborting the batch.
+        """
+        limit = asyncio.Semaphore(concurrency or self.worker_pool.size)
+
+        async def crop_one(index: int, file: UploadFile) -> Tuple[int, UploadFile, Dict[str, Any]]:
+            async with limit:
+                try:
+                    return index, file, await self.image_cropping(file, detection_mode, detector)
+                except Exception as e:
+                    return index, file, self._error_response(str(e))
+
+        tasks = [asyncio.create_task(crop_one(index, file)) for index, file in enumerate(files)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away mid-stream: don't keep cropping for nobody
+            for task in tasks:
+                task.cancel()
+
+    async def image_cropping_stream(self, chunks: AsyncIterator[bytes], filename: str,
+                                    content_length: Optional[int] = None, detection_mode: Optional[str] = None,
+                                    detector: Optional[str] = None, multiple: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Crops a raw request body (no multipart parsing, no spooled temp file):
+        the chunks are copied once, into a buffer preallocated from
+        `content_length`, and decoded straight from it. Always the in-memory
+        path, whatever `pipeline_mode`.
+        """
+        try:
+            detection = self._detection_for(detection_mode, detector, multiple)
+            timer = StageTimer()
+            with timer.stage("upload_read"):
+                content, probe = await self._read_stream(chunks, content_length)
+            result = await self._crop_buffer(content, self._unique_filename(filename, probe.format), probe.decoder,
+                                             detection)
+            result['timings'] = {**timer.rounded(), **result.get('timings', {})}
+
+        except (UploadTooLargeError, ImageRejectedError) as e:
+            self._index_rejection("process", filename, e)
+            raise
+        except Exception as e:
+            logger.error(f"Service: Critical error: {e}", exc_info=True)
+            result = self._error_response(str(e))
+        self._index_outcome("process", filename, result)
+        return result
+
+    @staticmethod
+    def open_zip_upload(file: UploadFile) -> List[UploadFile]:
+        """
+        Exposes each member of an uploaded zip archive as its own UploadFile.
+        Members are decompressed lazily as they are read, and carry their
+        declared size so the upload cap applies before anything is inflated.
+        """
+        archive = zipfile.ZipFile(file.file)
+        members = []
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            members.append(UploadFile(file=archive.open(info), filename=name, size=info.file_size))
+        return members
 
     async def save_cropped_file(self, cropped_file: UploadFile) -> str:
         try:
             unique_prefix = uuid.uuid4().hex[:8]
             clean_name = os.path.basename(cropped_file.filename)
             saved_filename = f"{unique_prefix}_{clean_name}"
-            saved_file_path = os.path.join(self.upload_dir, saved_filename)
 
-            await self._write_bytes_to_disk(cropped_file, saved_file_path)
+            digest = await self._write_bytes_to_disk(cropped_file, saved_filename)
+            self._index_outcome("submission", clean_name, {
+                'status': "Successfully uploaded the file", 'saved_filename': saved_filename, 'digest': digest})
             return "Successfully uploaded the file"
 
+        except UploadTooLargeError as e:
+            self._index_rejection("submission", cropped_file.filename, e)
+            raise
         except Exception as e:
             logger.error(f"Service: Error saving final file: {e}", exc_info=True)
-            return f"Failed to upload file: {str(e)}"
+            message = f"Failed to upload file: {str(e)}"
+            self._index_outcome("submission", cropped_file.filename, {'status': message}, outcome="error")
+            return message
+
+    async def store_upload(self, file: UploadFile) -> Dict[str, str]:
+        """
+        Probes and saves an upload without cropping it (async job mode).
+        Returns what crop_stored_upload() needs later, possibly after a restart.
+        """
+        head, probe = await self._probe_upload(file)
+        filename, _, digest = await self._save_initial_upload(file, head, probe.format)
+        return {'saved_filename': filename, 'digest': digest, 'decoder': probe.decoder}
+
+    async def crop_stored_upload(self, saved_filename: str, digest: str, decoder: str,
+                                 detection_mode: Optional[str] = None, detector: Optional[str] = None,
+                                 filename: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Crops an upload saved by store_upload(): the second half of
+        image_cropping() in disk mode. `filename` is the client's name for it.
+        """
+        try:
+            detection = self._detection_for(detection_mode, detector)
+            file_path = self.store.find(self._original_filename(saved_filename))
+            if file_path is None:
+                raise OriginalNotFoundError(saved_filename)
+            result = await self._crop_saved_upload(saved_filename, file_path, digest, decoder, detection)
+        except Exception as e:
+            logger.error(f"Service: Critical error: {e}", exc_info=True)
+            result = self._error_response(str(e))
+        self._index_outcome("job", filename, result)
+        return result
+
+    async def crop_from_submission(self, source_filename: str, x: float, y: float, width: float, height: float,
+                                   rotate: float = 0.0, scale_x: float = 1.0, scale_y: float = 1.0) -> Dict[str, Any]:
+        """
+        Produces the final crop of an earlier upload from the box the user
+        adjusted in Cropper.js, so the client does not upload the image again.
+        Raises OriginalNotFoundError when the original is gone and ValueError
+        for a malformed request.
+        """
+        if os.path.basename(source_filename) != source_filename or source_filename in ("", ".", ".."):
+            raise ValueError("Invalid source filename")
+        if not (width > 0 and height > 0):
+            raise ValueError("Crop width and height must be positive")
+
+        img = self.decoded_cache.get(source_filename) if self.decoded_cache is not None else None
+        source_path = self.store.find(self._original_filename(source_filename))
+        decoder = source_format = None
+        if img is None:
+            if source_path is None:
+                raise OriginalNotFoundError(source_filename)
+            probe = probe_image(await asyncio.to_thread(self._read_head, source_path))
+            decoder, source_format = probe.decoder, probe.format
+
+        output_name = pipeline.output_filename_for(source_filename, self.encoding, source_format)
+        output_filename = f"{uuid.uuid4().hex[:8]}_{output_name}"
+        result = await self.worker_pool.run(
+            pipeline.crop_to_box, img, source_path, self.store.path_for(output_filename),
+            (x, y, width, height), rotate, scale_x, scale_y,
+            return_image=self.decoded_cache is not None, encoding=self.encoding, decoder=decoder
+        )
+        self._remember_decoded(source_filename, result)
+        self._record_output(result)
+        result['source_filename'] = source_filename
+        self._index_outcome("crop", source_filename, result)
+        return result
+
+    def stored_image_path(self, filename: str) -> Optional[str]:
+        """Path of a file in the upload store, or None if there is no such file."""
+        if os.path.basename(filename) != filename or filename.startswith('.'):
+            raise ValueError("Invalid filename")
+        return self.store.find(filename)
+
+    async def drain_background_writes(self) -> None:
+        """Waits for deferred original writes (used on shutdown and in tests)."""
+        if self._background_writes:
+            await asyncio.gather(*self._background_writes, return_exceptions=True)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        if self.result_cache is None:
+            stats = {'enabled': False}
+        else:
+            stats = {'enabled': True, **self.result_cache.stats()}
+        if self.decoded_cache is not None:
+            stats['decoded'] = self.decoded_cache.stats()
+        return stats
+
+    def shutdown(self) -> None:
+        self.worker_pool.shutdown()
 
     # ==========================================
     # Internal Helper Methods
     # ==========================================
 
-    async def _save_initial_upload(self, file: UploadFile) -> Tuple[str, str]:
-        base_name, ext = os.path.splitext(os.path.basename(file.filename))
+    def _detection_for(self, detection_mode: Optional[str], detector: Optional[str],
+                       multiple: Optional[bool] = None) -> pipeline.DetectionOptions:
+        overrides = {}
+        if detection_mode and detection_mode != self.detection.mode:
+            overrides['mode'] = detection_mode
+        if multiple is not None and multiple != self.detection.multiple:
+            overrides['multiple'] = multiple
+        if detector and detector != self.detection.engine:
+            overrides['engine'] = detector
+        return replace(self.detection, **overrides) if overrides else self.detection
+
+    async def _image_cropping_on_disk(self, file: UploadFile, detection: pipeline.DetectionOptions,
+                                      timer: StageTimer) -> Dict[str, Any]:
+        # 0. Sniff the header; reject before writing anything
+        with timer.stage("probe"):
+            head, probe = await self._probe_upload(file)
+
+        # 1. Save Initial File (hashed while streaming)
+        with timer.stage("upload_read"):
+            filename, file_path, digest = await self._save_initial_upload(file, head, probe.format)
+
+        return await self._crop_saved_upload(filename, file_path, digest, probe.decoder, detection)
+
+    async def _crop_saved_upload(self, filename: str, file_path: str, digest: str, decoder: str,
+                                 detection: pipeline.DetectionOptions) -> Dict[str, Any]:
+        cached = await self._cached_result(digest, detection)
+        if cached is not None:
+            # Identical bytes were already cropped; the fresh copy is redundant
+            await asyncio.to_thread(self.store.remove, self._original_filename(filename))
+            return cached
+
+        # 2-4. Load, detect, crop and save on the worker pool
+        result = await self.worker_pool.run(
+            pipeline.crop_saved_image, file_path, filename, self.store.dir_for(filename), detection,
+            return_image=self.decoded_cache is not None, encoding=self.encoding, decoder=decoder
+        )
+        result['source_filename'] = filename
+        result['digest'] = digest
+        self._remember_decoded(filename, result)
+        self._record_output(result)
+        if self.persist_originals == "off":
+            await asyncio.to_thread(self.store.remove, self._original_filename(filename))
+        await self._store_result(digest, detection, result)
+        return result
+
+    async def _image_cropping_in_memory(self, file: UploadFile, detection: pipeline.DetectionOptions,
+                                        timer: StageTimer) -> Dict[str, Any]:
+        with timer.stage("probe"):
+            head, probe = await self._probe_upload(file)
+        filename = self._unique_filename(file.filename, probe.format)
+        with timer.stage("upload_read"):
+            content = await self._read_upload(file, head)
+        return await self._crop_buffer(content, filename, probe.decoder, detection)
+
+    async def _crop_buffer(self, content: bytearray, filename: str, decoder: str,
+                           detection: pipeline.DetectionOptions) -> Dict[str, Any]:
+        digest = await asyncio.to_thread(_sha256_hex, content)
+
+        cached = await self._cached_result(digest, detection)
+        if cached is not None:
+            return cached
+
+        result = await self.worker_pool.run(
+            pipeline.crop_image_bytes, content, filename, self.store.dir_for(filename), detection,
+            return_image=self.decoded_cache is not None, encoding=self.encoding, decoder=decoder
+        )
+        result['source_filename'] = filename
+        result['digest'] = digest
+        self._remember_decoded(filename, result)
+        self._record_output(result)
+        await self._store_result(digest, detection, result)
+        await self._persist_original(content, filename)
+        return result
+
+    async def _cached_result(self, digest: str, detection: pipeline.DetectionOptions) -> Optional[Dict[str, Any]]:
+        if self.result_cache is None:
+            return None
+        key = make_key(digest, (detection, self.encoding))
+        # The disk tier and the store lookups block; an entry whose crop was
+        # removed from uploads/ since is dropped (and recomputed) by get()
+        cached = await asyncio.to_thread(self.result_cache.get, key, self._crops_exist)
+        if cached is None:
+            return None
+        logger.info(f"Service: Result cache hit for {cached['saved_filename']}")
+        # Stage timings belong to the run that produced the entry, not this request
+        cached['timings'] = {}
+        cached['cache'] = "hit"
+        return cached
+
+    def _crops_exist(self, result: Dict[str, Any]) -> bool:
+        return all(self.store.find(region['saved_filename']) is not None
+                   for region in result.get('regions') or [result])
+
+    def _remember_decoded(self, source_filename: str, result: Dict[str, Any]) -> None:
+        # The frame never leaves the service: it is not JSON and is tens of MB
+        img = result.pop('image', None)
+        if img is not None and self.decoded_cache is not None:
+            self.decoded_cache.put(source_filename, img)
+
+    def _record_output(self, result: Dict[str, Any]) -> None:
+        # Crops are written by the worker pool; index them here
+        for region in result.get('regions') or [result]:
+            if region.get('output_bytes') and region.get('saved_filename'):
+                self.store.record(region['saved_filename'], region['output_bytes'])
+
+    def _index_outcome(self, kind: str, filename: Optional[str], result: Dict[str, Any],
+                       outcome: Optional[str] = None) -> None:
+        if self.outcomes is None:
+            return
+        source = result.get('source_filename')
+        original = self._original_filename(source) if source and self.persist_originals != "off" else None
+        self.outcomes.record(kind, filename, result, original, outcome)
+
+    def _index_rejection(self, kind: str, filename: Optional[str], error: Exception) -> None:
+        if self.outcomes is not None:
+            self.outcomes.record(kind, filename, {'status': f"Rejected: {error}"}, outcome="rejected")
+
+    async def _store_result(self, digest: str, detection: pipeline.DetectionOptions, result: Dict[str, Any]) -> None:
+        # Only successful crops are cached; errors may be transient
+        if self.result_cache is not None and not result['status'].startswith("Error"):
+            await asyncio.to_thread(self.result_cache.put, make_key(digest, (detection, self.encoding)), result)
+
+    async def _persist_original(self, content: bytes, filename: str) -> None:
+        if self.persist_originals == "off":
+            return
+        original_filename = self._original_filename(filename)
+        if self.persist_originals == "sync":
+            await asyncio.to_thread(self.store.write, original_filename, content)
+            return
+        task = asyncio.create_task(asyncio.to_thread(self.store.write, original_filename, content))
+        self._background_writes.add(task)
+        task.add_done_callback(self._on_background_write_done)
+
+    def _on_background_write_done(self, task: asyncio.Task) -> None:
+        self._background_writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Service: Background write of original failed: {task.exception()}")
+
+    def _unique_filename(self, original_filename: str, source_format: Optional[str] = None) -> str:
+        """
+        `original_filename` made unique. With the sniffed `source_format`, the
+        extension is that format's whenever the client's is missing or wrong
+        ("scan", "scan.pdf"), so the original and the crop are named (and
+        encoded) after what the bytes are.
+        """
+        base_name = os.path.splitext(os.path.basename(original_filename))[0]
+        ext = source_extension(original_filename, source_format)
         unique_id = uuid.uuid4().hex
-        saved_filename = f"{base_name}_{unique_id}{ext}"
-        saved_file_path = os.path.join(self.upload_dir, saved_filename)
+        return f"{base_name}_{unique_id}{ext}"
 
-        await self._write_bytes_to_disk(file, saved_file_path)
-        return saved_filename, saved_file_path
+    def _original_filename(self, saved_filename: str) -> str:
+        """
+        Name of the untouched original. The crop takes the saved filename
+        itself, so the original gets an `_original` suffix.
+        """
+        base_name, ext = os.path.splitext(saved_filename)
+        return f"{base_name}_original{ext}"
 
-    async def _write_bytes_to_disk(self, file: UploadFile, path: str) -> None:
-        content = await file.read()
-        with open(path, "wb") as f:
-            f.write(content)
+    async def _probe_upload(self, file: UploadFile) -> Tuple[bytes, ImageProbe]:
+        """
+        Reads only the header and validates it. Returns (bytes read, probe).
+        When the dimensions lie past PROBE_BYTES, reads on up to them (within
+        the upload cap); a TIFF whose IFD trails its strips is read whole.
+        """
+        self._check_declared_size(file)
+        head = await file.read(PROBE_BYTES)
+        probe = probe_image(head)
+        limit = self.max_upload_bytes or MAX_HEADER_BYTES
+        while probe.pixels is None and len(head) < probe.needs <= limit:
+            more = await file.read(probe.needs - len(head))
+            if not more:
+                break
+            head += more
+            probe = probe_image(head)
+        check_pixels(probe, self.max_image_pixels)
+        return head, probe
+
+    async def _save_initial_upload(self, file: UploadFile, head: bytes = b"",
+                                   source_format: Optional[str] = None) -> Tuple[str, str, str]:
+        saved_filename = self._unique_filename(file.filename, source_format)
+        # Written under the original's name; the crop then takes saved_filename
+        original_filename = self._original_filename(saved_filename)
+
+        digest = await self._write_bytes_to_disk(file, original_filename, head)
+        return saved_filename, self.store.path_for(original_filename), digest
+
+    def _check_declared_size(self, file: UploadFile) -> None:
+        """Rejects before reading anything when the size is already known."""
+        size = getattr(file, "size", None)
+        if self.max_upload_bytes and size is not None and size > self.max_upload_bytes:
+            raise UploadTooLargeError(self.max_upload_bytes)
+
+    async def _read_upload(self, file: UploadFile, head: bytes = b"") -> bytearray:
+        """
+        Reads the whole upload into memory, chunk by chunk, enforcing the size
+        cap. `head` is what was already read from the file (by the probe).
+        The buffer itself is returned: everything downstream takes bytes-like.
+        """
+        self._check_declared_size(file)
+        buffer = bytearray(head)
+        while True:
+            if self.max_upload_bytes and len(buffer) > self.max_upload_bytes:
+                raise UploadTooLargeError(self.max_upload_bytes)
+            chunk = await file.read(self.chunk_size)
+            if not chunk:
+                return buffer
+            buffer += chunk
+
+    async def _read_stream(self, chunks: AsyncIterator[bytes],
+                           content_length: Optional[int] = None) -> Tuple[bytearray, ImageProbe]:
+        """
+        Copies a raw body into one buffer, preallocated when the length is
+        declared (up to the size cap or MAX_PREALLOCATE_BYTES, so a
+        Content-Length alone cannot reserve memory; grown past that and
+        otherwise), enforcing the size cap and the declared length. The header is
+        probed as soon as PROBE_BYTES have arrived (or, when the dimensions
+        lie further in, as soon as they have), so a bad upload is rejected
+        before the rest of it is read.
+        """
+        if self.max_upload_bytes and content_length and content_length > self.max_upload_bytes:
+            raise UploadTooLargeError(self.max_upload_bytes)
+        buffer = bytearray(min(content_length or 0, self.max_upload_bytes or MAX_PREALLOCATE_BYTES))
+        size = 0
+        probe = None
+        probe_at = PROBE_BYTES
+        async for chunk in chunks:
+            end = size + len(chunk)
+            if self.max_upload_bytes and end > self.max_upload_bytes:
+                raise UploadTooLargeError(self.max_upload_bytes)
+            if content_length and end > content_length:
+                raise ValueError("Request body is longer than its Content-Length")
+            # Fills the preallocated part, then grows (chunked transfer: grows from the start)
+            buffer[size:end] = chunk
+            size = end
+            while probe is None and size >= probe_at:
+                probe = probe_image(bytes(buffer[:probe_at]))
+                if probe.pixels is None and probe.needs > probe_at:
+                    probe, probe_at = None, probe.needs
+                else:
+                    check_pixels(probe, self.max_image_pixels)
+        if content_length and size != content_length:
+            raise ValueError("Request body ended before its Content-Length")
+        if probe is None:
+            probe = self._check_head(bytes(buffer[:size]))
+        return buffer, probe
+
+    def _check_head(self, head: bytes) -> ImageProbe:
+        probe = probe_image(head)
+        check_pixels(probe, self.max_image_pixels)
+        return probe
+
+    async def _write_bytes_to_disk(self, file: UploadFile, filename: str, head: bytes = b"") -> str:
+        """
+        Streams the upload into the store as `filename` in fixed-size chunks so
+        memory stays flat regardless of file size. The chunks go to a temporary
+        file that is renamed into place once complete (and removed if the cap
+        is hit). `head` is what was already read from the file and is written
+        first. Returns the SHA-256 hex digest of the bytes written.
+        """
+        self._check_declared_size(file)
+        path = self.store.path_for(filename)
+        tmp_path = temporary_path(path)
+        sha256 = hashlib.sha256()
+        written = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                chunk = head or await file.read(self.chunk_size)
+                while chunk:
+                    written += len(chunk)
+                    if self.max_upload_bytes and written > self.max_upload_bytes:
+                        raise UploadTooLargeError(self.max_upload_bytes)
+                    await asyncio.to_thread(_hash_and_write, f, sha256, chunk)
+                    chunk = await file.read(self.chunk_size)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.store.record(filename, written)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _read_head(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read(PROBE_BYTES)
 
     def _load_cv2_image(self, path: str) -> Optional[np.ndarray]:
-        """
-        Loads an image from disk.
-        Detects HEIC/HEIF and uses pillow_heif to convert to OpenCV format.
-        """
-        # --- NEW: HEIC Detection & Loading ---
-        _, ext = os.path.splitext(path)
-        if ext.lower() in ['.heic', '.heif']:
-            try:
-                heif_file = pillow_heif.read_heif(path)
-                image = np.asarray(heif_file)
-
-                # Convert RGB (Pillow default) to BGR (OpenCV default)
-                if heif_file.mode == "RGB":
-                    image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-                elif heif_file.mode == "RGBA":
-                    image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
-                return image
-            except Exception as e:
-                logger.error(f"Failed to decode HEIC file: {e}")
-                return None
-        # -------------------------------------
-
-        # Standard OpenCV load
-        return cv2.imread(path)
+        return pipeline.load_cv2_image(path)
 
     def _get_crop_coordinates(self, img: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
-        lower_bound = np.array([190, 190, 190])
-        upper_bound = np.array([255, 255, 255])
-        mask = cv2.inRange(img, lower_bound, upper_bound)
-
-        kernel = np.ones((5, 5), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        if not contours:
-            return None
-
-        largest_contour = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        return int(x), int(y), int(w), int(h)
+        return pipeline.get_crop_coordinates(img)
 
     def _crop_and_overwrite(self, img: np.ndarray, path: str, x: int, y: int, w: int, h: int) -> bool:
-        cropped_img = img[y:y + h, x:x + w]
-        return cv2.imwrite(path, cropped_img)
+        return bool(pipeline.crop_and_overwrite(img, path, x, y, w, h, encoding=self.encoding))
 
     def _error_response(self, message: str, filename: str = "") -> Dict[str, Any]:
-        return {
-            'x': 0, 'y': 0, 'w': 0, 'h': 0,
-            'status': f"Error: {message}",
-            'saved_filename': filename
-        }
\ No newline at end of file
+        return pipeline.error_response(message, filename)
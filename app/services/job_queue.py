@@ -0,0 +1,313 @@
+# app/services/job_queue.py
+"""
+Asynchronous job mode.
+
+JobQueue is a priority queue of crop jobs in a local SQLite file (no
+broker): a job is the name of an upload already saved by
+ImageService.store_upload() plus its detection overrides, so queued jobs
+survive a restart. Within a priority, jobs run in submission order.
+
+JobRunner drains the queue with a fixed number of asyncio workers that run
+ImageService.crop_stored_upload(). A claimed job is leased to its queue
+(`owner`, `lease_until`) and the lease is renewed while the job runs, so
+processes sharing the database never take each other's jobs. Jobs whose
+lease ran out (their process crashed) go back to the queue; a job that
+keeps taking the process down is failed after MAX_ATTEMPTS.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from app.services.image_service import ImageService
+
+logger = logging.getLogger(__name__)
+
+# Lower rank runs first
+JOB_PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+MAX_ATTEMPTS = 3
+# Idle workers re-check the queue this often (jobs enqueued by another process)
+POLL_SECONDS = 5.0
+# A running job is taken over once its owner has not renewed it for this long
+LEASE_SECONDS = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, seq);
+"""
+# Added after the first release; ALTERed into older databases
+LEASE_COLUMNS = {"owner": "TEXT", "lease_until": "REAL"}
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue. Methods are blocking (a few ms at most); call
+    them through asyncio.to_thread from the event loop when in doubt.
+    Claiming runs in an IMMEDIATE transaction, so several app processes can
+    share one database file; each holds its jobs for `lease_seconds` at a
+    time (see renew()).
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = LEASE_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:8]
+
+    @property
+    def owner(self) -> str:
+        # The pid is read on every call: a queue created before a fork is one owner per worker
+        return f"{os.getpid()}-{self._token}"
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened lazily so that importing the app never creates the database
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in LEASE_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            self._conn = conn
+        return self._conn
+
+    def exists(self) -> bool:
+        return self._conn is not None or os.path.exists(self.db_path)
+
+    def enqueue(self, filename: str, payload: Dict[str, Any], priority: str = "normal") -> str:
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'. Expected one of {tuple(JOB_PRIORITIES)}.")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, priority, filename, payload, created_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, JOB_PRIORITIES[priority], filename, json.dumps(payload), time.time()))
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Marks the next job running under this queue's lease and returns it,
+        or None if the queue is empty. Expired leases are recovered first.
+        """
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                lease = {'owner': self.owner, 'lease_until': now + self.lease_seconds}
+                self._expire_leases(now)
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY priority, seq LIMIT 1").fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                                 "owner = ?, lease_until = ? WHERE seq = ?",
+                                 (now, lease['owner'], lease['lease_until'], row['seq']))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self._decode(row, status="running", **lease) if row is not None else None
+
+    def renew(self, job_id: str) -> bool:
+        """Extends the lease on a job this queue is running; False if it was lost (taken over)."""
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                (time.time() + self.lease_seconds, job_id, self.owner)).rowcount == 1
+
+    # finish/fail/requeue only touch a job this queue still holds: once its
+    # lease ran out, the job belongs to whichever queue claimed it next.
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        status = "failed" if result.get('status', '').startswith("Error") else "done"
+        with self._lock:
+            self.conn.execute("UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_until = NULL "
+                              "WHERE id = ? AND status = 'running' AND owner = ?",
+                              (status, json.dumps(result), time.time(), job_id, self.owner))
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self.conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL "
+                              "WHERE id = ? AND status = 'running' AND owner = ?",
+                              (error, time.time(), job_id, self.owner))
+
+    def requeue(self, job_id: str) -> None:
+        """Puts a job stopped on shutdown back at its place in the queue, without using up an attempt."""
+        with self._lock:
+            self.conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL, attempts = attempts - 1, "
+                              "owner = NULL, lease_until = NULL WHERE id = ? AND status = 'running' AND owner = ?",
+                              (job_id, self.owner))
+
+    def recover(self) -> int:
+        """
+        Requeues running jobs whose lease ran out, i.e. whose process died
+        (and fails those that already used up their attempts). Jobs other
+        processes are still running are left alone. Returns how many were
+        requeued.
+        """
+        with self._lock:
+            return self._expire_leases(time.time())
+
+    def _expire_leases(self, now: float) -> int:
+        # Rows from before leases existed have none: treat them as expired
+        expired = "status = 'running' AND (lease_until IS NULL OR lease_until < ?)"
+        self.conn.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted too many times', finished_at = ?, "
+            f"lease_until = NULL WHERE {expired} AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+        return self.conn.execute(
+            f"UPDATE jobs SET status = 'queued', started_at = NULL, owner = NULL, lease_until = NULL WHERE {expired}",
+            (now,)).rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def position(self, job: Dict[str, Any]) -> int:
+        """Queued jobs that will run before `job`."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND seq < ?))",
+                (job['rank'], job['rank'], job['seq'])).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        with self._lock:
+            for status, count in self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+                counts[status] = count
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _decode(row: sqlite3.Row, **overrides: Any) -> Dict[str, Any]:
+        job = dict(row)
+        job['rank'] = job.pop('priority')
+        job['priority'] = next(name for name, rank in JOB_PRIORITIES.items() if rank == job['rank'])
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job.update(overrides)
+        return job
+
+
+class JobRunner:
+    """
+    `concurrency` asyncio workers (default: worker pool size) taking jobs off
+    `queue` and cropping them with `service`. `on_result` sees every result
+    (metrics). start()/stop() may be called again on another event loop.
+    """
+
+    def __init__(self, queue: JobQueue, service: ImageService, concurrency: int = 0,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.queue = queue
+        self.service = service
+        self.concurrency = concurrency or service.worker_pool.size
+        self.on_result = on_result
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        requeued = await asyncio.to_thread(self.queue.recover)
+        if requeued:
+            logger.info(f"JobRunner: Requeued {requeued} interrupted jobs")
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        logger.info(f"JobRunner started with {self.concurrency} workers")
+
+    async def submit(self, filename: str, payload: Dict[str, Any], priority: str = "normal") -> str:
+        """
+        Enqueues an upload saved by ImageService.store_upload() (`payload`,
+        plus optional detection_mode/detector) and wakes a worker.
+        """
+        job_id = await asyncio.to_thread(self.queue.enqueue, filename, payload, priority)
+        await self.start()
+        self._wakeup.set()
+        return job_id
+
+    async def stop(self) -> None:
+        """Stops the workers; a job cut short goes back to the queue."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.queue.claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        payload = job['payload']
+        heartbeat = asyncio.create_task(self._renew_lease(job['id']))
+        try:
+            result = await self.service.crop_stored_upload(
+                payload['saved_filename'], payload['digest'], payload['decoder'],
+                detection_mode=payload.get('detection_mode'), detector=payload.get('detector'),
+                filename=job['filename'])
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.to_thread(self.queue.requeue, job['id']))
+            raise
+        except Exception as e:
+            logger.error(f"JobRunner: Job {job['id']} failed: {e}", exc_info=True)
+            await asyncio.to_thread(self.queue.fail, job['id'], str(e))
+            return
+        finally:
+            heartbeat.cancel()
+        if self.on_result is not None:
+            self.on_result(result)
+        await asyncio.to_thread(self.queue.finish, job['id'], result)
+        logger.info(f"JobRunner: Job {job['id']} finished: {result.get('status')}")
+
+    async def _renew_lease(self, job_id: str) -> None:
+        """Renews a running job's lease three times per lease period until cancelled."""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await asyncio.to_thread(self.queue.renew, job_id):
+                logger.warning(f"JobRunner: Lost the lease on job {job_id}")
+                return
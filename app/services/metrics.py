@@ -0,0 +1,205 @@
+# app/services/metrics.py
+"""
+Minimal Prometheus-compatible metrics (text exposition format 0.0.4).
+
+Kept in-repo instead of depending on prometheus_client: we only need
+labelled counters, gauges and histograms for a single process.
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LabelValues = Tuple[str, ...]
+
+INF_BUCKET = 'le="+Inf"'
+
+# Seconds; spans a 1 ms threshold pass up to a 10 s HEIC decode
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, INF_BUCKET)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ====================================================================
+# Application Metrics
+# ====================================================================
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "receipts_http_requests_total", "HTTP requests by route and response status code.", ("path", "code")))
+IMAGES = REGISTRY.register(Counter(
+    "receipts_images_processed_total", "Images run through the cropping pipeline by outcome.", ("outcome",)))
+UPLOAD_BYTES = REGISTRY.register(Counter(
+    "receipts_upload_bytes_total", "Request body bytes received by route.", ("path",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "receipts_stage_seconds", "Time spent in each ImageService pipeline stage.", ("stage",)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "receipts_http_request_seconds", "End-to-end HTTP request latency by route.", ("path",)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "receipts_http_requests_in_flight", "HTTP requests currently being handled."))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "receipts_worker_queue_depth", "Pipeline jobs waiting for a free worker."))
+POOL_BUSY = REGISTRY.register(Gauge(
+    "receipts_worker_pool_busy", "Pipeline jobs currently running on a worker."))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    "receipts_startup_seconds", "Seconds from importing app.main to the end of each startup phase.", ("phase",)))
+JOBS = REGISTRY.register(Gauge(
+    "receipts_jobs", "Async jobs by status.", ("status",)))
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "receipts_admission_in_flight", "Requests admitted and running, per admission class.", ("endpoint",)))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    "receipts_admission_queued", "Requests waiting for admission, per admission class.", ("endpoint",)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "receipts_admission_rejected_total", "Requests shed by admission control.", ("endpoint", "reason")))
+DECODE_BYTES = REGISTRY.register(Histogram(
+    "receipts_decode_bytes", "Pixel buffer bytes materialised by decoding one upload.", ("decoder",),
+    buckets=(1e5, 1e6, 4e6, 16e6, 32e6, 64e6, 128e6)))
+OUTPUT_BYTES = REGISTRY.register(Histogram(
+    "receipts_output_bytes", "Encoded size of written crops by file extension.", ("format",),
+    buckets=(16e3, 32e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6)))
+
+
+def stage_label(stage: str, decoder: Optional[str]) -> str:
+    """Decode time is split by decoder so HEIC and OpenCV can be told apart."""
+    return f"decode_{decoder}" if stage == "decode" and decoder else stage
+
+
+def observe_result(process_result: Dict) -> None:
+    """Records the outcome and per-stage timings (ms) of one pipeline result."""
+    outcome = "cache_hit" if process_result.get('cache') == "hit" else \
+        "error" if str(process_result.get('status', '')).startswith("Error") else "success"
+    IMAGES.inc(outcome=outcome)
+    if process_result.get('decode_bytes'):
+        DECODE_BYTES.observe(process_result['decode_bytes'], decoder=process_result.get('decoder', ''))
+    if process_result.get('output_bytes') and outcome == "success":
+        ext = os.path.splitext(process_result.get('saved_filename', ''))[1].lower().lstrip('.')
+        OUTPUT_BYTES.observe(process_result['output_bytes'], format=ext)
+    for stage, ms in (process_result.get('timings') or {}).items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage_label(stage, process_result.get('decoder')))
+
+
+def server_timing_header(process_result: Dict) -> str:
+    """
+    Formats result timings as a `Server-Timing` header value. A result-cache
+    hit (no stage ran) is marked `cache;desc=hit`, so clients can tell it
+    apart from a fast pipeline run.
+    """
+    timings = process_result.get('timings') or {}
+    entries = [f"{stage_label(stage, process_result.get('decoder'))};dur={ms:.2f}" for stage, ms in timings.items()]
+    if process_result.get('cache') == "hit":
+        entries.append("cache;desc=hit")
+    return ", ".join(entries)
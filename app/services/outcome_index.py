@@ -0,0 +1,236 @@
+# app/services/outcome_index.py
+"""
+Persistent index of processing outcomes.
+
+Every crop, job, re-crop and submitted file is recorded as one row in a
+local SQLite file: where the crop and the original went, the coordinates,
+status, content hash and stage timings. record() only appends to an
+in-memory batch; flush_periodically() writes the batch in one
+transaction every few seconds (or as soon as `batch_size` rows are
+waiting), so requests never wait on the disk.
+
+Queries page by keyset (created_at, id), newest first, on composite
+(filter, created_at, id) indexes: a page is one index range scan plus a
+table lookup per row returned (rows are returned whole, so the indexes
+do not cover them), which costs the same at row ten and at row ten
+million. The files a row names may have been collected from the store
+since.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OUTCOME_KINDS = ("process", "job", "crop", "submission")
+OUTCOME_STATUSES = ("success", "error", "rejected")
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outcomes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    status TEXT NOT NULL,
+    filename TEXT,
+    saved_filename TEXT,
+    source_filename TEXT,
+    original_filename TEXT,
+    digest TEXT,
+    x INTEGER,
+    y INTEGER,
+    w INTEGER,
+    h INTEGER,
+    detector TEXT,
+    detection_mode TEXT,
+    output_bytes INTEGER,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS outcomes_time ON outcomes (created_at, id);
+CREATE INDEX IF NOT EXISTS outcomes_status ON outcomes (outcome, created_at, id);
+CREATE INDEX IF NOT EXISTS outcomes_digest ON outcomes (digest, created_at, id);
+CREATE INDEX IF NOT EXISTS outcomes_saved ON outcomes (saved_filename, created_at, id);
+"""
+
+COLUMNS = ("created_at", "kind", "outcome", "status", "filename", "saved_filename", "source_filename",
+           "original_filename", "digest", "x", "y", "w", "h", "detector", "detection_mode", "output_bytes",
+           "timings")
+INSERT = f"INSERT INTO outcomes ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def outcome_of(result: Dict[str, Any]) -> str:
+    return "error" if str(result.get('status', '')).startswith("Error") else "success"
+
+
+class OutcomeIndex:
+    """
+    Batched writer and query side of the outcomes table. record() never
+    touches the database; flush() and query() block on SQLite and are run
+    through asyncio.to_thread from the event loop. Several app processes
+    may share one file (WAL).
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 256, max_pending: int = 100_000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        # Rows kept while the database is unreachable; the oldest are dropped beyond this
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending: List[Tuple] = []
+        self._pending_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # Set by the running flush_periodically() (its own event loop)
+        self._wake: Optional[asyncio.Event] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened lazily so that importing the app never creates the database
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # ==========================================
+    # Writes
+    # ==========================================
+
+    def record(self, kind: str, filename: Optional[str], result: Dict[str, Any],
+               original_filename: Optional[str] = None, outcome: Optional[str] = None) -> None:
+        """Queues one outcome; `outcome` defaults to success/error from the result status."""
+        timings = result.get('timings')
+        row = (time.time(), kind, outcome or outcome_of(result), str(result.get('status', '')), filename,
+               result.get('saved_filename'), result.get('source_filename'), original_filename,
+               result.get('digest'), result.get('x'), result.get('y'), result.get('w'), result.get('h'),
+               result.get('detector'), result.get('detection_mode'), result.get('output_bytes'),
+               json.dumps(timings) if timings else None)
+        with self._pending_lock:
+            self._pending.append(row)
+            if len(self._pending) > self.max_pending:
+                del self._pending[0]
+                self.dropped += 1
+            full = len(self._pending) >= self.batch_size
+        if full and self._wake is not None:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Writes every queued row in one transaction. Returns how many were written."""
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            with self._lock:
+                conn = self.conn
+                conn.execute("BEGIN")
+                try:
+                    conn.executemany(INSERT, rows)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except BaseException:
+            # Put the batch back in front of anything recorded meanwhile
+            with self._pending_lock:
+                self._pending[:0] = rows
+            raise
+        self.written += len(rows)
+        return len(rows)
+
+    async def flush_periodically(self, interval_seconds: float) -> None:
+        """Runs flush() every `interval_seconds`, or sooner when a batch fills, until cancelled."""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"OutcomeIndex: Flush failed: {e}", exc_info=True)
+
+    # ==========================================
+    # Queries
+    # ==========================================
+
+    def get(self, outcome_id: int) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM outcomes WHERE id = ?", (outcome_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None, status: Optional[str] = None,
+              digest: Optional[str] = None, kind: Optional[str] = None, saved_filename: Optional[str] = None,
+              limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Newest-first page of outcomes matching every given filter, with
+        `since` inclusive and `until` exclusive (epoch seconds). Returns
+        (rows, next_cursor); pass next_cursor back for the following page,
+        it is None on the last one. Queued rows are flushed first.
+        """
+        if status is not None and status not in OUTCOME_STATUSES:
+            raise ValueError(f"Unknown status '{status}'. Expected one of {OUTCOME_STATUSES}.")
+        if kind is not None and kind not in OUTCOME_KINDS:
+            raise ValueError(f"Unknown kind '{kind}'. Expected one of {OUTCOME_KINDS}.")
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        clauses, params = [], []
+        for clause, value in (("created_at >= ?", since), ("created_at < ?", until), ("outcome = ?", status),
+                              ("digest = ?", digest), ("kind = ?", kind), ("saved_filename = ?", saved_filename)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        if cursor:
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend(self._parse_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(f"SELECT * FROM outcomes {where} ORDER BY created_at DESC, id DESC LIMIT ?",
+                                     (*params, limit + 1)).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['created_at']!r}:{rows[-1]['id']}"
+        return [self._decode(row) for row in rows], next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {'db_path': self.db_path, 'pending': pending, 'written': self.written, 'dropped': self.dropped}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _parse_cursor(cursor: str) -> Tuple[float, int]:
+        try:
+            created_at, outcome_id = cursor.split(":")
+            return float(created_at), int(outcome_id)
+        except ValueError:
+            raise ValueError("Invalid cursor") from None
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        record = dict(row)
+        record['timings'] = json.loads(record['timings']) if record['timings'] else {}
+        return record
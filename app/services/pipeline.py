@@ -0,0 +1,664 @@
+# app/services/pipeline.py
+"""
+CPU-bound stages of the cropping pipeline.
+
+Everything here is a plain module-level function taking picklable arguments,
+so it can be shipped to a thread *or* process pool by `WorkerPool`.
+"""
+
+import cv2
+import numpy as np
+import os
+import logging
+import math
+import time
+from io import BytesIO
+from dataclasses import dataclass, replace
+from typing import Tuple, Optional, Dict, Any, List
+
+from app.services.decoders import DECODERS, codec_module
+from app.services.detectors import DETECTORS, get_detector, paper_mask
+from app.services.scratch import SCRATCH
+from app.services.encoder import EncodeOptions, encode_image, output_extension
+from app.services.storage import atomic_write, region_filename
+from app.services.timing import StageTimer
+
+logger = logging.getLogger(__name__)
+
+HEIC_EXTENSIONS = ('.heic', '.heif')
+
+# --- Detection Modes ---
+# "full":      the detector engine runs on the full-resolution frame.
+# "downscale": the engine runs on a reduced copy, box scaled back up and
+#              (optionally) refined in a thin band at full resolution.
+# "thumbnail": HEIC only: the engine runs on the thumbnail embedded in the
+#              file, decoded before (and sometimes instead of) the full frame.
+#              Other formats, and thumbnails under thumbnail_min_side, fall
+#              back to "downscale". Opt-in: the thumbnail only gates the full
+#              decode (no paper, no decode); boxes are re-detected at
+#              "downscale" resolution once the frame is decoded. Crops taken
+#              straight from the thumbnail (see crop_heic_via_thumbnail) keep
+#              the thumbnail's accuracy, which detector_report measures
+#              against full detection: on 320 px iPhone thumbnails, a mean IoU
+#              of 0.85 and a minimum of 0.49 (hence thumbnail_min_side).
+# The engine itself ("contour", "projection", ...) lives in detectors.py.
+DETECTION_MODES = ("full", "downscale", "thumbnail")
+
+
+@dataclass(frozen=True)
+class DetectionOptions:
+    """How paper detection should be run. Frozen so it is hashable/picklable."""
+    mode: str = "full"
+    # Longest side of the reduced image in "downscale" mode ...
+    max_side: int = 1024
+    # ... or an explicit factor (e.g. 0.25); takes precedence when > 0.
+    scale: float = 0.0
+    # Re-locate each edge at full resolution after scaling the box back up.
+    refine: bool = True
+    # Registered detector engine name (see app/services/detectors.py).
+    engine: str = "contour"
+    # Crop every paper region (multi-receipt photos) instead of the largest only ...
+    multiple: bool = False
+    # ... each covering at least this fraction of the frame, largest first, at most max_regions.
+    min_area: float = 0.02
+    max_regions: int = 20
+    # "thumbnail" mode ignores embedded thumbnails whose longest side is below this.
+    thumbnail_min_side: int = 512
+
+    def __post_init__(self):
+        if self.mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode '{self.mode}'. Expected one of {DETECTION_MODES}.")
+        if not 0 < self.min_area < 1:
+            raise ValueError(f"min_area must be a fraction of the frame in (0, 1), got {self.min_area}.")
+        if self.max_regions < 1:
+            raise ValueError(f"max_regions must be at least 1, got {self.max_regions}.")
+        if self.engine not in DETECTORS:
+            raise ValueError(f"Unknown detector '{self.engine}'. Expected one of {tuple(DETECTORS)}.")
+
+
+def _heif_to_bgr(heif_image) -> np.ndarray:
+    """
+    View of a HEIF image (or thumbnail) opened with bgr_mode=True: libheif
+    already wrote BGR(A) pixels, so no RGB->BGR conversion copy is needed.
+    """
+    image = np.asarray(heif_image)
+    # Rows may be padded up to the stride; slicing keeps it a view
+    image = image[:, :heif_image.size[0]]
+    if image.shape[2] == 4:
+        # Rare (receipt photos have no alpha); this one does allocate
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+
+def open_heic(source) -> Any:
+    """Opens a HEIC path or buffer without decoding it; pixels are decoded on first access."""
+    return codec_module("heic").open_heif(source, convert_hdr_to_8bit=True, bgr_mode=True)
+
+
+def heic_thumbnail(heif_file, min_side: int = 0) -> Optional[np.ndarray]:
+    """
+    The largest thumbnail embedded in the primary image, as BGR, or None
+    (also when its longest side is below `min_side`; nothing is decoded then).
+    """
+    primary = heif_file[heif_file.primary_index]
+    sizes = primary.info.get('thumbnails') or []
+    if not sizes:
+        return None
+    largest = max(range(len(sizes)), key=lambda i: sizes[i])
+    if sizes[largest] < min_side:
+        return None
+    return _heif_to_bgr(primary.get_thumbnail(largest))
+
+
+def is_heic(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in HEIC_EXTENSIONS
+
+
+def decoder_name(filename: str, decoder: Optional[str] = None) -> str:
+    """
+    Which decoder load_cv2_image / decode_image_bytes use for this file:
+    `decoder` when the content was sniffed (see probe.py), else the extension.
+    """
+    return decoder or ("heic" if is_heic(filename) else "opencv")
+
+
+def load_cv2_image(path: str, timer: Optional[StageTimer] = None,
+                   decoder: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Loads an image from disk.
+    Detects HEIC/HEIF and uses pillow_heif to convert to OpenCV format.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("decode"):
+        if decoder_name(path, decoder) == "heic":
+            try:
+                return _heif_to_bgr(open_heic(path))
+            except Exception as e:
+                logger.error(f"Failed to decode HEIC file: {e}")
+                return None
+
+        # Standard OpenCV load
+        return cv2.imread(path)
+
+
+def decode_image_bytes(data: bytes, filename: str, timer: Optional[StageTimer] = None,
+                       decoder: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Decodes an upload straight from its in-memory buffer (no disk round-trip).
+    `filename` is only used to pick the decoder, exactly like load_cv2_image.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("decode"):
+        if decoder_name(filename, decoder) == "heic":
+            try:
+                return _heif_to_bgr(open_heic(data))
+            except Exception as e:
+                logger.error(f"Failed to decode HEIC bytes: {e}")
+                return None
+
+        return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def get_crop_coordinates(img: np.ndarray, timer: Optional[StageTimer] = None) -> Optional[Tuple[int, int, int, int]]:
+    """The original contour-based detection on the frame as given."""
+    return get_detector("contour").detect(img, timer)
+
+
+def detection_scale_for(shape: Tuple[int, ...], options: DetectionOptions) -> float:
+    """Resize factor used for detection; 1.0 means full resolution."""
+    if options.mode == "full":
+        return 1.0
+    if options.scale > 0:
+        return min(1.0, options.scale)
+    return min(1.0, options.max_side / max(shape[0], shape[1]))
+
+
+def _refine_edges(img: np.ndarray, box: Tuple[int, int, int, int], band: int) -> Tuple[int, int, int, int]:
+    """
+    Re-locates each edge of a box found at reduced resolution by thresholding
+    only a thin strip (+/- band px) around it at full resolution.
+    An edge with no paper pixels in its strip keeps its scaled-up position.
+    """
+    img_h, img_w = img.shape[:2]
+    x0, y0, x1, y1 = box
+
+    # Left / right edges: strips spanning the box height
+    lo, hi = max(0, x0 - band), min(img_w, x0 + band)
+    cols = np.flatnonzero(paper_mask(img[y0:y1, lo:hi]).any(axis=0))
+    if cols.size:
+        x0 = lo + int(cols[0])
+    lo, hi = max(0, x1 - band), min(img_w, x1 + band)
+    cols = np.flatnonzero(paper_mask(img[y0:y1, lo:hi]).any(axis=0))
+    if cols.size:
+        x1 = lo + int(cols[-1]) + 1
+
+    # Top / bottom edges: strips spanning the refined width
+    lo, hi = max(0, y0 - band), min(img_h, y0 + band)
+    rows = np.flatnonzero(paper_mask(img[lo:hi, x0:x1]).any(axis=1))
+    if rows.size:
+        y0 = lo + int(rows[0])
+    lo, hi = max(0, y1 - band), min(img_h, y1 + band)
+    rows = np.flatnonzero(paper_mask(img[lo:hi, x0:x1]).any(axis=1))
+    if rows.size:
+        y1 = lo + int(rows[-1]) + 1
+
+    return x0, y0, x1, y1
+
+
+def detect_paper(img: np.ndarray, options: DetectionOptions = DetectionOptions(),
+                 timer: Optional[StageTimer] = None) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+    """
+    Finds the paper bounding box according to `options`.
+    Returns ((x, y, w, h) in full-resolution pixels or None, scale used).
+    """
+    timer = timer or StageTimer()
+    frame, scale = _detection_frame(img, options, timer)
+    coordinates = get_detector(options.engine).detect(frame, timer)
+    if not coordinates or scale >= 1.0:
+        return coordinates, scale
+    return _full_resolution_box(img, coordinates, scale, options, timer), scale
+
+
+def detect_papers(img: np.ndarray, options: DetectionOptions = DetectionOptions(),
+                  timer: Optional[StageTimer] = None) -> Tuple[List[Tuple[int, int, int, int]], float]:
+    """
+    Multi-receipt variant of detect_paper: every region over
+    options.min_area of the frame, largest first. Returns (boxes, scale).
+    """
+    timer = timer or StageTimer()
+    frame, scale = _detection_frame(img, options, timer)
+    boxes = get_detector(options.engine).detect_all(frame, timer, options.min_area, options.max_regions)
+    if scale >= 1.0:
+        return boxes, scale
+    return [_full_resolution_box(img, box, scale, options, timer) for box in boxes], scale
+
+
+def _detection_frame(img: np.ndarray, options: DetectionOptions, timer: StageTimer) -> Tuple[np.ndarray, float]:
+    """The frame the engine runs on (a scratch-memory reduced copy in downscale mode) and its scale."""
+    scale = detection_scale_for(img.shape, options)
+    if scale >= 1.0:
+        return img, 1.0
+
+    img_h, img_w = img.shape[:2]
+    # INTER_LINEAR only samples the source (INTER_AREA touches every pixel and
+    # costs about as much as full-resolution detection); the paper is a large
+    # bright region, so sampling is enough to find it.
+    with timer.stage("resize"):
+        small_w, small_h = max(1, round(img_w * scale)), max(1, round(img_h * scale))
+        small = cv2.resize(img, (small_w, small_h), dst=SCRATCH.get("small", (small_h, small_w, *img.shape[2:])),
+                           interpolation=cv2.INTER_LINEAR)
+    return small, scale
+
+
+def _full_resolution_box(img: np.ndarray, coordinates: Tuple[int, int, int, int], scale: float,
+                         options: DetectionOptions, timer: StageTimer) -> Tuple[int, int, int, int]:
+    img_h, img_w = img.shape[:2]
+    box = _scale_box_up(coordinates, scale, (img_w, img_h))
+    if options.refine:
+        box = _refine_scaled_box(img, box, scale, timer)
+    return box
+
+
+def _scale_box_up(coordinates: Tuple[int, int, int, int], scale: float,
+                  full_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Box found at `scale` in full-resolution pixels, rounded outwards so it never shrinks."""
+    x, y, w, h = coordinates
+    x0 = max(0, math.floor(x / scale))
+    y0 = max(0, math.floor(y / scale))
+    x1 = min(full_size[0], math.ceil((x + w) / scale))
+    y1 = min(full_size[1], math.ceil((y + h) / scale))
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def _refine_scaled_box(img: np.ndarray, box: Tuple[int, int, int, int], scale: float,
+                       timer: StageTimer) -> Tuple[int, int, int, int]:
+    x, y, w, h = box
+    # One reduced pixel covers 1/scale full pixels; pad for interpolation blending
+    band = math.ceil(1 / scale) + 2
+    with timer.stage("refine"):
+        x0, y0, x1, y1 = _refine_edges(img, (x, y, x + w, y + h), band)
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def crop_and_overwrite(img: np.ndarray, path: str, x: int, y: int, w: int, h: int,
+                       timer: Optional[StageTimer] = None, encoding: EncodeOptions = EncodeOptions()) -> int:
+    """
+    Crops and writes the image to `path`, in the format implied by its extension.
+    Encoding (in memory, see encoder.py) and writing are separate steps so each
+    can be timed. Returns the number of bytes written, 0 on failure.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("crop"):
+        cropped_img = img[y:y + h, x:x + w]
+
+    encoded = encode_image(cropped_img, os.path.splitext(path)[1], encoding, timer)
+    if encoded is None:
+        return 0
+
+    with timer.stage("write"):
+        atomic_write(path, encoded)
+    return int(encoded.size)
+
+
+# Clockwise angles Cropper.js can produce that cv2.rotate handles exactly
+RIGHT_ANGLE_ROTATIONS = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def transform_image(img: np.ndarray, rotate: float = 0.0, scale_x: float = 1.0, scale_y: float = 1.0) -> np.ndarray:
+    """
+    Applies a Cropper.js transform to the full frame: flips first (negative
+    scaleX / scaleY), then a clockwise rotation by `rotate` degrees. Right
+    angles are exact; other angles rotate onto an enlarged canvas so no corner
+    is cut off, matching the canvas Cropper.js measures its crop box in.
+    Only the sign of the scale factors matters; zoom is already folded into
+    Cropper.js' natural-pixel x/y/width/height.
+    """
+    if scale_x < 0 and scale_y < 0:
+        img = cv2.flip(img, -1)
+    elif scale_x < 0:
+        img = cv2.flip(img, 1)
+    elif scale_y < 0:
+        img = cv2.flip(img, 0)
+
+    angle = rotate % 360
+    if angle == 0:
+        return img
+    if angle in RIGHT_ANGLE_ROTATIONS:
+        return cv2.rotate(img, RIGHT_ANGLE_ROTATIONS[angle])
+
+    img_h, img_w = img.shape[:2]
+    # OpenCV angles are counter-clockwise
+    matrix = cv2.getRotationMatrix2D((img_w / 2, img_h / 2), -angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    out_w = int(round(img_h * sin + img_w * cos))
+    out_h = int(round(img_h * cos + img_w * sin))
+    matrix[0, 2] += out_w / 2 - img_w / 2
+    matrix[1, 2] += out_h / 2 - img_h / 2
+    return cv2.warpAffine(img, matrix, (out_w, out_h))
+
+
+def output_filename_for(filename: str, encoding: EncodeOptions = EncodeOptions(),
+                        source_format: Optional[str] = None) -> str:
+    """
+    Name of the crop written for `filename`: the extension of the configured
+    output format. OpenCV cannot save/write .heic files, so HEIC crops in
+    "source" format are written as .jpg. `source_format` (the sniffed
+    format) overrides a missing or mismatched extension.
+    """
+    base_name, ext = os.path.splitext(filename)
+    output_ext = output_extension(filename, encoding, source_format)
+    return filename if output_ext == ext else f"{base_name}{output_ext}"
+
+
+def error_response(message: str, filename: str = "") -> Dict[str, Any]:
+    return {
+        'x': 0, 'y': 0, 'w': 0, 'h': 0,
+        'status': f"Error: {message}",
+        'saved_filename': filename
+    }
+
+
+def crop_decoded_image(img: Optional[np.ndarray], filename: str, upload_dir: str,
+                       detection: DetectionOptions = DetectionOptions(),
+                       timer: Optional[StageTimer] = None, encoding: EncodeOptions = EncodeOptions()) -> Dict[str, Any]:
+    """
+    Runs detect -> crop -> write on an already decoded frame and saves the crop
+    as `filename` (with the extension of the output format) inside upload_dir.
+    The result carries per-stage `timings` (ms) accumulated on `timer` and the
+    encoded size as `output_bytes`.
+    """
+    timer = timer or StageTimer()
+    result = _crop_decoded_image(img, filename, upload_dir, detection, timer, encoding)
+    result['timings'] = timer.rounded()
+    return result
+
+
+def _crop_decoded_image(img: Optional[np.ndarray], filename: str, upload_dir: str,
+                        detection: DetectionOptions, timer: StageTimer, encoding: EncodeOptions) -> Dict[str, Any]:
+    if img is None:
+        return error_response("Could not load image (unsupported format?)", filename)
+
+    # 1. Calculate Crop Coordinates
+    if detection.multiple:
+        boxes, scale = detect_papers(img, detection, timer)
+    else:
+        coordinates, scale = detect_paper(img, detection, timer)
+        boxes = [coordinates] if coordinates else []
+    if not boxes:
+        logger.warning(f"No contours found for {filename}")
+        return error_response("No contours found", filename)
+
+    # 2. Crop and Save
+    return _save_regions(img, boxes, boxes, filename, upload_dir, detection, scale, timer, encoding)
+
+
+def _save_regions(img: np.ndarray, crop_boxes: List[Tuple[int, int, int, int]],
+                  coordinates: List[Tuple[int, int, int, int]], filename: str, upload_dir: str,
+                  detection: DetectionOptions, scale: float, timer: StageTimer,
+                  encoding: EncodeOptions) -> Dict[str, Any]:
+    """
+    _save_crop for each region. The top-level box and saved_filename are the
+    largest region's; with detection.multiple every region (including that
+    one) is listed under `regions`, region n saved as region_filename(n).
+    If a region fails to save, the regions already written are removed:
+    the error result names none of them, so nothing would ever collect them.
+    """
+    results: List[Dict[str, Any]] = []
+    try:
+        for number, (crop_box, box) in enumerate(zip(crop_boxes, coordinates), start=1):
+            result = _save_crop(img, crop_box, box, region_filename(filename, number), upload_dir, detection, scale,
+                                timer, encoding)
+            if result['status'].startswith("Error"):
+                _remove_regions(results, upload_dir)
+                if not detection.multiple:
+                    return result
+                return error_response(f"Failed to save crop {number} of {len(crop_boxes)}", filename)
+            results.append(result)
+    except BaseException:
+        _remove_regions(results, upload_dir)
+        raise
+    result = results[0]
+    if not detection.multiple:
+        return result
+    result['regions'] = [{key: r[key] for key in ('x', 'y', 'w', 'h', 'saved_filename', 'output_bytes')}
+                         for r in results]
+    result['output_bytes'] = sum(r['output_bytes'] for r in results)
+    return result
+
+
+def _remove_regions(results: List[Dict[str, Any]], upload_dir: str) -> None:
+    for result in results:
+        try:
+            os.remove(os.path.join(upload_dir, result['saved_filename']))
+        except FileNotFoundError:
+            pass
+
+
+def _save_crop(img: np.ndarray, crop_box: Tuple[int, int, int, int], coordinates: Tuple[int, int, int, int],
+               filename: str, upload_dir: str, detection: DetectionOptions, scale: float,
+               timer: StageTimer, encoding: EncodeOptions) -> Dict[str, Any]:
+    """
+    Writes `crop_box` of `img` and reports `coordinates` (always in
+    full-resolution pixels; crop_box differs when `img` is a thumbnail).
+    """
+    x, y, w, h = coordinates
+
+    output_filename = output_filename_for(filename, encoding)
+    if output_filename != filename:
+        logger.info(f"Converted output to {os.path.splitext(output_filename)[1]}: {output_filename}")
+    filename = output_filename
+
+    output_bytes = crop_and_overwrite(img, os.path.join(upload_dir, filename), *crop_box, timer, encoding)
+    if not output_bytes:
+        return error_response("Failed to save cropped image", filename)
+
+    return {
+        'x': x, 'y': y, 'w': w, 'h': h,
+        'status': 'Processed and Coordinates Found',
+        'saved_filename': filename,
+        'detection_mode': detection.mode,
+        'detection_scale': scale,
+        'detector': detection.engine,
+        'output_bytes': output_bytes
+    }
+
+
+def crop_saved_image(file_path: str, filename: str, upload_dir: str,
+                     detection: DetectionOptions = DetectionOptions(),
+                     timer: Optional[StageTimer] = None, return_image: bool = False,
+                     encoding: EncodeOptions = EncodeOptions(), decoder: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs decode -> detect -> crop -> write for an upload already on disk.
+    This is the unit of work submitted to the worker pool.
+    With `return_image` the decoded frame comes back as result['image'] so the
+    caller can cache it (only worth it on a thread pool; no pickling).
+    `decoder` ("heic"/"opencv") overrides the choice by file extension.
+    """
+    timer = timer or StageTimer()
+    decoder = decoder_name(file_path, decoder)
+    if detection.mode == "thumbnail" and decoder == "heic":
+        result, img = crop_heic_via_thumbnail(file_path, filename, upload_dir, detection, timer, encoding)
+    else:
+        img = load_cv2_image(file_path, timer, decoder)
+        result = crop_decoded_image(img, filename, upload_dir, detection, timer, encoding)
+        result['decode_bytes'] = img.nbytes if img is not None else 0
+    result['decoder'] = decoder
+    if return_image and img is not None:
+        result['image'] = img
+    return result
+
+
+def crop_image_bytes(data: bytes, filename: str, upload_dir: str,
+                     detection: DetectionOptions = DetectionOptions(),
+                     timer: Optional[StageTimer] = None, return_image: bool = False,
+                     encoding: EncodeOptions = EncodeOptions(), decoder: Optional[str] = None) -> Dict[str, Any]:
+    """In-memory variant of crop_saved_image: decodes from the upload buffer."""
+    timer = timer or StageTimer()
+    decoder = decoder_name(filename, decoder)
+    if detection.mode == "thumbnail" and decoder == "heic":
+        result, img = crop_heic_via_thumbnail(data, filename, upload_dir, detection, timer, encoding)
+    else:
+        img = decode_image_bytes(data, filename, timer, decoder)
+        result = crop_decoded_image(img, filename, upload_dir, detection, timer, encoding)
+        result['decode_bytes'] = img.nbytes if img is not None else 0
+    result['decoder'] = decoder
+    if return_image and img is not None:
+        result['image'] = img
+    return result
+
+
+def crop_heic_via_thumbnail(source, filename: str, upload_dir: str, detection: DetectionOptions,
+                            timer: StageTimer, encoding: EncodeOptions = EncodeOptions()
+                            ) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """
+    "thumbnail" detection for a HEIC path or buffer: the engine runs on the
+    embedded thumbnail, so a photo without paper is rejected without ever
+    decoding the full frame. Once the full frame is decoded, the boxes are
+    re-detected on a "downscale" copy of it: thumbnail boxes scaled up are
+    too coarse for a thin refine band to recover. When the output budget
+    (encoding.max_side) is already met by the thumbnail's pixels, the crop
+    comes from the thumbnail and the full decode is skipped entirely.
+    Returns (result, full frame or None if it was never decoded).
+    """
+    try:
+        heif_file = open_heic(source)
+        with timer.stage("decode_thumbnail"):
+            thumbnail = heic_thumbnail(heif_file, detection.thumbnail_min_side)
+    except Exception as e:
+        logger.error(f"Failed to open HEIC: {e}")
+        result = error_response("Could not load image (unsupported format?)", filename)
+        result['timings'], result['decode_bytes'] = timer.rounded(), 0
+        return result, None
+
+    if thumbnail is None:
+        # No (usable) embedded thumbnail: decode fully and detect on a reduced copy
+        with timer.stage("decode"):
+            img = _heif_to_bgr(heif_file)
+        result = crop_decoded_image(img, filename, upload_dir, replace(detection, mode="downscale"), timer, encoding)
+        result['decode_bytes'] = img.nbytes
+        return result, img
+
+    full_size = heif_file.size
+    scale = thumbnail.shape[1] / full_size[0]
+    detector = get_detector(detection.engine)
+    if detection.multiple:
+        thumb_boxes = detector.detect_all(thumbnail, timer, detection.min_area, detection.max_regions)
+    else:
+        thumb_box = detector.detect(thumbnail, timer)
+        thumb_boxes = [thumb_box] if thumb_box else []
+    if not thumb_boxes:
+        logger.warning(f"No contours found for {filename}")
+        result = error_response("No contours found", filename)
+        result['timings'], result['decode_bytes'] = timer.rounded(), thumbnail.nbytes
+        return result, None
+
+    if encoding.max_side and all(max(box[2:]) >= encoding.max_side for box in thumb_boxes):
+        img, decode_bytes = None, thumbnail.nbytes
+        coordinates = [_scale_box_up(box, scale, full_size) for box in thumb_boxes]
+        result = _save_regions(thumbnail, thumb_boxes, coordinates, filename, upload_dir, detection, scale,
+                               timer, encoding)
+    else:
+        with timer.stage("decode"):
+            img = _heif_to_bgr(heif_file)
+        decode_bytes = thumbnail.nbytes + img.nbytes
+        result = _crop_decoded_image(img, filename, upload_dir, replace(detection, mode="downscale"), timer,
+                                     encoding)
+        if 'detection_mode' in result:
+            result['detection_mode'] = detection.mode
+    result['timings'] = timer.rounded()
+    result['decode_bytes'] = decode_bytes
+    return result, img
+
+
+def crop_to_box(img: Optional[np.ndarray], source_path: str, output_path: str,
+                box: Tuple[float, float, float, float], rotate: float = 0.0,
+                scale_x: float = 1.0, scale_y: float = 1.0, return_image: bool = False,
+                timer: Optional[StageTimer] = None, encoding: EncodeOptions = EncodeOptions(),
+                decoder: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Applies a user-adjusted crop (Cropper.js x, y, width, height plus
+    rotate/scaleX/scaleY) to an original and writes it to `output_path`.
+    `img` is the already decoded original if the caller has it cached;
+    otherwise it is decoded from `source_path`.
+    """
+    timer = timer or StageTimer()
+    decoded = load_cv2_image(source_path, timer, decoder) if img is None else None
+    result = _crop_to_box(decoded if img is None else img, output_path, box, rotate, scale_x, scale_y, timer, encoding)
+    result['timings'] = timer.rounded()
+    if return_image and decoded is not None:
+        result['image'] = decoded
+    return result
+
+
+def _crop_to_box(img: Optional[np.ndarray], output_path: str, box: Tuple[float, float, float, float],
+                 rotate: float, scale_x: float, scale_y: float, timer: StageTimer,
+                 encoding: EncodeOptions) -> Dict[str, Any]:
+    filename = os.path.basename(output_path)
+    if img is None:
+        return error_response("Could not load original image", filename)
+
+    with timer.stage("transform"):
+        img = transform_image(img, rotate, scale_x, scale_y)
+
+    # Cropper.js reports fractional natural pixels; clamp to the canvas
+    img_h, img_w = img.shape[:2]
+    x, y, width, height = box
+    x0, y0 = min(max(0, round(x)), img_w), min(max(0, round(y)), img_h)
+    x1, y1 = min(max(0, round(x + width)), img_w), min(max(0, round(y + height)), img_h)
+    if x1 <= x0 or y1 <= y0:
+        return error_response("Crop box lies outside the image", filename)
+
+    output_bytes = crop_and_overwrite(img, output_path, x0, y0, x1 - x0, y1 - y0, timer, encoding)
+    if not output_bytes:
+        return error_response("Failed to save cropped image", filename)
+
+    return {
+        'x': x0, 'y': y0, 'w': x1 - x0, 'h': y1 - y0,
+        'status': 'Cropped from Coordinates',
+        'saved_filename': filename,
+        'output_bytes': output_bytes
+    }
+
+
+# ====================================================================
+# Warm-up
+# ====================================================================
+
+def _warm_up_sample(decoder: str, img: np.ndarray) -> bytes:
+    """`img` encoded in the format `decoder` reads."""
+    if decoder == "heic":
+        heif_file = codec_module("heic").from_bytes(mode="BGR", size=(img.shape[1], img.shape[0]), data=img.tobytes())
+        buffer = BytesIO()
+        heif_file.save(buffer, quality=50)
+        return buffer.getvalue()
+    success, encoded = cv2.imencode(DECODERS[decoder].sample_ext, img)
+    return encoded.tobytes()
+
+
+def warm_up(detection: DetectionOptions = DetectionOptions(),
+            encoding: EncodeOptions = EncodeOptions()) -> Dict[str, float]:
+    """
+    Runs a tiny synthetic receipt through every registered decoder, the
+    detector and the encoder, so codec imports and one-time library setup
+    (libheif plugins, OpenCV's thread pool, codec tables) happen before the
+    first request instead of during it. Returns milliseconds per decoder.
+    """
+    img = np.full((48, 64, 3), 40, np.uint8)
+    img[8:40, 12:52] = 255
+    timings = {}
+    for name, decoder in DECODERS.items():
+        started = time.perf_counter()
+        try:
+            codec_module(name)
+            filename = f"warm-up{decoder.sample_ext}"
+            decoded = decode_image_bytes(_warm_up_sample(name, img), filename, decoder=name)
+            detect_paper(decoded, detection)
+            encode_image(decoded, output_extension(filename, encoding), encoding)
+        except Exception as e:
+            logger.warning(f"Warm-up of decoder '{name}' failed: {e}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 3)
+    return timings
@@ -0,0 +1,238 @@
+# app/services/probe.py
+"""
+Cheap header sniffing of uploads.
+
+Reads the first PROBE_BYTES of a file: magic bytes decide the format
+(whatever the extension says) and the JPEG SOF / PNG IHDR / WebP VP8* /
+HEIF ispe / TIFF IFD headers give the pixel dimensions. When those lie
+further in (a JPEG SOF behind large APP segments, a HEIF meta box after
+mdat, a TIFF IFD after its strips), the probe says how many leading bytes
+hold them (ImageProbe.needs) so the caller can read on and probe again.
+Lets the service reject unsupported files and oversized images before
+anything is decoded.
+"""
+
+import struct
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+# Enough for a JPEG SOF behind a full EXIF APP1 segment (max 64 KiB)
+PROBE_BYTES = 64 * 1024
+# Furthest into a file its dimensions are looked for when no upload cap is set
+MAX_HEADER_BYTES = 64 * 1024 * 1024
+
+# Formats the pipeline can decode, by decoder
+OPENCV_FORMATS = ("jpeg", "png", "webp", "bmp", "tiff")
+HEIF_BRANDS = (b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"hevm", b"hevs", b"mif1", b"msf1")
+
+# JPEG start-of-frame markers (C4 = DHT, C8 = JPG extension, CC = DAC are not frames)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# JPEG markers without a length field
+JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+# TIFF ImageWidth / ImageLength tags, and the SHORT / LONG field types they come in
+TIFF_WIDTH, TIFF_HEIGHT = 256, 257
+TIFF_TYPES = {3: "H", 4: "I"}
+
+
+class ImageRejectedError(ValueError):
+    """Raised when an upload is rejected from its header, before decoding."""
+
+
+class UnsupportedImageError(ImageRejectedError):
+    def __init__(self):
+        super().__init__("Unsupported or unrecognised image format")
+
+
+class UnknownDimensionsError(ImageRejectedError):
+    def __init__(self, max_pixels: int):
+        super().__init__(f"Image dimensions could not be read from its header to check the maximum of "
+                         f"{max_pixels} pixels")
+        self.max_pixels = max_pixels
+
+
+class ImageDimensionsError(ImageRejectedError):
+    def __init__(self, width: int, height: int, max_pixels: int):
+        super().__init__(f"Image of {width}x{height} exceeds the maximum of {max_pixels} pixels")
+        self.width = width
+        self.height = height
+        self.max_pixels = max_pixels
+
+
+@dataclass(frozen=True)
+class ImageProbe:
+    format: str
+    # None when the dimensions are not within the probed bytes ...
+    width: Optional[int] = None
+    height: Optional[int] = None
+    # ... in which case these leading bytes of the file hold them (0 = not known)
+    needs: int = 0
+
+    @property
+    def decoder(self) -> str:
+        return "heic" if self.format == "heic" else "opencv"
+
+    @property
+    def pixels(self) -> Optional[int]:
+        return self.width * self.height if self.width and self.height else None
+
+
+def probe_image(head: bytes) -> ImageProbe:
+    """Identifies the image in `head` (the first bytes of the file) or raises UnsupportedImageError."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ImageProbe("jpeg", *_jpeg_size(head))
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ImageProbe("png", *_png_size(head))
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ImageProbe("webp", *_webp_size(head))
+    if head[4:8] == b"ftyp" and _is_heif(head):
+        return ImageProbe("heic", *_heif_size(head))
+    if head.startswith(b"BM") and len(head) >= 26:
+        width, height = struct.unpack("<ii", head[18:26])
+        return ImageProbe("bmp", abs(width), abs(height))
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return ImageProbe("tiff", *_tiff_size(head))
+    raise UnsupportedImageError()
+
+
+def check_pixels(probe: ImageProbe, max_pixels: int) -> None:
+    """Enforces the pixel cap; an image whose size is unknown cannot pass one."""
+    if not max_pixels:
+        return
+    if probe.pixels is None:
+        raise UnknownDimensionsError(max_pixels)
+    if probe.pixels > max_pixels:
+        raise ImageDimensionsError(probe.width, probe.height, max_pixels)
+
+
+# ====================================================================
+# Per-format Header Parsers
+# ====================================================================
+
+NO_SIZE: Tuple[None, None] = (None, None)
+# (width, height, leading bytes that hold them when they are beyond `head`)
+Size = Tuple[Optional[int], Optional[int], int]
+
+
+def _jpeg_size(head: bytes) -> Size:
+    """Walks the segment lengths up to the SOF, however far the APPn segments push it."""
+    i = 2
+    while i + 4 <= len(head):
+        if head[i] != 0xFF:
+            return (*NO_SIZE, 0)
+        marker = head[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker == 0xDA:  # Start of scan: no frame header seen
+            return (*NO_SIZE, 0)
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(head):
+                return (*NO_SIZE, i + 9)
+            height, width = struct.unpack(">HH", head[i + 5:i + 9])
+            return width, height, 0
+        i += 2 + struct.unpack(">H", head[i + 2:i + 4])[0]
+    return (*NO_SIZE, i + 4)
+
+
+def _png_size(head: bytes) -> Tuple[Optional[int], Optional[int]]:
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return NO_SIZE
+    return struct.unpack(">II", head[16:24])
+
+
+def _webp_size(head: bytes) -> Tuple[Optional[int], Optional[int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        return int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1
+    return NO_SIZE
+
+
+def _boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload start, box end) of the ISO-BMFF boxes in data[start:end]."""
+    i = start
+    while i + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[i:i + 8])
+        header = 8
+        if size == 1 and i + 16 <= end:
+            size = struct.unpack(">Q", data[i + 8:i + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - i
+        if size < header:
+            return
+        yield box_type, i + header, min(i + size, end)
+        i += size
+
+
+def _is_heif(head: bytes) -> bool:
+    size = struct.unpack(">I", head[:4])[0]
+    brands = head[8:12] + head[16:min(size, len(head))]
+    return any(brands[j:j + 4] in HEIF_BRANDS for j in range(0, len(brands) - 3, 4))
+
+
+def _heif_size(head: bytes) -> Size:
+    """Largest `ispe` property: the primary image (or its grid) rather than a tile or thumbnail."""
+    meta_end = _heif_meta_end(head)
+    if meta_end > len(head):
+        return (*NO_SIZE, meta_end)
+    best = NO_SIZE
+    for box_type, start, end in _boxes(head, 0, len(head)):
+        if box_type != b"meta":
+            continue
+        # meta is a full box: 4 bytes of version/flags before its children
+        for child, child_start, child_end in _boxes(head, start + 4, end):
+            if child != b"iprp":
+                continue
+            for container, ipco_start, ipco_end in _boxes(head, child_start, child_end):
+                if container != b"ipco":
+                    continue
+                for prop, prop_start, prop_end in _boxes(head, ipco_start, ipco_end):
+                    if prop == b"ispe" and prop_start + 12 <= prop_end:
+                        width, height = struct.unpack(">II", head[prop_start + 4:prop_start + 12])
+                        if best[0] is None or width * height > best[0] * best[1]:
+                            best = (width, height)
+    return (*best, 0)
+
+
+def _heif_meta_end(head: bytes) -> int:
+    """End offset of the top-level meta box (it may follow mdat), as far as `head` tells."""
+    i = 0
+    while i + 16 <= len(head):
+        size, box_type = struct.unpack(">I4s", head[i:i + 8])
+        if size == 1:
+            size = struct.unpack(">Q", head[i + 8:i + 16])[0]
+        if size < 8:
+            # size 0 runs to the end of the file; either way there is nothing after it
+            return 0
+        if box_type == b"meta":
+            return i + size
+        i += size
+    return i + 16
+
+
+def _tiff_size(head: bytes) -> Size:
+    """ImageWidth / ImageLength from the first IFD, which writers often put after the strips."""
+    order = "<" if head[:2] == b"II" else ">"
+    if len(head) < 8:
+        return (*NO_SIZE, 8)
+    ifd = struct.unpack(order + "I", head[4:8])[0]
+    if ifd + 2 > len(head):
+        return (*NO_SIZE, ifd + 2)
+    entries_end = ifd + 2 + 12 * struct.unpack(order + "H", head[ifd:ifd + 2])[0]
+    if entries_end > len(head):
+        return (*NO_SIZE, entries_end)
+    fields = {}
+    for i in range(ifd + 2, entries_end, 12):
+        tag, field_type = struct.unpack(order + "HH", head[i:i + 4])
+        if tag in (TIFF_WIDTH, TIFF_HEIGHT) and field_type in TIFF_TYPES:
+            fields[tag] = struct.unpack_from(order + TIFF_TYPES[field_type], head, i + 8)[0]
+    return fields.get(TIFF_WIDTH), fields.get(TIFF_HEIGHT), 0
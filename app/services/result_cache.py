@@ -0,0 +1,228 @@
+# app/services/result_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# A temporary file this old is left over from an interrupted write, not one in progress
+STALE_TMP_SECONDS = 60
+
+
+def make_key(content_digest: str, params: Any) -> str:
+    """
+    Cache key for one upload processed with one set of detector parameters.
+    `params` must have a stable repr (e.g. the frozen DetectionOptions).
+    """
+    return hashlib.sha256(f"{content_digest}|{params!r}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of pipeline results keyed by make_key().
+
+    - Memory tier: LRU bounded to `max_entries` entries and `max_bytes`
+      (each entry's size estimated as its JSON length; a multi-receipt
+      result is several times a single one); the least recently used entry
+      is evicted first.
+    - Disk tier (optional): one small JSON file per key under `disk_dir`,
+      so results survive restarts. Disk hits are promoted to memory. Bounded
+      to `max_disk_entries` files, least recently used first (file mtimes
+      carry the order across restarts). The bound is per process when
+      several share the directory.
+
+    Values are the plain result dicts returned by the pipeline. Disk reads
+    and writes block, so the service calls get()/put() through
+    asyncio.to_thread; the methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_dir: Optional[str] = None,
+                 max_disk_entries: int = 100_000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        # 0 leaves the memory tier bounded by max_entries alone
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._sizes: Dict[str, int] = {}
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Keys of the files in disk_dir, least recently used first
+        self._disk_keys: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str, is_valid: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Dict[str, Any]]:
+        """
+        The entry for `key`, or None. With `is_valid`, an entry it rejects
+        (e.g. its cropped file was deleted) is discarded and counted as a
+        miss, not a hit.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+        from_disk = value is None
+        if from_disk:
+            value = self._read_disk(key)
+
+        if value is not None and is_valid is not None and not is_valid(value):
+            self.discard(key)
+            with self._lock:
+                self.stale += 1
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+                self._remember(key, value)
+                self._touch_disk(key)
+        return dict(value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remember(key, dict(value))
+        if self._write_disk(key, value):
+            with self._lock:
+                self._disk_keys[key] = None
+                self._disk_keys.move_to_end(key)
+                evicted = [self._disk_keys.popitem(last=False)[0]
+                           for _ in range(len(self._disk_keys) - max(self.max_disk_entries, 0))]
+                self.disk_evictions += len(evicted)
+            for old_key in evicted:
+                self._remove_disk(old_key)
+
+    def discard(self, key: str) -> None:
+        """Drops a stale entry (e.g. its cropped file was deleted)."""
+        with self._lock:
+            self._forget(key)
+            self._disk_keys.pop(key, None)
+        if self.disk_dir:
+            self._remove_disk(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'disk_tier': bool(self.disk_dir),
+                'disk_entries': len(self._disk_keys),
+                'max_disk_entries': self.max_disk_entries,
+                'disk_evictions': self.disk_evictions,
+            }
+
+    # ==========================================
+    # Internal Helper Methods
+    # ==========================================
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        # Called with self._lock held
+        if self.max_entries <= 0:
+            return
+        size = len(json.dumps(value, default=str))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self._forget(key)
+        self._entries[key] = value
+        self._sizes[key] = size
+        self.bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            self._forget(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _forget(self, key: str) -> None:
+        # Called with self._lock held
+        if self._entries.pop(key, None) is not None:
+            self.bytes -= self._sizes.pop(key)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _load_disk_index(self) -> None:
+        """Indexes the files left by earlier runs, oldest first; sweeps interrupted writes."""
+        entries = []
+        with os.scandir(self.disk_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    if time.time() - entry.stat().st_mtime > STALE_TMP_SECONDS:
+                        self._remove_path(entry.path)
+                elif entry.name.endswith(".json"):
+                    entries.append((entry.stat().st_mtime, entry.name[:-len(".json")]))
+        for _, key in sorted(entries):
+            self._disk_keys[key] = None
+        while len(self._disk_keys) > max(self.max_disk_entries, 0):
+            self._remove_disk(self._disk_keys.popitem(last=False)[0])
+            self.disk_evictions += 1
+
+    def _touch_disk(self, key: str) -> None:
+        # Called with self._lock held; the mtime keeps the LRU order for the next start
+        self._disk_keys[key] = None
+        self._disk_keys.move_to_end(key)
+        try:
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _remove_disk(self, key: str) -> None:
+        self._remove_path(self._disk_path(key))
+
+    @staticmethod
+    def _remove_path(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"ResultCache: Could not remove {path}: {e}")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"ResultCache: Ignoring unreadable disk entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, value: Dict[str, Any]) -> bool:
+        if not self.disk_dir:
+            return False
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            logger.warning(f"ResultCache: Could not persist entry {key}: {e}")
+            self._remove_path(tmp_path)
+            return False
@@ -0,0 +1,72 @@
+# app/services/scratch.py
+"""
+Per-thread scratch arrays for the detection hot loop.
+
+Thresholding and morphology each produce a full-frame mask that is thrown
+away as soon as the box is found: at 12 MP that is ~12 MB per mask, per
+request. SCRATCH hands out arrays that are kept per worker thread (and so
+per pool process) and filled through OpenCV's `dst=` arguments instead.
+A buffer grows when a larger frame arrives and is then reused for every
+frame up to that size.
+
+An array from get() is only valid until the same thread asks for the same
+name again: use it, don't keep it.
+"""
+
+import threading
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+# Larger requests get a fresh array that is not kept, so one huge upload
+# does not pin its masks in every worker for good
+MAX_SCRATCH_BYTES = 64 * 2**20
+
+
+class ScratchBuffers:
+    """Named, grow-on-demand arrays, one set per thread."""
+
+    def __init__(self, max_bytes: int = MAX_SCRATCH_BYTES):
+        self.max_bytes = max_bytes
+        # False allocates on every get() (the benchmark's --no-scratch baseline)
+        self.enabled = True
+        self.allocations = 0
+        self.reuses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def get(self, name: str, shape: Tuple[int, ...], dtype: Any = np.uint8) -> np.ndarray:
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if not self.enabled or nbytes > self.max_bytes:
+            self._count(reused=False)
+            return np.empty(shape, dtype)
+
+        buffers: Dict[str, np.ndarray] = self._local.__dict__.setdefault('buffers', {})
+        buffer = buffers.get(name)
+        reused = buffer is not None and buffer.nbytes >= nbytes
+        if not reused:
+            buffer = buffers[name] = np.empty(nbytes, np.uint8)
+        self._count(reused)
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    def thread_bytes(self) -> int:
+        """Bytes held by the calling thread."""
+        return sum(buffer.nbytes for buffer in self._local.__dict__.get('buffers', {}).values())
+
+    def release(self) -> None:
+        """Drops the calling thread's buffers."""
+        self._local.__dict__.pop('buffers', None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'allocations': self.allocations, 'reuses': self.reuses}
+
+    def _count(self, reused: bool) -> None:
+        with self._lock:
+            if reused:
+                self.reuses += 1
+            else:
+                self.allocations += 1
+
+
+SCRATCH = ScratchBuffers()
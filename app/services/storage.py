@@ -0,0 +1,316 @@
+# app/services/storage.py
+"""
+Layout, atomic writes and garbage collection of the upload directory.
+
+Files live in hash-prefix shards (root/ab/cd/name) so no single directory
+grows to hundreds of thousands of entries. The shard is derived from the
+name's stem without extension, `_original` or `_region<n>` suffix: an
+original and its crops (in whatever output format) share a shard, and a
+file's path is computed, never searched for.
+
+Every file written through the store is recorded in a small SQLite index
+(name, size, time) beside the shards. record() and remove() only queue
+the change in memory; flush_periodically() applies the queue in one
+transaction every few seconds, so requests never wait on SQLite or on a
+collection pass. The collector evicts files past `max_age_seconds`, then
+the oldest until the total is under `max_bytes`, working from the index
+alone: a collection pass never lists a directory. Files from before
+sharding (flat in root) are still found, but are not indexed and never
+collected.
+
+Temporary files of writes interrupted by a crash are not in the index;
+sweep_temporary_files() walks the shards for them once per start, on a
+thread.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hex characters per shard level: 2 levels of 2 = 65536 directories
+SHARD_WIDTH = 2
+ORIGINAL_SUFFIX = "_original"
+# Crops of the 2nd, 3rd, ... receipt of a multi-receipt photo
+REGION_SUFFIX = re.compile(r"_region\d+$")
+INDEX_NAME = ".index.sqlite3"
+TMP_SUFFIX = ".tmp"
+# A temporary file untouched this long belongs to a write that died with its process
+STALE_TMP_SECONDS = 600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_age ON files (created_at);
+"""
+
+
+def shard_key(filename: str) -> str:
+    filename = os.path.basename(filename)
+    if filename.endswith(TMP_SUFFIX):
+        # name.ext.<random>.tmp lives beside name.ext
+        filename = filename.rsplit(".", 2)[0]
+    stem = os.path.splitext(filename)[0]
+    if stem.endswith(ORIGINAL_SUFFIX):
+        return stem[:-len(ORIGINAL_SUFFIX)]
+    return REGION_SUFFIX.sub("", stem)
+
+
+def region_filename(filename: str, number: int) -> str:
+    """Name of the crop of region `number` (1 = the largest, which keeps `filename`)."""
+    if number == 1:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}_region{number}{ext}"
+
+
+def temporary_path(path: str) -> str:
+    """Where a write of `path` goes before it is renamed into place (same shard)."""
+    return f"{path}.{uuid.uuid4().hex[:8]}{TMP_SUFFIX}"
+
+
+def atomic_write(path: str, data) -> None:
+    """Writes to a temporary file beside `path` and renames it into place, so readers never see a partial file."""
+    tmp_path = temporary_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class UploadStore:
+    """
+    Sharded, indexed upload directory. `shard_depth=0, indexed=False` is the
+    original flat, unmanaged layout. record() and remove() never touch the
+    index; flush(), collect(), stats() and sweep_temporary_files() block and
+    are run through asyncio.to_thread from the event loop.
+    """
+
+    def __init__(self, root: str, shard_depth: int = 2, indexed: bool = True,
+                 max_age_seconds: float = 0.0, max_bytes: int = 0):
+        self.root = root
+        self.shard_depth = shard_depth
+        self.indexed = indexed
+        # 0 disables each eviction rule
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self._made_dirs: Set[str] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # (name, size, created_at) to upsert, or (name, None, None) to delete, in order
+        self._pending: List[Tuple[str, Optional[int], Optional[float]]] = []
+        self._pending_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    # ==========================================
+    # Layout
+    # ==========================================
+
+    def dir_for(self, filename: str) -> str:
+        """Shard directory of `filename`, created on first use."""
+        if not self.shard_depth:
+            return self.root
+        digest = hashlib.sha1(shard_key(filename).encode()).hexdigest()
+        parts = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(self.shard_depth)]
+        directory = os.path.join(self.root, *parts)
+        if directory not in self._made_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._made_dirs.add(directory)
+        return directory
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.dir_for(filename), filename)
+
+    def find(self, filename: str) -> Optional[str]:
+        """Path of an existing file: its shard, else the flat pre-sharding location."""
+        path = self.path_for(filename)
+        if os.path.isfile(path):
+            return path
+        legacy_path = os.path.join(self.root, filename)
+        return legacy_path if self.shard_depth and os.path.isfile(legacy_path) else None
+
+    # ==========================================
+    # Writes and Index
+    # ==========================================
+
+    def write(self, filename: str, data: bytes) -> str:
+        path = self.path_for(filename)
+        atomic_write(path, data)
+        self.record(filename, len(data))
+        return path
+
+    def record(self, filename: str, size: int) -> None:
+        """Adds a file written outside write() (streamed uploads, crops from the worker pool). Queued only."""
+        if self.indexed:
+            with self._pending_lock:
+                self._pending.append((filename, size, time.time()))
+
+    def remove(self, filename: str) -> None:
+        """Deletes the file (blocking) and queues its removal from the index."""
+        path = self.find(filename)
+        if path is not None:
+            os.remove(path)
+        if self.indexed:
+            with self._pending_lock:
+                self._pending.append((filename, None, None))
+
+    def flush(self) -> int:
+        """Applies every queued record/remove in one transaction. Returns how many were applied."""
+        with self._pending_lock:
+            changes, self._pending = self._pending, []
+        if not changes:
+            return 0
+        try:
+            with self._lock:
+                conn = self.conn
+                conn.execute("BEGIN")
+                try:
+                    for name, size, created_at in changes:
+                        if size is None:
+                            conn.execute("DELETE FROM files WHERE name = ?", (name,))
+                        else:
+                            conn.execute("INSERT OR REPLACE INTO files (name, size, created_at) VALUES (?, ?, ?)",
+                                         (name, size, created_at))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except BaseException:
+            # Put the batch back in front of anything queued meanwhile
+            with self._pending_lock:
+                self._pending[:0] = changes
+            raise
+        return len(changes)
+
+    async def flush_periodically(self, interval_seconds: float) -> None:
+        """Runs flush() every `interval_seconds` until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error(f"UploadStore: Index flush failed: {e}", exc_info=True)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened lazily; the index is the only thing read at startup
+        if self._conn is None:
+            conn = sqlite3.connect(os.path.join(self.root, INDEX_NAME), check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    # ==========================================
+    # Garbage Collection
+    # ==========================================
+
+    def collect(self, now: Optional[float] = None) -> Dict[str, int]:
+        """One eviction pass: expired files, then oldest-first down to max_bytes."""
+        if not self.indexed or not (self.max_age_seconds or self.max_bytes):
+            return {'files': 0, 'bytes': 0}
+        now = time.time() if now is None else now
+        self.flush()
+        with self._lock:
+            victims = []
+            if self.max_age_seconds:
+                victims = self.conn.execute("SELECT name, size FROM files WHERE created_at < ? ORDER BY created_at",
+                                            (now - self.max_age_seconds,)).fetchall()
+            if self.max_bytes:
+                excess = self._total_bytes() - sum(size for _, size in victims) - self.max_bytes
+                if excess > 0:
+                    expired = {name for name, _ in victims}
+                    for name, size in self.conn.execute("SELECT name, size FROM files ORDER BY created_at"):
+                        if excess <= 0:
+                            break
+                        if name not in expired:
+                            victims.append((name, size))
+                            excess -= size
+            self.conn.executemany("DELETE FROM files WHERE name = ?", [(name,) for name, _ in victims])
+
+        for name, _ in victims:
+            try:
+                os.remove(self.path_for(name))
+            except FileNotFoundError:
+                pass
+        freed = sum(size for _, size in victims)
+        self.evicted += len(victims)
+        self.evicted_bytes += freed
+        if victims:
+            logger.info(f"UploadStore: Evicted {len(victims)} files ({freed} bytes)")
+        return {'files': len(victims), 'bytes': freed}
+
+    async def collect_periodically(self, interval_seconds: float) -> None:
+        """Runs collect() every `interval_seconds` until cancelled."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.collect)
+            except Exception as e:
+                logger.error(f"UploadStore: Collection failed: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            'root': self.root,
+            'shard_depth': self.shard_depth,
+            'indexed': self.indexed,
+            'max_age_seconds': self.max_age_seconds,
+            'max_bytes': self.max_bytes,
+            'evicted': self.evicted,
+            'evicted_bytes': self.evicted_bytes,
+        }
+        if self.indexed:
+            self.flush()
+            with self._lock:
+                stats['files'] = self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                stats['bytes'] = self._total_bytes()
+        return stats
+
+    def sweep_temporary_files(self, now: Optional[float] = None) -> int:
+        """Deletes temporary files left by interrupted writes. Lists every shard: run it once, on a thread."""
+        now = time.time() if now is None else now
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(TMP_SUFFIX):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if now - os.stat(path).st_mtime > STALE_TMP_SECONDS:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass  # Renamed into place or removed meanwhile
+        if removed:
+            logger.info(f"UploadStore: Removed {removed} temporary files of interrupted writes")
+        return removed
+
+    def close(self) -> None:
+        if self.indexed:
+            self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _total_bytes(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
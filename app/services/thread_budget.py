@@ -0,0 +1,97 @@
+# app/services/thread_budget.py
+"""
+One core budget for the whole server.
+
+Uvicorn workers, the processing pool of each worker and OpenCV's internal
+thread pool all multiply: 4 web workers x 8 pool threads x 8 OpenCV
+threads is 256 runnable threads on an 8-core box. plan_threads() splits a
+budget of cores so that web_workers x pool_size x opencv_threads stays
+within it, and apply_opencv_threads() enforces the OpenCV part in every
+process that runs the pipeline.
+"""
+
+import logging
+import math
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Dict
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Auto mode gives each uvicorn worker at least this many pool threads
+MIN_THREADS_PER_WEB_WORKER = 4
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cores() -> int:
+    """Cores this process may use: its CPU affinity, capped by a cgroup (container) CPU quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS / Windows
+        cores = os.cpu_count() or 1
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+@dataclass(frozen=True)
+class ThreadLayout:
+    cores: int
+    web_workers: int
+    pool_kind: str
+    # Per web worker
+    pool_size: int
+    # Per pipeline process; -1 leaves OpenCV's default
+    opencv_threads: int
+
+    @property
+    def threads(self) -> int:
+        """Compute threads the layout can run at once."""
+        return self.web_workers * self.pool_size * max(1, self.opencv_threads)
+
+    def report(self) -> str:
+        opencv = "default" if self.opencv_threads < 0 else str(self.opencv_threads)
+        line = (f"Thread layout: {self.cores} cores -> {self.web_workers} web workers x "
+                f"{self.pool_size} {self.pool_kind}-pool workers x {opencv} OpenCV threads = {self.threads} threads")
+        if self.threads > self.cores:
+            line += f" (oversubscribed {self.threads / self.cores:.1f}x)"
+        return line
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), 'threads': self.threads}
+
+
+def plan_threads(cores: int = 0, web_workers: int = 0, pool_kind: str = "thread", pool_size: int = 0,
+                 opencv_threads: int = 0) -> ThreadLayout:
+    """
+    Splits `cores` (0 = available_cores()) across the three levels. Each 0
+    is derived from the budget; explicit values are kept as given, and the
+    report flags a layout that ends up oversubscribed.
+
+    - web_workers:    1 per MIN_THREADS_PER_WEB_WORKER cores for a thread
+                      pool (request parsing holds the GIL); 1 for a process
+                      pool, which is parallel already.
+    - pool_size:      the cores left per web worker.
+    - opencv_threads: the cores left per pool worker, usually 1.
+    """
+    cores = cores if cores > 0 else available_cores()
+    if web_workers <= 0:
+        web_workers = max(1, cores // MIN_THREADS_PER_WEB_WORKER) if pool_kind == "thread" else 1
+    if pool_size <= 0:
+        pool_size = max(1, cores // web_workers)
+    if opencv_threads == 0:
+        opencv_threads = max(1, cores // (web_workers * pool_size))
+    return ThreadLayout(cores, web_workers, pool_kind, pool_size, opencv_threads)
+
+
+def apply_opencv_threads(threads: int) -> None:
+    """Sets OpenCV's thread count for this process. Also the process-pool initializer."""
+    if threads >= 0:
+        cv2.setNumThreads(threads)
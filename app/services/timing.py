@@ -0,0 +1,33 @@
+# app/services/timing.py
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class StageTimer:
+    """
+    Accumulates wall-clock milliseconds per named pipeline stage.
+
+    The pipeline functions take an optional timer and return `timings` in
+    their result dicts, so stage timings survive the trip back from a
+    process pool. Subclasses can override `stage` to record more than time
+    (the benchmark also tracks peak memory per stage).
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed_ms
+
+    def rounded(self, digits: int = 3) -> Dict[str, float]:
+        return {name: round(ms, digits) for name, ms in self.timings.items()}
@@ -0,0 +1,79 @@
+# app/services/worker_pool.py
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from app.services.thread_budget import available_cores
+
+logger = logging.getLogger(__name__)
+
+POOL_KINDS = ("thread", "process")
+
+
+def _default_pool_size() -> int:
+    """Number of cores this process is allowed to run on."""
+    return available_cores()
+
+
+class WorkerPool:
+    """
+    Runs the CPU-bound stages of the image pipeline (decode, threshold,
+    contours, encode) off the event loop.
+
+    Callables submitted to a "process" pool must be picklable, i.e. module
+    level functions taking plain arguments (paths, bytes, tuples).
+    `initializer(*initargs)` runs once in each worker process (e.g. to set
+    OpenCV's thread count, which does not carry over to spawned processes).
+    """
+
+    def __init__(self, kind: str = "thread", size: int = 0,
+                 initializer: Optional[Callable[..., None]] = None, initargs: Tuple[Any, ...] = ()):
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown worker pool kind '{kind}'. Expected one of {POOL_KINDS}.")
+        self.kind = kind
+        self.size = size if size > 0 else _default_pool_size()
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor: Optional[Executor] = None
+        # Jobs submitted through run() that have not finished yet
+        self.pending = 0
+
+    @property
+    def executor(self) -> Executor:
+        # Created lazily so that importing the app never forks or spawns threads.
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.size, initializer=self.initializer,
+                                                     initargs=self.initargs)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="image-worker")
+            logger.info(f"WorkerPool started: kind={self.kind}, size={self.size}")
+        return self._executor
+
+    @property
+    def busy(self) -> int:
+        """Jobs currently occupying a worker."""
+        return min(self.pending, self.size)
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker."""
+        return max(0, self.pending - self.size)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs fn(*args, **kwargs) in the pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logger.info("WorkerPool shut down.")
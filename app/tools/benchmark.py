@@ -0,0 +1,405 @@
+# app/tools/benchmark.py
+"""
+Benchmark of the real cropping pipeline over a directory of photos
+(by default the `inputs/` corpus: HEIC set plus invoice*.jpeg/png).
+
+    python -m app.tools.benchmark --output bench.json
+    python -m app.tools.benchmark --save-baseline benchmarks/baseline.json
+    python -m app.tools.benchmark --baseline benchmarks/baseline.json --threshold 0.15
+
+Reports, per stage (decode, threshold, morphology, contours, crop, encode,
+write, plus resize/refine in downscale mode): p50/p95/p99/mean latency, peak
+traced memory and the median traced allocation per call (steady state, once
+scratch buffers are warm). Overall: throughput, peak RSS, decoded pixel bytes
+per image (--detection-mode thumbnail shows the HEIC savings) and how many
+detection scratch arrays were allocated vs reused (--no-scratch allocates
+every time, i.e. the behaviour before scratch.py). With --baseline, any stage
+whose chosen percentile got slower by more than --threshold fails the run
+with exit code 1, and peak RSS and allocations are shown before -> after.
+
+    python -m app.tools.benchmark --ingest
+
+compares the two upload endpoints instead: the same files posted as
+multipart/form-data to /api/process_image/ and as a raw body to
+/api/process_image/raw, through the ASGI app in-process. Per path: request
+latency, the server's upload_read stage and the peak traced allocation per
+request; the peak difference divided by the mean file size is the number of
+extra full copies of the upload the multipart path makes.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+from app.services import pipeline
+from app.services.pipeline import DetectionOptions, DETECTION_MODES
+from app.services.detectors import DETECTORS
+from app.services.scratch import SCRATCH
+from app.services.timing import StageTimer
+from app.tools.crop_directory import iter_images
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+# Stages faster than this are too noisy to gate on
+NOISE_FLOOR_MS = 0.5
+# Request body chunk size fed to the app, like a socket read
+INGEST_CHUNK_BYTES = 64 * 1024
+
+
+class MemoryStageTimer(StageTimer):
+    """StageTimer that also records the peak traced allocation of each stage."""
+
+    def __init__(self):
+        super().__init__()
+        self.peak_bytes: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if not tracemalloc.is_tracing():
+            with super().stage(name):
+                yield
+            return
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        with super().stage(name):
+            yield
+        peak = tracemalloc.get_traced_memory()[1] - before
+        self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples, dtype=np.float64)
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary['mean'] = round(float(values.mean()), 3)
+    summary['count'] = len(samples)
+    return summary
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def load_corpus(input_dir: str, limit: int = 0) -> Dict[str, bytes]:
+    """The bytes of the first `limit` (0 = all) images under input_dir, by relative path."""
+    paths = list(iter_images(input_dir))[:limit or None]
+    if not paths:
+        raise ValueError(f"No images found under {input_dir}")
+    return {path: Path(input_dir, path).read_bytes() for path in paths}
+
+
+def run_benchmark(input_dir: str, repeat: int = 3, detection: DetectionOptions = DetectionOptions(),
+                  track_memory: bool = True, limit: int = 0) -> Dict[str, Any]:
+    """Runs every image `repeat` times through the in-memory pipeline."""
+    corpus = load_corpus(input_dir, limit)
+
+    stage_samples: Dict[str, List[float]] = {}
+    stage_peaks: Dict[str, List[int]] = {}
+    totals: List[float] = []
+    decode_bytes: List[float] = []
+    failures = 0
+
+    scratch_before = SCRATCH.stats()
+    if track_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as out_dir:
+        for _ in range(repeat):
+            for path, data in corpus.items():
+                timer = MemoryStageTimer()
+                result = pipeline.crop_image_bytes(data, os.path.basename(path), out_dir, detection, timer)
+                if result['status'].startswith("Error"):
+                    failures += 1
+                for stage, ms in timer.timings.items():
+                    stage_samples.setdefault(stage, []).append(ms)
+                for stage, peak in timer.peak_bytes.items():
+                    stage_peaks.setdefault(stage, []).append(peak)
+                totals.append(sum(timer.timings.values()))
+                decode_bytes.append(result.get('decode_bytes', 0))
+    elapsed = time.perf_counter() - started
+    if track_memory:
+        tracemalloc.stop()
+
+    stages = {}
+    for stage, samples in stage_samples.items():
+        stages[stage] = summarize(samples)
+        if stage in stage_peaks:
+            stages[stage]['peak_bytes'] = max(stage_peaks[stage])
+            stages[stage]['alloc_bytes'] = int(np.median(stage_peaks[stage]))
+    scratch = {name: count - scratch_before[name] for name, count in SCRATCH.stats().items()}
+
+    return {
+        'input_dir': input_dir,
+        'images': len(corpus),
+        'repeat': repeat,
+        'detection': {'mode': detection.mode, 'max_side': detection.max_side,
+                      'scale': detection.scale, 'refine': detection.refine, 'engine': detection.engine},
+        'failures': failures,
+        'throughput_images_per_s': round(len(totals) / elapsed, 3),
+        'total': summarize(totals),
+        'decode_bytes': summarize(decode_bytes),
+        'stages': stages,
+        'scratch': {**scratch, 'enabled': SCRATCH.enabled,
+                    'allocations_per_image': round(scratch['allocations'] / len(totals), 3)},
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def multipart_body(filename: str, data: bytes) -> Tuple[bytes, str]:
+    boundary = "benchmark-boundary"
+    body = b"".join([
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n".encode(),
+        data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def body_chunks(body: bytes) -> List[bytes]:
+    return [body[i:i + INGEST_CHUNK_BYTES] for i in range(0, len(body), INGEST_CHUNK_BYTES)] or [b""]
+
+
+async def asgi_post(app, path: str, headers: Dict[str, str], chunks: List[bytes]) -> Tuple[int, Dict[str, str]]:
+    """
+    One POST straight into the ASGI app, the body given as socket-sized
+    chunks prepared beforehand. No HTTP client in the loop, so traced
+    allocations are the server's own.
+    """
+    body_size = sum(len(chunk) for chunk in chunks)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(k.lower().encode(), v.encode()) for k, v in {**headers, 'content-length': str(body_size)}.items()],
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    pending = list(chunks)
+    status = 0
+    response_headers: Dict[str, str] = {}
+
+    async def receive():
+        if pending:
+            chunk = pending.pop(0)
+            return {'type': 'http.request', 'body': chunk, 'more_body': bool(pending)}
+        await asyncio.Event().wait()  # Body done: block until the app stops listening
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+            response_headers.update((k.decode(), v.decode()) for k, v in message['headers'])
+
+    await app(scope, receive, send)
+    return status, response_headers
+
+
+async def _run_ingest(app, corpus: Dict[str, bytes], repeat: int) -> Dict[str, Dict[str, List[float]]]:
+    from app.tools.loadtest import parse_server_timing
+
+    requests = {}
+    for path, data in corpus.items():
+        filename = os.path.basename(path)
+        body, content_type = multipart_body(filename, data)
+        requests[path] = {
+            'multipart': ("/api/process_image/", {'content-type': content_type}, body_chunks(body)),
+            'raw': ("/api/process_image/raw",
+                    {'content-type': 'application/octet-stream', 'x-filename': quote(filename)}, body_chunks(data)),
+        }
+
+    samples: Dict[str, Dict[str, List[float]]] = {
+        kind: {'latency': [], 'upload_read': [], 'peak_bytes': [], 'failures': []} for kind in ("multipart", "raw")}
+    # Unmeasured first pass: imports, pool threads, and a cached result for every file
+    for request in requests.values():
+        for path, headers, chunks in request.values():
+            await asgi_post(app, path, headers, chunks)
+
+    tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            for request in requests.values():
+                for kind, (path, headers, chunks) in request.items():
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    started = time.perf_counter()
+                    status, response_headers = await asgi_post(app, path, headers, chunks)
+                    samples[kind]['latency'].append((time.perf_counter() - started) * 1000)
+                    samples[kind]['peak_bytes'].append(tracemalloc.get_traced_memory()[1] - before)
+                    timings = parse_server_timing(response_headers.get('server-timing', ''))
+                    samples[kind]['upload_read'].append(timings.get('upload_read', 0.0))
+                    samples[kind]['failures'].append(status != 200)
+    finally:
+        tracemalloc.stop()
+    return samples
+
+
+def run_ingest_benchmark(input_dir: str, repeat: int = 3, limit: int = 0) -> Dict[str, Any]:
+    """
+    Posts every image `repeat` times to both upload endpoints of the
+    in-process app. The service runs in memory mode, keeps no originals and
+    has a result cache primed by a first pass, so a measured request is the
+    ingestion alone: body transfer, parsing, buffering and hashing.
+    """
+    from app import main as app_main
+    from app.services.image_service import ImageService
+    from app.services.result_cache import ResultCache
+
+    corpus = load_corpus(input_dir, limit)
+    mean_size = sum(len(data) for data in corpus.values()) / len(corpus)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        service = ImageService(upload_dir=out_dir, pipeline_mode="memory", persist_originals="off",
+                               result_cache=ResultCache())
+        app_main.app.dependency_overrides[app_main.get_image_service] = lambda: service
+        try:
+            samples = asyncio.run(_run_ingest(app_main.app, corpus, repeat))
+        finally:
+            app_main.app.dependency_overrides.pop(app_main.get_image_service, None)
+            service.shutdown()
+
+    paths_report = {}
+    for kind, values in samples.items():
+        paths_report[kind] = {
+            'latency': summarize(values['latency']),
+            'upload_read': summarize(values['upload_read']),
+            'peak_bytes': summarize(values['peak_bytes']),
+            'failures': sum(values['failures']),
+        }
+    extra_bytes = paths_report['multipart']['peak_bytes']['mean'] - paths_report['raw']['peak_bytes']['mean']
+    return {
+        'input_dir': input_dir,
+        'images': len(corpus),
+        'repeat': repeat,
+        'mean_file_bytes': round(mean_size),
+        'paths': paths_report,
+        'extra_copies': round(extra_bytes / mean_size, 2),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def format_ingest_report(report: Dict[str, Any]) -> str:
+    lines = [f"{report['images']} images x {report['repeat']} runs, mean file "
+             f"{report['mean_file_bytes'] / 2**20:.2f} MiB: multipart makes "
+             f"{report['extra_copies']} more copies of the upload than raw",
+             f"{'path':<12}{'p50 ms':>10}{'p95 ms':>10}{'read ms':>10}{'peak MiB':>10}{'failed':>8}"]
+    for kind, s in report['paths'].items():
+        lines.append(f"{kind:<12}{s['latency']['p50']:>10.2f}{s['latency']['p95']:>10.2f}"
+                     f"{s['upload_read']['p50']:>10.2f}{s['peak_bytes']['mean'] / 2**20:>10.2f}{s['failures']:>8}")
+    return "\n".join(lines)
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any],
+                        threshold: float = 0.10, metric: str = "p50") -> List[str]:
+    """Returns a human-readable line per regression beyond `threshold`."""
+    regressions = []
+    for stage, base in baseline.get('stages', {}).items():
+        now = current['stages'].get(stage)
+        if now is None or base[metric] < NOISE_FLOOR_MS:
+            continue
+        if now[metric] > base[metric] * (1 + threshold):
+            change = (now[metric] / base[metric] - 1) * 100
+            regressions.append(f"{stage} {metric}: {base[metric]:.2f} ms -> {now[metric]:.2f} ms (+{change:.1f}%)")
+
+    base_rate = baseline.get('throughput_images_per_s')
+    if base_rate and current['throughput_images_per_s'] < base_rate * (1 - threshold):
+        regressions.append(f"throughput: {base_rate:.2f} -> {current['throughput_images_per_s']:.2f} images/s")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    scratch = report['scratch']
+    lines = [f"{report['images']} images x {report['repeat']} runs, mode={report['detection']['mode']}, "
+             f"detector={report['detection']['engine']}: "
+             f"{report['throughput_images_per_s']} images/s, peak RSS {report['peak_rss_bytes'] / 2**20:.1f} MiB, "
+             f"decoded {report['decode_bytes']['mean'] / 2**20:.1f} MiB/image",
+             f"scratch {'on' if scratch['enabled'] else 'off'}: {scratch['allocations']} arrays allocated, "
+             f"{scratch['reuses']} reused ({scratch['allocations_per_image']} allocations/image)",
+             f"{'stage':<12}{'p50':>10}{'p95':>10}{'p99':>10}{'peak MiB':>10}{'alloc MiB':>10}"]
+    for stage, s in list(report['stages'].items()) + [('total', report['total'])]:
+        peak = f"{s['peak_bytes'] / 2**20:.1f}" if 'peak_bytes' in s else "-"
+        alloc = f"{s['alloc_bytes'] / 2**20:.1f}" if 'alloc_bytes' in s else "-"
+        lines.append(f"{stage:<12}{s['p50']:>10.2f}{s['p95']:>10.2f}{s['p99']:>10.2f}{peak:>10}{alloc:>10}")
+    return "\n".join(lines)
+
+
+def format_memory_comparison(current: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """Peak RSS, allocations and per-stage allocation, baseline -> current. Informational, never fails the run."""
+    lines = [f"peak RSS: {baseline.get('peak_rss_bytes', 0) / 2**20:.1f} -> "
+             f"{current['peak_rss_bytes'] / 2**20:.1f} MiB"]
+    if 'scratch' in baseline:
+        lines.append(f"scratch allocations/image: {baseline['scratch']['allocations_per_image']} -> "
+                     f"{current['scratch']['allocations_per_image']}")
+    for stage, now in current['stages'].items():
+        base = baseline.get('stages', {}).get(stage, {})
+        if 'alloc_bytes' in base and 'alloc_bytes' in now:
+            lines.append(f"{stage} alloc: {base['alloc_bytes'] / 2**20:.1f} -> {now['alloc_bytes'] / 2**20:.1f} MiB")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the cropping pipeline per stage.")
+    parser.add_argument("--inputs", default="inputs", help="Directory of sample photos")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N images")
+    parser.add_argument("--detection-mode", choices=DETECTION_MODES, default="full")
+    parser.add_argument("--detector", choices=tuple(DETECTORS), default="contour")
+    parser.add_argument("--max-side", type=int, default=1024)
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (lower overhead)")
+    parser.add_argument("--no-scratch", action="store_true",
+                        help="Allocate detection masks per call instead of reusing scratch buffers")
+    parser.add_argument("--ingest", action="store_true",
+                        help="Compare the multipart and raw-body upload endpoints instead")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--save-baseline", help="Write the JSON report as the new baseline")
+    parser.add_argument("--baseline", help="Compare against this stored report")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown, e.g. 0.10 = 10%%")
+    parser.add_argument("--metric", choices=[f"p{p}" for p in PERCENTILES] + ["mean"], default="p50")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.ingest:
+        report = run_ingest_benchmark(args.inputs, args.repeat, args.limit)
+        print(format_ingest_report(report))
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    SCRATCH.enabled = not args.no_scratch
+    detection = DetectionOptions(mode=args.detection_mode, max_side=args.max_side, engine=args.detector)
+    report = run_benchmark(args.inputs, args.repeat, detection, not args.no_memory, args.limit)
+    print(format_report(report))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(format_memory_comparison(report, baseline))
+        regressions = compare_to_baseline(report, baseline, args.threshold, args.metric)
+        if regressions:
+            print("PERFORMANCE REGRESSION:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
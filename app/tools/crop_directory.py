@@ -0,0 +1,208 @@
+# app/tools/crop_directory.py
+"""
+Offline bulk cropper: walks a directory tree of receipt photos, crops each one
+with the same pipeline as the HTTP service and writes the crops plus a
+manifest to an output directory.
+
+    python -m app.tools.crop_directory inputs/ crops/ --workers 8
+
+The manifest (manifest.jsonl in the output directory) gets one JSON line per
+source file as soon as it finishes, so an interrupted run resumes where it
+stopped: files already listed are skipped on the next run.
+
+Crops mirror the source tree under the output format's extension, so
+`a.heic` and `a.jpg` in one directory would both write `a.jpg`: the second
+one is recorded as an error instead of overwriting the first.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from app.services import pipeline
+from app.services.pipeline import DetectionOptions, DETECTION_MODES
+from app.services.detectors import DETECTORS
+from app.services.encoder import EncodeOptions, OUTPUT_FORMATS
+from app.services.thread_budget import apply_opencv_threads, plan_threads
+from app.services.worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp') + pipeline.HEIC_EXTENSIONS
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def iter_images(input_dir: str, exclude_dir: Optional[str] = None) -> Iterator[str]:
+    """Yields image paths relative to input_dir, in a stable order."""
+    exclude_dir = os.path.abspath(exclude_dir) if exclude_dir else None
+    for root, dirs, files in os.walk(input_dir):
+        # Never descend into our own output when it lives inside the input tree
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != exclude_dir)
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, name), input_dir)
+
+
+def load_manifest(path: str, retry_failed: bool = False) -> Set[str]:
+    """Sources already recorded in the manifest (optionally ignoring failures)."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if retry_failed and entry.get('status', '').startswith("Error"):
+                continue
+            done.add(entry['source'])
+    return done
+
+
+def output_path_for(relative_path: str, encoding: EncodeOptions = EncodeOptions()) -> str:
+    """Where the crop of `relative_path` goes, relative to the output directory."""
+    relative_dir, filename = os.path.split(relative_path)
+    return os.path.join(relative_dir, pipeline.output_filename_for(filename, encoding))
+
+
+def find_collisions(paths: List[str], encoding: EncodeOptions = EncodeOptions()) -> Dict[str, str]:
+    """Sources whose crop path is already taken by an earlier source -> that source."""
+    owners: Dict[str, str] = {}
+    collisions = {}
+    for path in paths:
+        owner = owners.setdefault(output_path_for(path, encoding), path)
+        if owner != path:
+            collisions[path] = owner
+    return collisions
+
+
+def crop_file(input_dir: str, output_dir: str, relative_path: str, detection: DetectionOptions,
+              encoding: EncodeOptions = EncodeOptions()) -> Dict[str, Any]:
+    """Unit of work for one worker process: decode, detect, crop, write."""
+    started = time.perf_counter()
+    img = pipeline.load_cv2_image(os.path.join(input_dir, relative_path))
+    decoded = time.perf_counter()
+
+    relative_dir, filename = os.path.split(relative_path)
+    target_dir = os.path.join(output_dir, relative_dir)
+    os.makedirs(target_dir, exist_ok=True)
+    result = pipeline.crop_decoded_image(img, filename, target_dir, detection, encoding=encoding)
+    finished = time.perf_counter()
+
+    return {
+        'source': relative_path,
+        'output': os.path.join(relative_dir, result['saved_filename']) if result['saved_filename'] else None,
+        'x': result['x'], 'y': result['y'], 'w': result['w'], 'h': result['h'],
+        'status': result['status'],
+        'detection_scale': result.get('detection_scale'),
+        'output_bytes': result.get('output_bytes'),
+        'timings_ms': {
+            'decode': round((decoded - started) * 1000, 2),
+            'detect_crop_write': round((finished - decoded) * 1000, 2),
+            'total': round((finished - started) * 1000, 2),
+        },
+    }
+
+
+def error_entry(relative_path: str, error: BaseException) -> Dict[str, Any]:
+    """Manifest line for a file whose worker raised instead of returning a result."""
+    return {'source': relative_path, 'output': None, 'x': 0, 'y': 0, 'w': 0, 'h': 0,
+            'status': f"Error: {type(error).__name__}: {error}"}
+
+
+def crop_directory(input_dir: str, output_dir: str, workers: int = 0,
+                   detection: DetectionOptions = DetectionOptions(), retry_failed: bool = False,
+                   encoding: EncodeOptions = EncodeOptions(), opencv_threads: int = 0) -> Dict[str, int]:
+    """
+    Crops every image under input_dir not yet in the manifest. Returns counts.
+    `workers` and `opencv_threads` (0 = derived) split the cores as in the
+    server (see thread_budget.py).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    done = load_manifest(manifest_path, retry_failed)
+    images = list(iter_images(input_dir, exclude_dir=output_dir))
+    collisions = find_collisions(images, encoding)
+    pending = [path for path in images if path not in done]
+    counts = {'skipped': len(done), 'processed': 0, 'failed': 0}
+    logger.info(f"{len(pending)} images to crop, {len(done)} already in manifest")
+
+    layout = plan_threads(web_workers=1, pool_kind="process", pool_size=workers, opencv_threads=opencv_threads)
+    logger.info(layout.report())
+    pool = WorkerPool(kind="process", size=layout.pool_size,
+                      initializer=apply_opencv_threads, initargs=(layout.opencv_threads,))
+    # Keep a bounded window of futures so huge trees don't queue everything up front
+    window = pool.size * 4
+    remaining = (path for path in pending if path not in collisions)
+    in_flight: Dict[Future, str] = {}
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest:
+            for relative_path in (path for path in pending if path in collisions):
+                error = FileExistsError(f"Crop {output_path_for(relative_path, encoding)} is already written for "
+                                        f"{collisions[relative_path]}; rename one of them")
+                logger.error(f"{relative_path}: {error}")
+                manifest.write(json.dumps(error_entry(relative_path, error)) + "\n")
+                counts['failed'] += 1
+            manifest.flush()
+            while True:
+                for relative_path in remaining:
+                    future = pool.executor.submit(crop_file, input_dir, output_dir, relative_path,
+                                                  detection, encoding)
+                    in_flight[future] = relative_path
+                    if len(in_flight) >= window:
+                        break
+                if not in_flight:
+                    break
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    relative_path = in_flight.pop(future)
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        # One bad file must not abort the backfill; --retry-failed reruns it
+                        logger.error(f"{relative_path}: worker raised {e!r}")
+                        entry = error_entry(relative_path, e)
+                    manifest.write(json.dumps(entry) + "\n")
+                    manifest.flush()
+                    failed = entry['status'].startswith("Error")
+                    counts['failed' if failed else 'processed'] += 1
+                    logger.info(f"[{counts['processed'] + counts['failed']}/{len(pending)}] "
+                                f"{entry['source']}: {entry['status']}")
+    finally:
+        pool.shutdown(wait=False)
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Crop every receipt photo under a directory.")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: one per core)")
+    parser.add_argument("--opencv-threads", type=int, default=0,
+                        help="OpenCV threads per worker (default: the cores left per worker, -1 = OpenCV's own)")
+    parser.add_argument("--detection-mode", choices=DETECTION_MODES, default="full")
+    parser.add_argument("--detector", choices=tuple(DETECTORS), default="contour")
+    parser.add_argument("--max-side", type=int, default=1024, help="Detection size in 'downscale' mode")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="source")
+    parser.add_argument("--quality", type=int, default=0, help="JPEG/WebP quality (0 = codec default)")
+    parser.add_argument("--max-bytes", type=int, default=0, help="Size budget per crop (0 = none)")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-run files that failed previously")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    detection = DetectionOptions(mode=args.detection_mode, max_side=args.max_side, engine=args.detector)
+    encoding = EncodeOptions(format=args.output_format, quality=args.quality, max_bytes=args.max_bytes)
+    counts = crop_directory(args.input_dir, args.output_dir, args.workers, detection, args.retry_failed, encoding,
+                            args.opencv_threads)
+    logger.info(f"Done: {counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# app/tools/detector_report.py
+"""
+Compares detector engines on speed and accuracy.
+
+Accuracy is measured against reference crops stored next to their source
+photo as `<name>_cropped.<ext>` / `<name>_manual_cropped.<ext>` (as in
+`inputs/`). A reference crop is located inside its source photo by
+template matching, which gives the reference box; each engine's box is then
+scored by IoU against it.
+
+"thumbnail" mode is also scored against full detection on every HEIC in the
+directory (no reference crop needed), both as served (boxes re-detected once
+the frame is decoded) and when the crop comes straight from the thumbnail
+(small output budgets; see pipeline.crop_heic_via_thumbnail).
+
+    python -m app.tools.detector_report --inputs inputs --output detectors.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services import pipeline
+from app.services.detectors import DETECTORS
+from app.services.encoder import EncodeOptions
+from app.services.pipeline import DetectionOptions, DETECTION_MODES
+
+Box = Tuple[int, int, int, int]
+REFERENCE_SUFFIXES = ("_manual_cropped", "_cropped")
+
+
+def box_iou(a: Optional[Box], b: Box) -> float:
+    if not a:
+        return 0.0
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union else 0.0
+
+
+def find_reference_pairs(input_dir: str) -> List[Tuple[str, str]]:
+    """(source photo, reference crop) pairs found by the naming convention."""
+    pairs = []
+    for reference in sorted(glob.glob(os.path.join(input_dir, "*"))):
+        stem, ext = os.path.splitext(reference)
+        for suffix in REFERENCE_SUFFIXES:
+            if stem.endswith(suffix):
+                source = stem[:-len(suffix)] + ext
+                if os.path.exists(source):
+                    pairs.append((source, reference))
+                break
+    return pairs
+
+
+def locate_reference(source: np.ndarray, reference: np.ndarray) -> Optional[Box]:
+    """Box of `reference` inside `source`, assuming it is an unscaled crop."""
+    ref_h, ref_w = reference.shape[:2]
+    if ref_h > source.shape[0] or ref_w > source.shape[1]:
+        return None
+    scores = cv2.matchTemplate(source, reference, cv2.TM_SQDIFF_NORMED)
+    _, _, (x, y), _ = cv2.minMaxLoc(scores)
+    return int(x), int(y), int(ref_w), int(ref_h)
+
+
+def evaluate(input_dir: str, modes: Tuple[str, ...] = DETECTION_MODES, repeat: int = 3) -> Dict[str, Any]:
+    samples = []
+    for source_path, reference_path in find_reference_pairs(input_dir):
+        source = pipeline.load_cv2_image(source_path)
+        reference = pipeline.load_cv2_image(reference_path)
+        if source is None or reference is None:
+            continue
+        box = locate_reference(source, reference)
+        if box is not None:
+            samples.append((os.path.basename(reference_path), source, box))
+    if not samples:
+        raise ValueError(f"No reference crops found under {input_dir}")
+
+    engines = {}
+    for engine in DETECTORS:
+        for mode in modes:
+            options = DetectionOptions(mode=mode, engine=engine)
+            ious, times, per_image = [], [], {}
+            for name, source, box in samples:
+                best_ms = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    found, _ = pipeline.detect_paper(source, options)
+                    best_ms = min(best_ms, (time.perf_counter() - started) * 1000)
+                iou = box_iou(found, box)
+                ious.append(iou)
+                times.append(best_ms)
+                per_image[name] = round(iou, 4)
+            engines[f"{engine}/{mode}"] = {
+                'engine': engine,
+                'mode': mode,
+                'mean_iou': round(float(np.mean(ious)), 4),
+                'min_iou': round(float(np.min(ious)), 4),
+                'mean_ms': round(float(np.mean(times)), 3),
+                'p95_ms': round(float(np.percentile(times, 95)), 3),
+                'per_image_iou': per_image,
+            }
+    return {'input_dir': input_dir, 'references': len(samples), 'engines': engines}
+
+
+def evaluate_thumbnail(input_dir: str, detection: DetectionOptions = DetectionOptions(mode="thumbnail")
+                       ) -> Dict[str, Any]:
+    """
+    IoU of "thumbnail" mode against "full" detection for every HEIC under
+    input_dir: as served, and with the crop taken from the thumbnail (an
+    output budget of 1 px, so every thumbnail box meets it).
+    """
+    paths = sorted(path for path in glob.glob(os.path.join(input_dir, "*")) if pipeline.is_heic(path))
+    if not paths:
+        raise ValueError(f"No HEIC images found under {input_dir}")
+    detection = replace(detection, mode="thumbnail")
+    variants = {'thumbnail': EncodeOptions(), 'thumbnail_crop': EncodeOptions(max_side=1)}
+    ious: Dict[str, Dict[str, float]] = {variant: {} for variant in variants}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for path in paths:
+            name = os.path.basename(path)
+            data = Path(path).read_bytes()
+            full, _ = pipeline.detect_paper(pipeline.decode_image_bytes(data, name),
+                                            replace(detection, mode="full"))
+            if not full:
+                continue
+            for variant, encoding in variants.items():
+                result = pipeline.crop_image_bytes(data, name, out_dir, detection, encoding=encoding)
+                found = (result['x'], result['y'], result['w'], result['h']) if result['w'] else None
+                ious[variant][name] = round(box_iou(found, full), 4)
+    return {
+        'images': len(ious['thumbnail']),
+        'thumbnail_min_side': detection.thumbnail_min_side,
+        'variants': {variant: {'mean_iou': round(float(np.mean(list(per_image.values()))), 4) if per_image else 0.0,
+                               'min_iou': min(per_image.values(), default=0.0),
+                               'per_image_iou': per_image}
+                     for variant, per_image in ious.items()},
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{report['references']} reference crops",
+             f"{'engine/mode':<24}{'mean IoU':>10}{'min IoU':>10}{'mean ms':>10}{'p95 ms':>10}"]
+    for name, r in report['engines'].items():
+        lines.append(f"{name:<24}{r['mean_iou']:>10.4f}{r['min_iou']:>10.4f}{r['mean_ms']:>10.2f}{r['p95_ms']:>10.2f}")
+    thumbnail = report.get('thumbnail')
+    if thumbnail:
+        lines.append(f"thumbnail vs full detection, {thumbnail['images']} HEIC images "
+                     f"(thumbnail_min_side {thumbnail['thumbnail_min_side']})")
+        for name, r in thumbnail['variants'].items():
+            lines.append(f"{name:<24}{r['mean_iou']:>10.4f}{r['min_iou']:>10.4f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare detector engines on speed and IoU.")
+    parser.add_argument("--inputs", default="inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions per image (best is kept)")
+    parser.add_argument("--thumbnail-min-side", type=int, default=DetectionOptions.thumbnail_min_side,
+                        help="Smallest embedded HEIC thumbnail \"thumbnail\" mode uses")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.inputs, repeat=args.repeat)
+    if any(pipeline.is_heic(path) for path in os.listdir(args.inputs)):
+        report['thumbnail'] = evaluate_thumbnail(
+            args.inputs, DetectionOptions(mode="thumbnail", thumbnail_min_side=args.thumbnail_min_side))
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
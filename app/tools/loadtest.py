@@ -0,0 +1,291 @@
+# app/tools/loadtest.py
+"""
+HTTP load generator for the API, driving the real app with an async httpx
+client: in-process through ASGI (default, lifespan included), over a
+Unix socket (--uds) or against a running server (--url).
+
+    python -m app.tools.loadtest --concurrency 16 --duration 30 --ramp-up 10
+    python -m app.tools.loadtest --url http://localhost:8000 --mix process=9,submit=1
+    python -m app.tools.loadtest --baseline benchmarks/load.json --threshold 0.15
+
+Replays the `inputs/` photos against /api/process_image/ ("process") and
+/api/submit_cropped_image/ ("submit") in the --mix proportions. With
+--ramp-up, workers start one by one over that many seconds, and latency is
+also reported per number of active workers, which shows the concurrency at
+which latency falls apart. Reports requests/s, error rate, status codes,
+latency percentiles and the server's stage timings (from Server-Timing).
+
+The corpus is replayed over and over, so with the result cache on, almost
+every request after the first pass is a cache hit and the figures describe
+cache lookups, not pipeline capacity. In-process runs therefore turn the
+cache off unless RECEIPTS_RESULT_CACHE_ENTRIES is set; against --url/--uds,
+configure the server the same way. Cache hits (marked in Server-Timing) are
+counted in the report either way.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.tools.benchmark import load_corpus, summarize
+
+logger = logging.getLogger(__name__)
+
+# Request kind -> (path, multipart field)
+ENDPOINTS = {
+    "process": ("/api/process_image/", "file"),
+    "submit": ("/api/submit_cropped_image/", "cropped_file"),
+}
+DEFAULT_MIX = "process=1"
+TIMEOUT_SECONDS = 120.0
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'process=9,submit=1' -> {'process': 9.0, 'submit': 1.0}"""
+    weights = {}
+    for part in filter(None, mix.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in ENDPOINTS:
+            raise ValueError(f"Unknown request kind '{kind}'. Expected one of {tuple(ENDPOINTS)}.")
+        weights[kind] = float(weight or 1)
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("The request mix needs at least one positive weight")
+    return weights
+
+
+def is_cache_hit(header: str) -> bool:
+    """Whether a Server-Timing header marks a result-cache hit ('cache;desc=hit')."""
+    for entry in header.split(","):
+        name, *params = entry.split(";")
+        if name.strip() == "cache" and any(param.strip().replace('"', '') == "desc=hit" for param in params):
+            return True
+    return False
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """'decode_heic;dur=12.30, encode;dur=4.10' -> {'decode_heic': 12.3, 'encode': 4.1}"""
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = entry.split(";")
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name.strip()] = float(value)
+    return timings
+
+
+class LoadRun:
+    """Collects one sample per request while the workers run."""
+
+    def __init__(self):
+        self.samples: List[Dict[str, Any]] = []
+        self.active = 0
+
+    def record(self, kind: str, status: int, latency_ms: float, active: int,
+               server_timing: Optional[Dict[str, float]] = None, cache_hit: bool = False) -> None:
+        self.samples.append({'kind': kind, 'status': status, 'latency_ms': latency_ms,
+                             'active': active, 'server_timing': server_timing or {}, 'cache_hit': cache_hit})
+
+
+async def _send(client: httpx.AsyncClient, kind: str, name: str,
+                data: bytes) -> Tuple[int, Dict[str, float], bool]:
+    path, field = ENDPOINTS[kind]
+    try:
+        response = await client.post(path, files={field: (name, data)})
+    except httpx.HTTPError as e:
+        logger.warning(f"{kind} request failed: {e!r}")
+        return 0, {}, False
+    header = response.headers.get("server-timing", "")
+    return response.status_code, parse_server_timing(header), is_cache_hit(header)
+
+
+async def _worker(client: httpx.AsyncClient, run: LoadRun, corpus: List[Tuple[str, bytes]],
+                  mix: Dict[str, float], start_delay: float, deadline: float, budget: List[int],
+                  rng: random.Random) -> None:
+    await asyncio.sleep(start_delay)
+    run.active += 1
+    try:
+        kinds, weights = list(mix), list(mix.values())
+        while time.perf_counter() < deadline and budget[0] != 0:
+            budget[0] -= 1
+            kind = rng.choices(kinds, weights)[0]
+            name, data = corpus[rng.randrange(len(corpus))]
+            active = run.active
+            started = time.perf_counter()
+            status, server_timing, cache_hit = await _send(client, kind, name, data)
+            run.record(kind, status, (time.perf_counter() - started) * 1000, active, server_timing, cache_hit)
+    finally:
+        run.active -= 1
+
+
+async def run_load(input_dir: str = "inputs", url: Optional[str] = None, uds: Optional[str] = None,
+                   concurrency: int = 8, duration: float = 30.0, requests: int = 0, ramp_up: float = 0.0,
+                   mix: str = DEFAULT_MIX, limit: int = 0, seed: int = 0) -> Dict[str, Any]:
+    """
+    Runs `concurrency` workers for `duration` seconds (or until `requests`
+    have been sent, when > 0) and returns the report.
+    """
+    weights = parse_mix(mix)
+    corpus = [(os.path.basename(path), data) for path, data in load_corpus(input_dir, limit).items()]
+
+    async with AsyncExitStack() as stack:
+        if url or uds:
+            transport = httpx.AsyncHTTPTransport(uds=uds) if uds else None
+            base_url = url or "http://localhost"
+        else:
+            # In-process: the app's uploads go to a scratch directory and the
+            # result cache is off (see above), unless configured
+            os.environ.setdefault("RECEIPTS_UPLOAD_DIR", stack.enter_context(tempfile.TemporaryDirectory()))
+            os.environ.setdefault("RECEIPTS_RESULT_CACHE_ENTRIES", "0")
+            from app.main import app
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport, base_url = httpx.ASGITransport(app=app), "http://app"
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url=base_url, timeout=TIMEOUT_SECONDS))
+
+        run = LoadRun()
+        rng = random.Random(seed)
+        budget = [requests or -1]
+        started = time.perf_counter()
+        deadline = started + (duration if duration > 0 else float("inf"))
+        await asyncio.gather(*(
+            _worker(client, run, corpus, weights, ramp_up * i / concurrency, deadline, budget,
+                    random.Random(rng.random()))
+            for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    report = build_report(run.samples, elapsed)
+    report.update({'target': url or uds or "in-process", 'concurrency': concurrency, 'ramp_up_s': ramp_up,
+                   'mix': weights, 'images': len(corpus)})
+    return report
+
+
+def _summarize_requests(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    errors = sum(1 for s in samples if not 200 <= s['status'] < 300)
+    statuses: Dict[str, int] = {}
+    for s in samples:
+        statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+    summary = {
+        'requests': len(samples),
+        'rps': round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'status_codes': statuses,
+        'cache_hits': sum(1 for s in samples if s.get('cache_hit')),
+    }
+    if samples:
+        summary['latency_ms'] = summarize([s['latency_ms'] for s in samples])
+    return summary
+
+
+def build_report(samples: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    report = {'duration_s': round(elapsed, 3), **_summarize_requests(samples, elapsed)}
+    report['endpoints'] = {kind: _summarize_requests([s for s in samples if s['kind'] == kind], elapsed)
+                           for kind in sorted({s['kind'] for s in samples})}
+
+    stages: Dict[str, List[float]] = {}
+    for s in samples:
+        for stage, ms in s['server_timing'].items():
+            stages.setdefault(stage, []).append(ms)
+    report['server_stages'] = {stage: summarize(values) for stage, values in stages.items()}
+
+    by_active: Dict[int, List[Dict[str, Any]]] = {}
+    for s in samples:
+        by_active.setdefault(s['active'], []).append(s)
+    report['by_concurrency'] = {
+        str(active): {'requests': len(group),
+                      'error_rate': round(sum(1 for s in group if not 200 <= s['status'] < 300) / len(group), 4),
+                      'latency_ms': summarize([s['latency_ms'] for s in group])}
+        for active, group in sorted(by_active.items())}
+    return report
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.10,
+                        metric: str = "p95") -> List[str]:
+    """Returns a human-readable line per capacity regression beyond `threshold`."""
+    regressions = []
+    if baseline.get('rps') and current['rps'] < baseline['rps'] * (1 - threshold):
+        regressions.append(f"rps: {baseline['rps']:.2f} -> {current['rps']:.2f}")
+    base_latency = baseline.get('latency_ms', {}).get(metric)
+    now_latency = current.get('latency_ms', {}).get(metric)
+    if base_latency and now_latency and now_latency > base_latency * (1 + threshold):
+        regressions.append(f"latency {metric}: {base_latency:.1f} ms -> {now_latency:.1f} ms")
+    if current['error_rate'] > baseline.get('error_rate', 0.0) + threshold / 10:
+        regressions.append(f"error rate: {baseline.get('error_rate', 0.0):.2%} -> {current['error_rate']:.2%}")
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{report['requests']} requests in {report['duration_s']} s against {report['target']} "
+             f"({report['concurrency']} workers): {report['rps']} req/s, "
+             f"error rate {report['error_rate']:.2%}, status codes {report['status_codes']}, "
+             f"cache hits {report['cache_hits']}",
+             f"{'':<16}{'requests':>10}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    rows = [(kind, s) for kind, s in report['endpoints'].items()]
+    rows += [(f"{active} active", s) for active, s in report['by_concurrency'].items()]
+    for label, s in rows:
+        latency = s.get('latency_ms')
+        if latency is None:
+            continue
+        lines.append(f"{label:<16}{s['requests']:>10}{s.get('rps', ''):>10}"
+                     f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}")
+    if report['cache_hits']:
+        lines.append(f"WARNING: {report['cache_hits']} of {report['requests']} responses came from the result "
+                     f"cache; these figures understate the pipeline's cost")
+    if report['server_stages']:
+        lines.append("server stages (ms): " + ", ".join(
+            f"{stage} p50={s['p50']:.1f}/p95={s['p95']:.1f}" for stage, s in report['server_stages'].items()))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the API and report throughput and latency.")
+    parser.add_argument("--inputs", default="inputs", help="Directory of sample photos to replay")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N images")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running server (default: the app in-process)")
+    target.add_argument("--uds", help="Unix socket of a running server (uvicorn --uds)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client workers")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests instead")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which workers start")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Request mix, e.g. process=9,submit=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Compare against this stored report")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed regression, e.g. 0.10 = 10%%")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = asyncio.run(run_load(args.inputs, args.url, args.uds, args.concurrency,
+                                  args.duration if not args.requests else 0, args.requests,
+                                  args.ramp_up, args.mix, args.limit, args.seed))
+    print(format_report(report))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_to_baseline(report, json.load(f), args.threshold)
+        if regressions:
+            print("CAPACITY REGRESSION:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
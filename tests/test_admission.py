@@ -0,0 +1,64 @@
+# tests/test_admission.py
+
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionLimiter, AdmissionRejected
+
+
+# =========================================================================
+# I. AdmissionLimiter
+# =========================================================================
+
+class TestAdmissionLimiter:
+    """Tests the bounded in-flight count and bounded FIFO wait queue."""
+
+    def test_full_queue_is_shed_with_429(self):
+        async def scenario():
+            limiter = AdmissionLimiter("t", max_in_flight=1, max_queue=1)
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as excinfo:
+                await limiter.acquire()
+            limiter.release()
+            await waiter
+            return limiter, excinfo.value
+
+        limiter, rejected = asyncio.run(scenario())
+        assert rejected.status_code == 429
+        assert rejected.retry_after >= 1
+        # The slot was handed to the waiter rather than freed
+        assert limiter.stats()['in_flight'] == 1
+        assert limiter.stats()['rejected'] == {'queue_full': 1, 'queue_timeout': 0}
+
+    def test_waiting_too_long_is_shed_with_503(self):
+        async def scenario():
+            limiter = AdmissionLimiter("t", max_in_flight=1, max_queue=4, queue_timeout=0.01)
+            await limiter.acquire()
+            with pytest.raises(AdmissionRejected) as excinfo:
+                await limiter.acquire()
+            return limiter, excinfo.value
+
+        limiter, rejected = asyncio.run(scenario())
+        assert rejected.status_code == 503
+        assert limiter.queued == 0
+
+    def test_waiters_are_admitted_in_arrival_order(self):
+        async def scenario():
+            limiter = AdmissionLimiter("t", max_in_flight=1, max_queue=8)
+            order = []
+
+            async def request(i):
+                async with limiter.slot():
+                    order.append(i)
+                    await asyncio.sleep(0)
+
+            await asyncio.gather(*(request(i) for i in range(5)))
+            return limiter, order
+
+        limiter, order = asyncio.run(scenario())
+        assert order == [0, 1, 2, 3, 4]
+        assert limiter.in_flight == 0
+        assert limiter.admitted == 5
@@ -0,0 +1,419 @@
+# tests/test_api.py
+
+import asyncio
+import io
+import os
+import json
+import zipfile
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import app, get_image_service, get_job_runner
+from app.services.admission import AdmissionLimiter
+from app.services.job_queue import JobQueue, JobRunner
+from app.services.outcome_index import OutcomeIndex
+from app.services.image_service import ImageService
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, create_receipt_photo
+from tests.test_pipeline import RECEIPTS, create_table_photo
+
+
+# --- Fixtures ---
+
+@pytest.fixture
+def service(tmp_path):
+    svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=2))
+    yield svc
+    svc.shutdown()
+
+
+@pytest.fixture
+def client(service):
+    """TestClient whose routes use an ImageService writing to tmp_path."""
+    app.dependency_overrides[get_image_service] = lambda: service
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+def read_ndjson(response) -> list:
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+# =========================================================================
+# I. Batch Endpoint
+# =========================================================================
+
+class TestBatchEndpoint:
+    """Tests POST /api/process_batch/ with multiple files and with a zip."""
+
+    def test_streams_one_line_per_file(self, client: TestClient):
+        files = [('files', (f'receipt{i}.png', create_receipt_photo(), 'image/png')) for i in range(3)]
+        files.append(('files', ('broken.jpg', b'junk data', 'image/jpeg')))
+
+        response = client.post("/api/process_batch/", files=files)
+
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        lines = sorted(read_ndjson(response), key=lambda item: item['index'])
+        assert [item['filename'] for item in lines] == ['receipt0.png', 'receipt1.png', 'receipt2.png', 'broken.jpg']
+        for item in lines[:3]:
+            assert (item['x'], item['y'], item['w'], item['h']) == PAPER_BOX
+        # A bad item is reported, not fatal
+        assert lines[3]['status'].startswith('Error:')
+
+    def test_accepts_a_zip_archive(self, client: TestClient):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zf:
+            zf.writestr('a.png', create_receipt_photo())
+            zf.writestr('nested/b.jpg', create_receipt_photo('.jpg'))
+            zf.writestr('__MACOSX/._a.png', b'resource fork')
+
+        files = {'files': ('stack.zip', archive.getvalue(), 'application/zip')}
+        response = client.post("/api/process_batch/", files=files)
+
+        lines = read_ndjson(response)
+        assert sorted(item['filename'] for item in lines) == ['a.png', 'b.jpg']
+        assert all(item['status'] == 'Processed and Coordinates Found' for item in lines)
+
+    def test_rejects_corrupt_zip(self, client: TestClient):
+        files = {'files': ('stack.zip', b'not a zip', 'application/zip')}
+        assert client.post("/api/process_batch/", files=files).status_code == 400
+
+    def test_batch_body_has_its_own_limit(self, client: TestClient, monkeypatch):
+        photo = create_receipt_photo()
+        # Every file fits the per-file cap; together they are well over it
+        monkeypatch.setattr(main.config, "MAX_UPLOAD_BYTES", len(photo))
+        monkeypatch.setattr(main, "MULTIPART_OVERHEAD_BYTES", 1000)
+        files = [('files', (f'receipt{i}.png', photo, 'image/png')) for i in range(4)]
+
+        assert client.post("/api/process_batch/", files=files).status_code == 200
+        monkeypatch.setattr(main.config, "BATCH_MAX_BYTES", 3 * len(photo))
+        assert client.post("/api/process_batch/", files=files).status_code == 413
+
+
+# =========================================================================
+# II. Metrics and Server-Timing
+# =========================================================================
+
+class TestMetrics:
+    """Tests /metrics and the Server-Timing header on the process endpoint."""
+
+    def test_process_response_carries_server_timing(self, client: TestClient):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        response = client.post("/api/process_image/", files=files)
+
+        timing = response.headers['server-timing']
+        for stage in ("upload_read", "decode_opencv", "threshold", "contours", "encode", "write"):
+            assert f"{stage};dur=" in timing
+
+    def test_metrics_exposes_counters_and_stage_histograms(self, client: TestClient):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        client.post("/api/process_image/", files=files)
+
+        body = client.get("/metrics").text
+
+        assert 'receipts_http_requests_total{path="/api/process_image/",code="200"}' in body
+        assert 'receipts_stage_seconds_bucket{stage="decode_opencv",le="+Inf"}' in body
+        assert 'receipts_images_processed_total{outcome="success"}' in body
+        assert 'receipts_upload_bytes_total{path="/api/process_image/"}' in body
+        assert 'receipts_worker_queue_depth 0' in body
+
+
+# =========================================================================
+# III. Process Endpoint Options
+# =========================================================================
+
+class TestProcessEndpoint:
+    """Tests per-request detector and detection mode selection."""
+
+    def test_detector_can_be_chosen_per_request(self, client: TestClient):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        data = client.post("/api/process_image/?detector=projection&detection_mode=downscale", files=files).json()
+
+        assert data['detector'] == 'projection'
+        assert data['detection_mode'] == 'downscale'
+        assert (data['x'], data['y'], data['w'], data['h']) == PAPER_BOX
+
+    @pytest.mark.parametrize("query", ["detector=magic", "detection_mode=magic"])
+    def test_unknown_options_are_rejected(self, client: TestClient, query):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        assert client.post(f"/api/process_image/?{query}", files=files).status_code == 400
+
+    def test_non_image_is_415(self, client: TestClient):
+        files = {'file': ('receipt.jpg', b'%PDF-1.7 not an image', 'image/jpeg')}
+        assert client.post("/api/process_image/", files=files).status_code == 415
+
+    def test_oversized_body_is_413_readable_cross_origin(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(main.config, "MAX_UPLOAD_BYTES", 1000)
+        files = {'file': ('receipt.png', b"x" * (main.MULTIPART_OVERHEAD_BYTES + 2000), 'image/png')}
+        response = client.post("/api/process_image/", files=files, headers={'Origin': "http://frontend.test"})
+
+        assert response.status_code == 413
+        assert response.headers['access-control-allow-origin'] == "http://frontend.test"
+
+
+class TestRawProcessEndpoint:
+    """Tests POST /api/process_image/raw, the image as the request body."""
+
+    def test_raw_body_is_cropped(self, client: TestClient):
+        response = client.post("/api/process_image/raw?detector=projection", content=create_receipt_photo(),
+                               headers={'Content-Type': 'application/octet-stream',
+                                        'X-Filename': 'my%20receipt.png'})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['filename'] == 'my receipt.png'
+        assert data['detector'] == 'projection'
+        assert (data['x'], data['y'], data['w'], data['h']) == PAPER_BOX
+        assert 'upload_read' in response.headers['Server-Timing']
+
+    def test_filename_header_is_required(self, client: TestClient):
+        response = client.post("/api/process_image/raw", content=create_receipt_photo(),
+                               headers={'Content-Type': 'image/png'})
+        assert response.status_code == 400
+
+    def test_multipart_is_415(self, client: TestClient):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        response = client.post("/api/process_image/raw", files=files, headers={'X-Filename': 'receipt.png'})
+        assert response.status_code == 415
+
+    def test_non_image_is_415(self, client: TestClient):
+        response = client.post("/api/process_image/raw", content=b'%PDF-1.7 not an image',
+                               headers={'Content-Type': 'image/jpeg', 'X-Filename': 'receipt.jpg'})
+        assert response.status_code == 415
+
+
+# =========================================================================
+# IV. Crop From Coordinates
+# =========================================================================
+
+class TestCropEndpoint:
+    """Tests POST /api/crop_image/ with a Cropper.js CropSubmission."""
+
+    def _submission(self, source_filename: str, **overrides) -> dict:
+        x, y, w, h = PAPER_BOX
+        submission = {'x': x, 'y': y, 'width': w, 'height': h, 'rotate': 0, 'scaleX': 1, 'scaleY': 1,
+                      'originalFileName': source_filename, 'targetEndpoint': '/api/crop_image/'}
+        submission.update(overrides)
+        return submission
+
+    def test_crops_the_uploaded_original(self, client: TestClient, service):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        source = client.post("/api/process_image/", files=files).json()['source_filename']
+
+        response = client.post("/api/crop_image/", json=self._submission(source, rotate=90,
+                                                                         x=0, y=0, width=180, height=240))
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data['w'], data['h']) == (180, 240)
+        assert os.path.exists(os.path.join(service.upload_dir, data['saved_filename']))
+
+    def test_unknown_original_is_404(self, client: TestClient):
+        assert client.post("/api/crop_image/", json=self._submission("missing.png")).status_code == 404
+
+    def test_path_in_filename_is_rejected(self, client: TestClient):
+        assert client.post("/api/crop_image/", json=self._submission("../app/main.py")).status_code == 400
+
+
+# =========================================================================
+# V. Returning the Crop
+# =========================================================================
+
+class TestReturnImage:
+    """Tests return_image=multipart|url on the process endpoint and GET /api/images/."""
+
+    def _process(self, client: TestClient, mode: str):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        return client.post(f"/api/process_image/?return_image={mode}", files=files)
+
+    def test_multipart_carries_metadata_and_crop(self, client: TestClient):
+        response = self._process(client, "multipart")
+
+        assert response.headers['content-type'].startswith('multipart/mixed; boundary=')
+        boundary = response.headers['content-type'].split('boundary=')[1]
+        parts = response.content.split(f"--{boundary}".encode())[1:-1]
+        metadata = json.loads(parts[0].split(b"\r\n\r\n", 1)[1])
+        image = parts[1].split(b"\r\n\r\n", 1)[1][:-2]
+        assert (metadata['x'], metadata['y'], metadata['w'], metadata['h']) == PAPER_BOX
+        crop = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+        assert crop.shape[:2] == (PAPER_BOX[3], PAPER_BOX[2])
+
+    def test_url_serves_crop_with_etag_and_ranges(self, client: TestClient):
+        url = self._process(client, "url").json()['image_url']
+
+        full = client.get(url)
+        assert full.status_code == 200
+        etag = full.headers['etag']
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+        partial = client.get(url, headers={'Range': 'bytes=0-9'})
+        assert partial.status_code == 206
+        assert partial.content == full.content[:10]
+
+    def test_multiple_receipts_as_parts_and_urls(self, client: TestClient):
+        ok, table = cv2.imencode(".png", create_table_photo())
+        files = {'file': ('table.png', table.tobytes(), 'image/png')}
+        response = client.post("/api/process_image/?multiple=true&return_image=multipart", files=files)
+
+        boundary = response.headers['content-type'].split('boundary=')[1]
+        parts = response.content.split(f"--{boundary}".encode())[1:-1]
+        metadata = json.loads(parts[0].split(b"\r\n\r\n", 1)[1])
+        assert [(r['x'], r['y'], r['w'], r['h']) for r in metadata['regions']] == RECEIPTS
+        for part, (x, y, w, h) in zip(parts[1:], RECEIPTS):
+            crop = cv2.imdecode(np.frombuffer(part.split(b"\r\n\r\n", 1)[1][:-2], np.uint8), cv2.IMREAD_COLOR)
+            assert crop.shape[:2] == (h, w)
+        assert len(parts) == 1 + len(RECEIPTS)
+
+        files = {'file': ('table.png', table.tobytes(), 'image/png')}
+        regions = client.post("/api/process_image/?multiple=true&return_image=url", files=files).json()['regions']
+        assert all(client.get(r['image_url']).status_code == 200 for r in regions)
+
+    @pytest.mark.parametrize("mode", ["multipart", "url"])
+    def test_collected_crop_is_410(self, client: TestClient, service, monkeypatch, mode):
+        # The collector removed the crop between the write and the response
+        monkeypatch.setattr(service, "stored_image_path", lambda filename: None)
+        assert self._process(client, mode).status_code == 410
+
+    def test_unknown_mode_and_missing_image(self, client: TestClient):
+        assert self._process(client, "fax").status_code == 400
+        assert client.get("/api/images/missing.png").status_code == 404
+        assert client.get("/api/images/.hidden").status_code == 400
+
+
+# =========================================================================
+# VI. Admission Control
+# =========================================================================
+
+class TestAdmissionMiddleware:
+    """Tests that busy endpoints shed with Retry-After and report occupancy."""
+
+    def test_busy_process_endpoint_returns_429(self, client: TestClient, monkeypatch):
+        limiter = AdmissionLimiter("process", max_in_flight=1, max_queue=0)
+        monkeypatch.setitem(main.admission_limiters, "process", limiter)
+        # Occupy the only slot
+        limiter.in_flight = 1
+
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        response = client.post("/api/process_image/", files=files, headers={'Origin': "http://frontend.test"})
+
+        assert response.status_code == 429
+        assert int(response.headers['retry-after']) >= 1
+        # A browser client can see the rejection and read the backoff hint
+        assert response.headers['access-control-allow-origin'] == "http://frontend.test"
+        assert "retry-after" in response.headers['access-control-expose-headers'].lower()
+        # The cheap endpoint has its own limit
+        assert client.get("/api/admission").json()['submit']['in_flight'] == 0
+
+        limiter.in_flight = 0
+        assert client.post("/api/process_image/", files=files).status_code == 200
+        stats = client.get("/api/admission").json()['process']
+        assert stats['admitted'] == 1 and stats['in_flight'] == 0
+        assert stats['rejected']['queue_full'] == 1
+
+
+# =========================================================================
+# VII. Async Jobs
+# =========================================================================
+
+class TestJobEndpoints:
+    """Tests POST /api/jobs/ returning at once and GET polling the result."""
+
+    @pytest.fixture
+    def runner(self, client: TestClient, service, tmp_path):
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+        job_runner = JobRunner(queue, service, concurrency=1)
+        app.dependency_overrides[get_job_runner] = lambda: job_runner
+        yield job_runner
+        client.portal.call(job_runner.stop)
+        queue.close()
+
+    def test_submit_then_poll_until_done(self, client: TestClient, runner):
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        response = client.post("/api/jobs/?priority=interactive", files=files)
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job['status'] in ("queued", "running", "done")
+        assert job['priority'] == "interactive"
+
+        for _ in range(200):
+            job = client.get(job['status_url']).json()
+            if job['status'] == "done":
+                break
+            client.portal.call(asyncio.sleep, 0.01)
+        assert job['status'] == "done"
+        result = job['result']
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        assert client.get("/api/jobs/").json()['counts']['done'] == 1
+
+    def test_rejections_and_unknown_job(self, client: TestClient, runner):
+        files = {'file': ('receipt.png', b'junk data', 'image/png')}
+        assert client.post("/api/jobs/", files=files).status_code == 415
+        files = {'file': ('receipt.png', create_receipt_photo(), 'image/png')}
+        assert client.post("/api/jobs/?priority=urgent", files=files).status_code == 400
+        assert client.get("/api/jobs/nope").status_code == 404
+
+
+# =========================================================================
+# VIII. Startup
+# =========================================================================
+
+class TestReadiness:
+    """Tests GET /api/ready after the lifespan warm-up."""
+
+    def test_ready_reports_import_to_ready_timings(self, client: TestClient):
+        response = client.get("/api/ready")
+
+        assert response.status_code == 200
+        body = response.json()
+        startup = body['startup_ms']
+        assert startup['import'] <= startup['warm_up'] <= startup['ready']
+        assert set(startup['warm_up_decoders']) == {'opencv', 'heic'}
+        assert body['codecs']['pillow_heif'] is not None
+
+
+# =========================================================================
+# IX. Outcome Index
+# =========================================================================
+
+class TestOutcomeEndpoints:
+    """Tests GET /api/outcomes/ over what the endpoints recorded."""
+
+    @pytest.fixture
+    def outcomes(self, service, tmp_path):
+        service.outcomes = OutcomeIndex(str(tmp_path / "outcomes.sqlite3"))
+        yield service.outcomes
+        service.outcomes.close()
+
+    def test_processed_uploads_can_be_found(self, client: TestClient, outcomes):
+        content = create_receipt_photo()
+        for name in ("a.png", "b.png"):
+            client.post("/api/process_image/", files={'file': (name, content, 'image/png')})
+        client.post("/api/process_image/", files={'file': ('bad.jpg', b'%PDF-1.7', 'image/jpeg')})
+
+        page = client.get("/api/outcomes/?limit=1&status=success").json()
+        assert [item['filename'] for item in page['items']] == ["b.png"]
+        rest = client.get(f"/api/outcomes/?limit=1&status=success&cursor={page['next_cursor']}").json()
+        assert [item['filename'] for item in rest['items']] == ["a.png"]
+        assert rest['next_cursor'] is None
+
+        rejected = client.get("/api/outcomes/?status=rejected").json()['items']
+        assert [item['filename'] for item in rejected] == ["bad.jpg"]
+        digest = page['items'][0]['digest']
+        assert len(client.get(f"/api/outcomes/?digest={digest}").json()['items']) == 2
+
+        item = client.get(f"/api/outcomes/{page['items'][0]['id']}").json()
+        assert item['saved_filename'] == page['items'][0]['saved_filename']
+        assert client.get("/api/outcomes/999").status_code == 404
+
+    def test_invalid_filters_are_400(self, client: TestClient, outcomes):
+        assert client.get("/api/outcomes/?status=meh").status_code == 400
+        assert client.get("/api/outcomes/?cursor=meh").status_code == 400
+
+    def test_disabled_index_is_404(self, client: TestClient):
+        assert client.get("/api/outcomes/").status_code == 404
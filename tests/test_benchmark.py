@@ -0,0 +1,68 @@
+# tests/test_benchmark.py
+
+import json
+
+from app.tools.benchmark import compare_to_baseline, format_memory_comparison, main, run_benchmark, run_ingest_benchmark
+from tests.test_image_service import create_receipt_photo
+
+
+def make_corpus(root):
+    root.mkdir()
+    (root / "a.png").write_bytes(create_receipt_photo())
+    (root / "b.jpg").write_bytes(create_receipt_photo(".jpg"))
+
+
+def stage_report(ms: float, rate: float = 10.0) -> dict:
+    return {'throughput_images_per_s': rate,
+            'stages': {'decode': {'p50': ms, 'p95': ms, 'p99': ms, 'mean': ms}}}
+
+
+class TestBenchmark:
+    """Tests the per-stage benchmark and its baseline gate."""
+
+    def test_reports_every_pipeline_stage(self, tmp_path):
+        make_corpus(tmp_path / "in")
+        report = run_benchmark(str(tmp_path / "in"), repeat=2)
+
+        assert report['images'] == 2
+        assert report['failures'] == 0
+        assert report['total']['count'] == 4
+        for stage in ("decode", "threshold", "morphology", "contours", "crop", "encode", "write"):
+            assert set(report['stages'][stage]) >= {'p50', 'p95', 'p99', 'peak_bytes', 'alloc_bytes'}
+        assert report['scratch']['reuses'] > 0
+
+    def test_memory_before_and_after(self, tmp_path):
+        make_corpus(tmp_path / "in")
+        report = run_benchmark(str(tmp_path / "in"), repeat=2)
+        baseline = {**report, 'scratch': {**report['scratch'], 'allocations_per_image': 2.0}}
+
+        comparison = format_memory_comparison(report, baseline)
+        assert "peak RSS" in comparison
+        assert f"allocations/image: 2.0 -> {report['scratch']['allocations_per_image']}" in comparison
+        assert "threshold alloc" in comparison
+
+    def test_ingest_compares_multipart_and_raw(self, tmp_path):
+        make_corpus(tmp_path / "in")
+        report = run_ingest_benchmark(str(tmp_path / "in"), repeat=1)
+
+        assert set(report['paths']) == {'multipart', 'raw'}
+        for path in report['paths'].values():
+            assert path['failures'] == 0
+            assert path['latency']['count'] == 2
+            assert path['peak_bytes']['mean'] > 0
+        assert 'extra_copies' in report
+
+    def test_regression_beyond_threshold_is_reported(self):
+        assert compare_to_baseline(stage_report(10.0), stage_report(10.5), threshold=0.10) == []
+        assert len(compare_to_baseline(stage_report(12.0), stage_report(10.0), threshold=0.10)) == 1
+
+    def test_throughput_drop_is_reported(self):
+        assert compare_to_baseline(stage_report(10.0, rate=5.0), stage_report(10.0, rate=10.0))
+
+    def test_cli_fails_on_regression(self, tmp_path, capsys):
+        make_corpus(tmp_path / "in")
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(stage_report(0.6, rate=1e9)))
+
+        assert main(["--inputs", str(tmp_path / "in"), "--repeat", "1", "--baseline", str(baseline)]) == 1
+        assert "PERFORMANCE REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+# tests/test_crop_directory.py
+
+import json
+
+import cv2
+
+from app.services.encoder import EncodeOptions
+from app.tools import crop_directory as crop_directory_module
+from app.tools.crop_directory import MANIFEST_NAME, crop_directory, main
+from tests.test_image_service import PAPER_BOX, create_receipt_photo
+
+
+def make_tree(root):
+    (root / "2024" / "march").mkdir(parents=True)
+    (root / "a.png").write_bytes(create_receipt_photo())
+    (root / "2024" / "march" / "b.jpg").write_bytes(create_receipt_photo(".jpg"))
+    (root / "2024" / "broken.jpeg").write_bytes(b"junk data")
+    (root / "notes.txt").write_text("not an image")
+
+
+def read_manifest(out_dir) -> list:
+    return [json.loads(line) for line in (out_dir / MANIFEST_NAME).read_text().splitlines()]
+
+
+class TestCropDirectory:
+    """Tests the offline bulk cropper and its resume behaviour."""
+
+    def test_crops_tree_and_writes_manifest(self, tmp_path):
+        src, out = tmp_path / "in", tmp_path / "out"
+        make_tree(src)
+
+        counts = crop_directory(str(src), str(out), workers=2)
+
+        assert counts == {'skipped': 0, 'processed': 2, 'failed': 1}
+        entries = {entry['source']: entry for entry in read_manifest(out)}
+        assert set(entries) == {"a.png", "2024/march/b.jpg", "2024/broken.jpeg"}
+        assert (entries["a.png"]['x'], entries["a.png"]['y'],
+                entries["a.png"]['w'], entries["a.png"]['h']) == PAPER_BOX
+        assert entries["a.png"]['timings_ms']['total'] >= 0
+        assert cv2.imread(str(out / "2024" / "march" / "b.jpg")) is not None
+
+    def test_resume_skips_recorded_files(self, tmp_path):
+        src, out = tmp_path / "in", tmp_path / "out"
+        make_tree(src)
+        crop_directory(str(src), str(out), workers=1)
+        (src / "c.png").write_bytes(create_receipt_photo())
+
+        counts = crop_directory(str(src), str(out), workers=1)
+
+        assert counts == {'skipped': 3, 'processed': 1, 'failed': 0}
+        assert len(read_manifest(out)) == 4
+
+    def test_retry_failed(self, tmp_path):
+        src, out = tmp_path / "in", tmp_path / "out"
+        make_tree(src)
+        crop_directory(str(src), str(out), workers=1)
+
+        assert main([str(src), str(out), "--workers", "1", "--retry-failed"]) == 0
+        assert [entry['source'] for entry in read_manifest(out)].count("2024/broken.jpeg") == 2
+
+    def test_raising_file_is_recorded_and_the_run_continues(self, tmp_path):
+        src, out = tmp_path / "in", tmp_path / "out"
+        make_tree(src)
+        (src / "blocked").mkdir()
+        (src / "blocked" / "c.png").write_bytes(create_receipt_photo())
+        out.mkdir()
+        (out / "blocked").write_text("a file where the crop's directory should go")
+
+        counts = crop_directory(str(src), str(out), workers=1)
+
+        assert counts == {'skipped': 0, 'processed': 2, 'failed': 2}
+        entries = {entry['source']: entry for entry in read_manifest(out)}
+        assert entries["blocked/c.png"]['status'].startswith("Error: FileExistsError")
+        assert entries["2024/march/b.jpg"]['status'] == "Processed and Coordinates Found"
+
+    def test_sources_sharing_a_crop_path_are_not_overwritten(self, tmp_path):
+        src, out = tmp_path / "in", tmp_path / "out"
+        src.mkdir()
+        (src / "a.png").write_bytes(create_receipt_photo())
+        (src / "a.jpg").write_bytes(create_receipt_photo(".jpg"))
+
+        # Both would be written as a.jpg
+        counts = crop_directory(str(src), str(out), workers=1, encoding=EncodeOptions(format="jpeg"))
+
+        assert counts == {'skipped': 0, 'processed': 1, 'failed': 1}
+        entries = {entry['source']: entry for entry in read_manifest(out)}
+        assert entries["a.jpg"]['output'] == "a.jpg"
+        assert "already written for a.jpg" in entries["a.png"]['status']
+
+    def test_workers_get_the_planned_opencv_threads(self, tmp_path, monkeypatch):
+        pools = []
+        real_pool = crop_directory_module.WorkerPool
+        monkeypatch.setattr(crop_directory_module, "WorkerPool",
+                            lambda **kwargs: pools.append(kwargs) or real_pool(**kwargs))
+        src, out = tmp_path / "in", tmp_path / "out"
+        make_tree(src)
+
+        crop_directory(str(src), str(out), workers=2, opencv_threads=3)
+
+        assert pools[0]['size'] == 2
+        assert pools[0]['initializer'] is crop_directory_module.apply_opencv_threads
+        assert pools[0]['initargs'] == (3,)
@@ -0,0 +1,54 @@
+# tests/test_decoders.py
+
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from app.services import pipeline
+from app.services.decoders import DECODERS, codec_module, get_decoder, loaded_codecs
+
+
+# =========================================================================
+# I. Decoder Registry
+# =========================================================================
+
+class TestDecoderRegistry:
+    """Tests lazy codec loading through the registry."""
+
+    def test_importing_the_app_does_not_load_heic_codec(self):
+        code = "import sys, app.main; print('pillow_heif' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        assert output.strip() == "False"
+
+    def test_codec_module_is_loaded_once_and_timed(self):
+        module = codec_module("heic")
+        assert codec_module("heic") is module
+        assert loaded_codecs()["pillow_heif"] is not None
+
+    def test_unknown_decoder(self):
+        with pytest.raises(ValueError):
+            get_decoder("jxl")
+
+
+# =========================================================================
+# II. Warm-up
+# =========================================================================
+
+class TestWarmUp:
+    """Tests the synthetic warm-up pass."""
+
+    def test_runs_every_decoder(self):
+        timings = pipeline.warm_up()
+        assert set(timings) == set(DECODERS)
+        assert all(ms > 0 for ms in timings.values())
+
+    def test_samples_decode_to_the_synthetic_receipt(self):
+        img = np.full((48, 64, 3), 40, np.uint8)
+        img[8:40, 12:52] = 255
+        for name, decoder in DECODERS.items():
+            sample = pipeline._warm_up_sample(name, img)
+            decoded = pipeline.decode_image_bytes(sample, f"x{decoder.sample_ext}", decoder=name)
+            box, _ = pipeline.detect_paper(decoded)
+            assert box is not None, name
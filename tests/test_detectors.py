@@ -0,0 +1,104 @@
+# tests/test_detectors.py
+
+import cv2
+import numpy as np
+import pytest
+
+from app.services import pipeline
+from app.services.detectors import DETECTORS, Detector, get_detector, register_detector
+from app.services.pipeline import DetectionOptions
+from app.tools.detector_report import box_iou, evaluate, evaluate_thumbnail
+from tests.test_pipeline import RECEIPTS, create_heic, create_large_photo, create_table_photo
+
+BOX = (413, 287, 1201, 1630)
+
+
+# =========================================================================
+# I. Engines
+# =========================================================================
+
+class TestEngines:
+    """Tests each registered engine on a synthetic photo."""
+
+    @pytest.mark.parametrize("engine", ["contour", "projection"])
+    @pytest.mark.parametrize("mode", ["full", "downscale"])
+    def test_engines_find_the_paper(self, engine, mode):
+        coords, _ = pipeline.detect_paper(create_large_photo(BOX), DetectionOptions(mode=mode, engine=engine))
+        assert box_iou(coords, BOX) > 0.99
+
+    def test_projection_ignores_small_bright_clutter(self):
+        img = create_large_photo(BOX)
+        img[2200:2250, 1700:1750] = 255  # a bright spot off the receipt
+        coords = get_detector("projection").detect(img)
+        assert box_iou(coords, BOX) > 0.99
+
+    @pytest.mark.parametrize("engine", ["contour", "projection"])
+    def test_blank_frame_has_no_paper(self, engine):
+        assert get_detector(engine).detect(np.zeros((100, 100, 3), np.uint8)) is None
+
+    def test_contour_finds_every_receipt(self):
+        assert get_detector("contour").detect_all(create_table_photo()) == RECEIPTS
+
+    def test_projection_falls_back_to_one_region(self):
+        regions = get_detector("projection").detect_all(create_large_photo(BOX))
+        assert len(regions) == 1 and box_iou(regions[0], BOX) > 0.99
+        assert get_detector("projection").detect_all(create_large_photo(BOX), min_area=0.9) == []
+
+
+# =========================================================================
+# II. Registry
+# =========================================================================
+
+class TestRegistry:
+    """Tests engine lookup and registration."""
+
+    def test_unknown_engine_is_rejected(self):
+        with pytest.raises(ValueError):
+            get_detector("magic")
+        with pytest.raises(ValueError):
+            DetectionOptions(engine="magic")
+
+    def test_custom_engine_can_be_registered(self):
+        class WholeFrame(Detector):
+            name = "whole-frame"
+
+            def detect(self, img, timer=None):
+                return 0, 0, img.shape[1], img.shape[0]
+
+        register_detector(WholeFrame())
+        try:
+            coords, _ = pipeline.detect_paper(create_large_photo(), DetectionOptions(engine="whole-frame"))
+            assert coords == (0, 0, 1800, 2400)
+        finally:
+            DETECTORS.pop("whole-frame")
+
+
+# =========================================================================
+# III. Reference Report
+# =========================================================================
+
+class TestDetectorReport:
+    """Tests the IoU report against `<name>_cropped` reference crops."""
+
+    def test_reports_iou_and_speed_per_engine(self, tmp_path):
+        img = create_large_photo(BOX)
+        x, y, w, h = BOX
+        cv2.imwrite(str(tmp_path / "receipt.png"), img)
+        cv2.imwrite(str(tmp_path / "receipt_cropped.png"), img[y:y + h, x:x + w])
+
+        report = evaluate(str(tmp_path), repeat=1)
+
+        assert report['references'] == 1
+        assert set(report['engines']) == {f"{e}/{m}" for e in DETECTORS for m in pipeline.DETECTION_MODES}
+        assert report['engines']['contour/full']['mean_iou'] == 1.0
+        assert report['engines']['projection/full']['mean_ms'] >= 0
+
+    def test_scores_thumbnail_mode_against_full_detection(self, tmp_path):
+        (tmp_path / "receipt.heic").write_bytes(create_heic())
+
+        report = evaluate_thumbnail(str(tmp_path), DetectionOptions(mode="thumbnail", thumbnail_min_side=100))
+
+        assert report['images'] == 1
+        assert set(report['variants']) == {'thumbnail', 'thumbnail_crop'}
+        assert report['variants']['thumbnail']['min_iou'] > 0.95
+        assert report['variants']['thumbnail_crop']['min_iou'] > 0.9
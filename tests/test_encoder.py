@@ -0,0 +1,86 @@
+# tests/test_encoder.py
+
+import cv2
+import numpy as np
+import pytest
+
+from app.services import pipeline
+from app.services.encoder import EncodeOptions, encode_image, output_extension
+from app.services.timing import StageTimer
+
+
+def create_noisy_crop(size=(400, 300)) -> np.ndarray:
+    """Noise compresses badly, so size budgets actually have to work."""
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, (size[0], size[1], 3), dtype=np.uint8)
+
+
+# =========================================================================
+# I. Formats and Flags
+# =========================================================================
+
+class TestEncodeOptions:
+    """Tests format selection and codec flags."""
+
+    @pytest.mark.parametrize("filename, fmt, expected", [
+        ("r.png", "source", ".png"),
+        ("r.HEIC", "source", ".jpg"),
+        ("r.png", "webp", ".webp"),
+        ("r.heic", "jpeg", ".jpg"),
+    ])
+    def test_output_extension(self, filename, fmt, expected):
+        assert output_extension(filename, EncodeOptions(format=fmt)) == expected
+
+    @pytest.mark.parametrize("filename, source_format, expected", [
+        ("scan", "jpeg", ".jpg"),
+        ("scan.pdf", "png", ".png"),
+        ("scan.JPEG", "jpeg", ".JPEG"),
+        ("IMG_1.heic", "jpeg", ".jpg"),
+        ("IMG_1.jpg", "heic", ".jpg"),
+    ])
+    def test_sniffed_format_overrides_wrong_extension(self, filename, source_format, expected):
+        assert output_extension(filename, EncodeOptions(), source_format) == expected
+
+    def test_codec_failure_returns_none(self):
+        assert encode_image(create_noisy_crop(), ".pdf") is None
+
+    def test_rejects_unknown_format(self):
+        with pytest.raises(ValueError):
+            EncodeOptions(format="gif")
+
+    def test_grayscale_and_quality(self):
+        img = create_noisy_crop()
+        color = encode_image(img, ".jpg", EncodeOptions(quality=90))
+        gray = encode_image(img, ".jpg", EncodeOptions(quality=90, grayscale=True))
+
+        assert cv2.imdecode(gray, cv2.IMREAD_UNCHANGED).ndim == 2
+        assert gray.size < color.size
+
+
+# =========================================================================
+# II. Budgets
+# =========================================================================
+
+class TestBudgets:
+    """Tests max_side and max_bytes."""
+
+    def test_max_side_downscales(self):
+        encoded = encode_image(create_noisy_crop(), ".png", EncodeOptions(max_side=100))
+
+        assert max(cv2.imdecode(encoded, cv2.IMREAD_COLOR).shape[:2]) == 100
+
+    @pytest.mark.parametrize("ext", [".jpg", ".webp", ".png"])
+    def test_max_bytes_is_met(self, ext):
+        timer = StageTimer()
+        encoded = encode_image(create_noisy_crop(), ext, EncodeOptions(max_bytes=40_000), timer)
+
+        assert encoded.size <= 40_000
+        assert "encode" in timer.timings
+
+    def test_pipeline_records_output_bytes(self, tmp_path):
+        img = np.full((180, 240, 3), 40, np.uint8)
+        img[30:120, 40:160] = 255
+        result = pipeline.crop_decoded_image(img, "r.png", str(tmp_path), encoding=EncodeOptions(format="webp"))
+
+        assert result['saved_filename'] == "r.webp"
+        assert result['output_bytes'] == (tmp_path / "r.webp").stat().st_size
@@ -0,0 +1,83 @@
+# tests/test_image_cache.py
+
+import asyncio
+
+import numpy as np
+
+from app.services.image_cache import DecodedImageCache
+from app.services.image_service import ImageService
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, create_receipt_photo, make_upload
+
+
+def frame(nbytes: int) -> np.ndarray:
+    return np.zeros(nbytes, np.uint8)
+
+
+# =========================================================================
+# I. DecodedImageCache
+# =========================================================================
+
+class TestDecodedImageCache:
+    """Tests the byte-bounded LRU of decoded originals."""
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        cache = DecodedImageCache(max_bytes=300)
+        cache.put("a", frame(100))
+        cache.put("b", frame(100))
+        cache.put("c", frame(100))
+        cache.get("a")  # "b" is now the oldest
+        cache.put("d", frame(100))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()['bytes'] == 300
+        assert cache.stats()['evictions'] == 1
+
+    def test_frame_larger_than_budget_is_not_cached(self):
+        cache = DecodedImageCache(max_bytes=50)
+        cache.put("big", frame(100))
+
+        assert cache.get("big") is None
+        assert cache.stats()['bytes'] == 0
+
+    def test_cached_frames_are_read_only(self):
+        cache = DecodedImageCache(max_bytes=300)
+        cache.put("a", frame(10))
+
+        assert not cache.get("a").flags.writeable
+
+
+# =========================================================================
+# II. Crop From Submission
+# =========================================================================
+
+class TestCropFromSubmission:
+    """Tests ImageService.crop_from_submission with and without the cache."""
+
+    def _process_then_crop(self, svc: ImageService, box):
+        async def run():
+            result = await svc.image_cropping(make_upload(create_receipt_photo()))
+            return await svc.crop_from_submission(result['source_filename'], *box)
+        try:
+            return asyncio.run(run())
+        finally:
+            svc.shutdown()
+
+    def test_crop_uses_cached_original(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=1),
+                           decoded_cache=DecodedImageCache())
+        result = self._process_then_crop(svc, PAPER_BOX)
+
+        assert (result['w'], result['h']) == PAPER_BOX[2:]
+        assert (tmp_path / result['saved_filename']).exists()
+        # Served from memory: no decode stage in this request
+        assert 'decode' not in result['timings']
+        assert svc.decoded_cache.stats()['hits'] == 1
+
+    def test_crop_falls_back_to_original_on_disk(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=1))
+        result = self._process_then_crop(svc, (0, 0, 50, 40))
+
+        assert (result['w'], result['h']) == (50, 40)
+        assert 'decode' in result['timings']
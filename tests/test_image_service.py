@@ -0,0 +1,269 @@
+# tests/test_image_service.py
+
+import asyncio
+import os
+from io import BytesIO
+
+import cv2
+import numpy as np
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.services import image_service
+from app.services.image_service import ImageService, UploadTooLargeError
+from app.services.probe import UnsupportedImageError
+from app.services.worker_pool import WorkerPool
+
+
+# --- Test Data (a white "receipt" on a dark table) ---
+
+PAPER_BOX = (40, 30, 120, 90)  # x, y, w, h
+
+
+def create_receipt_photo(ext: str = ".png") -> bytes:
+    """Encodes a 240x180 dark image with a white rectangle at PAPER_BOX."""
+    x, y, w, h = PAPER_BOX
+    img = np.full((180, 240, 3), 40, np.uint8)
+    img[y:y + h, x:x + w] = 255
+    ok, buf = cv2.imencode(ext, img)
+    assert ok
+    return buf.tobytes()
+
+
+def make_upload(content: bytes, filename: str = "receipt.png") -> UploadFile:
+    return UploadFile(file=BytesIO(content), filename=filename)
+
+
+@pytest.fixture
+def service(tmp_path):
+    svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=2))
+    yield svc
+    svc.shutdown()
+
+
+# =========================================================================
+# I. Worker Pool
+# =========================================================================
+
+class TestWorkerPool:
+    """Tests the executor wrapper used for the CPU-bound stages."""
+
+    def test_rejects_unknown_kind(self):
+        with pytest.raises(ValueError):
+            WorkerPool(kind="fiber")
+
+    def test_default_size_uses_available_cores(self):
+        assert WorkerPool().size >= 1
+
+    @pytest.mark.parametrize("kind", ["thread", "process"])
+    def test_run_returns_result(self, kind):
+        pool = WorkerPool(kind=kind, size=1)
+        try:
+            assert asyncio.run(pool.run(max, 3, 7)) == 7
+        finally:
+            pool.shutdown()
+
+
+# =========================================================================
+# II. ImageService
+# =========================================================================
+
+class TestImageService:
+    """Tests the upload -> crop pipeline end to end on synthetic images."""
+
+    def test_image_cropping_finds_paper(self, service: ImageService):
+        result = asyncio.run(service.image_cropping(make_upload(create_receipt_photo())))
+
+        assert result['status'] == 'Processed and Coordinates Found'
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        cropped = cv2.imread(os.path.join(service.upload_dir, result['saved_filename']))
+        assert cropped.shape[:2] == (PAPER_BOX[3], PAPER_BOX[2])
+
+    def test_image_cropping_on_process_pool(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="process", size=1))
+        try:
+            result = asyncio.run(svc.image_cropping(make_upload(create_receipt_photo())))
+        finally:
+            svc.shutdown()
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+
+    def test_image_cropping_invalid_content(self, service: ImageService):
+        with pytest.raises(UnsupportedImageError):
+            asyncio.run(service.image_cropping(make_upload(b"junk data", "bad_file.jpg")))
+
+        # Rejected from the header: nothing was written
+        assert os.listdir(service.upload_dir) == []
+
+    @pytest.mark.parametrize("mode", ["disk", "memory"])
+    @pytest.mark.parametrize("filename", ["scan", "scan.pdf"])
+    def test_extension_follows_sniffed_format(self, tmp_path, mode, filename):
+        svc = ImageService(upload_dir=str(tmp_path), pipeline_mode=mode, persist_originals="sync")
+        try:
+            result = asyncio.run(svc.image_cropping(make_upload(create_receipt_photo('.jpg'), filename)))
+        finally:
+            svc.shutdown()
+
+        assert result['status'] == 'Processed and Coordinates Found'
+        assert result['saved_filename'].startswith("scan_") and result['saved_filename'].endswith(".jpg")
+        assert os.path.exists(os.path.join(str(tmp_path), svc._original_filename(result['saved_filename'])))
+
+    def test_truncated_image_reports_error(self, service: ImageService):
+        result = asyncio.run(service.image_cropping(make_upload(create_receipt_photo('.jpg')[:200], "cut.jpg")))
+
+        assert result['status'].startswith('Error:')
+        assert result['w'] == 0
+
+
+# =========================================================================
+# III. In-Memory Pipeline
+# =========================================================================
+
+class TestInMemoryPipeline:
+    """Tests the decode-from-buffer mode and how originals are persisted."""
+
+    def _run(self, svc: ImageService, content: bytes, filename: str = "receipt.png"):
+        async def crop_and_drain():
+            result = await svc.image_cropping(make_upload(content, filename))
+            await svc.drain_background_writes()
+            return result
+        try:
+            return asyncio.run(crop_and_drain())
+        finally:
+            svc.shutdown()
+
+    @pytest.mark.parametrize("persist", ["sync", "background"])
+    def test_crop_and_original_are_written(self, tmp_path, persist):
+        svc = ImageService(upload_dir=str(tmp_path), pipeline_mode="memory", persist_originals=persist)
+        content = create_receipt_photo()
+        result = self._run(svc, content)
+
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        original = tmp_path / svc._original_filename(result['saved_filename'])
+        assert original.read_bytes() == content
+        assert (tmp_path / result['saved_filename']).exists()
+
+    def test_originals_can_be_skipped(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), pipeline_mode="memory", persist_originals="off")
+        result = self._run(svc, create_receipt_photo())
+
+        assert os.listdir(tmp_path) == [result['saved_filename']]
+
+    def test_invalid_content(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), pipeline_mode="memory", persist_originals="off")
+        with pytest.raises(UnsupportedImageError):
+            self._run(svc, b"junk data", "bad_file.jpg")
+
+    def test_rejects_unknown_mode(self, tmp_path):
+        with pytest.raises(ValueError):
+            ImageService(upload_dir=str(tmp_path), pipeline_mode="tape")
+
+
+# =========================================================================
+# IV. Streaming Uploads and Size Cap
+# =========================================================================
+
+class TestUploadLimits:
+    """Tests chunked upload writes and the max_upload_bytes cap."""
+
+    def test_chunked_write_is_byte_identical(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), chunk_size=7)
+        content = create_receipt_photo()
+        asyncio.run(svc._write_bytes_to_disk(make_upload(content), str(tmp_path / "out.png")))
+
+        assert (tmp_path / "out.png").read_bytes() == content
+
+    def test_oversized_upload_is_rejected_and_partial_file_removed(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), chunk_size=64, max_upload_bytes=100)
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(svc.save_cropped_file(make_upload(b"x" * 1000, "big.jpg")))
+
+        assert os.listdir(tmp_path) == []
+
+    def test_declared_size_is_rejected_before_reading(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), max_upload_bytes=100)
+        upload = UploadFile(file=BytesIO(b""), filename="big.jpg", size=10_000)
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(svc.image_cropping(upload))
+
+    def test_memory_mode_respects_cap(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), pipeline_mode="memory", chunk_size=64, max_upload_bytes=100)
+        try:
+            with pytest.raises(UploadTooLargeError):
+                asyncio.run(svc.image_cropping(make_upload(create_receipt_photo(), "big.png")))
+        finally:
+            svc.shutdown()
+
+
+# =========================================================================
+# V. Raw Body Streams
+# =========================================================================
+
+async def chunked(content: bytes, size: int = 1000):
+    for i in range(0, len(content), size):
+        yield content[i:i + size]
+
+
+class TestRawStream:
+    """Tests image_cropping_stream(), which reads a raw body into one buffer."""
+
+    def test_crops_from_preallocated_buffer(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), persist_originals="off")
+        content = create_receipt_photo()
+        try:
+            result = asyncio.run(svc.image_cropping_stream(chunked(content), "receipt.png", len(content)))
+        finally:
+            svc.shutdown()
+
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        assert 'upload_read' in result['timings']
+        assert os.listdir(tmp_path) == [result['saved_filename']]
+
+    def test_body_without_length_is_grown(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path))
+        content = create_receipt_photo()
+        buffer, probe = asyncio.run(svc._read_stream(chunked(content, 7)))
+
+        assert buffer == content
+        assert probe.decoder == "opencv"
+
+    def test_declared_length_is_preallocated_only_up_to_a_bound(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(image_service, "MAX_PREALLOCATE_BYTES", 100)
+        svc = ImageService(upload_dir=str(tmp_path), max_upload_bytes=0)
+        content = create_receipt_photo()
+        buffer, _ = asyncio.run(svc._read_stream(chunked(content, 64), len(content)))
+
+        assert buffer == content
+        with pytest.raises(ValueError, match="ended before"):
+            asyncio.run(svc._read_stream(chunked(content), 1 << 40))
+
+    def test_body_longer_than_declared_is_an_error(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), max_upload_bytes=0)
+        content = create_receipt_photo()
+        with pytest.raises(ValueError, match="longer than"):
+            asyncio.run(svc._read_stream(chunked(content), len(content) - 1))
+
+    def test_short_body_is_an_error(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path))
+        content = create_receipt_photo()
+        result = asyncio.run(svc.image_cropping_stream(chunked(content), "receipt.png", len(content) + 10))
+
+        assert result['status'].startswith("Error")
+
+    @pytest.mark.parametrize("declared", [None, 10_000])
+    def test_size_cap(self, tmp_path, declared):
+        svc = ImageService(upload_dir=str(tmp_path), max_upload_bytes=100)
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(svc.image_cropping_stream(chunked(create_receipt_photo(), 64), "big.png", declared))
+
+    def test_bad_header_is_rejected_before_the_rest_is_read(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path))
+        read = []
+
+        async def junk():
+            for _ in range(100):
+                read.append(1)
+                yield b"\x00" * 1024
+
+        with pytest.raises(UnsupportedImageError):
+            asyncio.run(svc.image_cropping_stream(junk(), "junk.jpg", 100 * 1024))
+        assert len(read) < 100
@@ -0,0 +1,138 @@
+# tests/test_job_queue.py
+
+import asyncio
+
+import pytest
+
+from app.services.image_service import ImageService
+from app.services.job_queue import JobQueue, JobRunner, MAX_ATTEMPTS
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, create_receipt_photo, make_upload
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    yield q
+    q.close()
+
+
+@pytest.fixture
+def service(tmp_path):
+    svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=2))
+    yield svc
+    svc.shutdown()
+
+
+# =========================================================================
+# I. JobQueue
+# =========================================================================
+
+class TestJobQueue:
+    """Tests ordering, persistence and crash recovery of the SQLite queue."""
+
+    def test_higher_priority_jumps_ahead_fifo_within_priority(self, queue: JobQueue):
+        bulk = [queue.enqueue(f"bulk{i}.jpg", {}, "bulk") for i in range(2)]
+        interactive = queue.enqueue("now.jpg", {}, "interactive")
+
+        assert queue.position(queue.get(bulk[1])) == 2
+        claimed = [queue.claim()['id'] for _ in range(3)]
+        assert claimed == [interactive, *bulk]
+        assert queue.claim() is None
+
+    def test_jobs_survive_reopening(self, queue: JobQueue):
+        job_id = queue.enqueue("a.jpg", {'saved_filename': 'a_1.jpg'}, "normal")
+        queue.close()
+
+        reopened = JobQueue(queue.db_path)
+        job = reopened.claim()
+        assert job['id'] == job_id
+        assert job['payload'] == {'saved_filename': 'a_1.jpg'}
+        reopened.close()
+
+    def test_recover_requeues_interrupted_jobs_until_attempts_run_out(self, tmp_path):
+        # Leases of 0 s run out at once, as if every claim's process had died
+        queue = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0)
+        job_id = queue.enqueue("a.jpg", {})
+        for _ in range(MAX_ATTEMPTS - 1):
+            queue.claim()  # ...and the process dies
+            assert queue.recover() == 1
+        queue.claim()
+
+        assert queue.recover() == 0
+        job = queue.get(job_id)
+        assert job['status'] == "failed" and job['error']
+        queue.close()
+
+    def test_processes_sharing_a_database_keep_their_own_jobs(self, tmp_path):
+        a, b = JobQueue(str(tmp_path / "jobs.sqlite3")), JobQueue(str(tmp_path / "jobs.sqlite3"))
+        job_id = a.enqueue("a.jpg", {})
+        job = a.claim()
+
+        assert b.recover() == 0
+        assert b.claim() is None
+        b.finish(job_id, {'status': 'stolen'})
+        assert a.renew(job_id)
+        a.finish(job_id, {'status': 'ok'})
+        assert b.get(job_id)['status'] == "done" and job['owner'] == a.owner != b.owner
+        a.close()
+        b.close()
+
+    def test_expired_lease_is_taken_over(self, tmp_path):
+        a = JobQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=0)
+        b = JobQueue(str(tmp_path / "jobs.sqlite3"))
+        job_id = a.enqueue("a.jpg", {})
+        a.claim()  # ...and a's process stops renewing
+
+        assert b.claim()['id'] == job_id
+        assert not a.renew(job_id)
+        a.fail(job_id, "too late")
+        assert b.get(job_id)['status'] == "running"
+        a.close()
+        b.close()
+
+    def test_unknown_priority_is_rejected(self, queue: JobQueue):
+        with pytest.raises(ValueError):
+            queue.enqueue("a.jpg", {}, "urgent")
+
+
+# =========================================================================
+# II. JobRunner
+# =========================================================================
+
+class TestJobRunner:
+    """Tests that stored uploads are cropped by the runner's workers."""
+
+    def test_runs_submitted_job_to_completion(self, queue: JobQueue, service):
+        async def scenario():
+            runner = JobRunner(queue, service, concurrency=1)
+            stored = await service.store_upload(make_upload(create_receipt_photo()))
+            job_id = await runner.submit("receipt.png", stored, "interactive")
+            for _ in range(200):
+                job = queue.get(job_id)
+                if job['status'] in ("done", "failed"):
+                    break
+                await asyncio.sleep(0.01)
+            await runner.stop()
+            return job
+
+        job = asyncio.run(scenario())
+        assert job['status'] == "done"
+        result = job['result']
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        assert result['source_filename']
+
+    def test_missing_upload_fails_the_job(self, queue: JobQueue, service):
+        async def scenario():
+            runner = JobRunner(queue, service, concurrency=1)
+            job_id = await runner.submit("gone.png", {'saved_filename': 'gone.png', 'digest': '0', 'decoder': 'opencv'})
+            for _ in range(200):
+                if queue.get(job_id)['status'] == "failed":
+                    break
+                await asyncio.sleep(0.01)
+            await runner.stop()
+            return queue.get(job_id)
+
+        job = asyncio.run(scenario())
+        assert job['status'] == "failed"
+        assert job['result']['status'].startswith("Error")
@@ -0,0 +1,75 @@
+# tests/test_loadtest.py
+
+import asyncio
+
+import pytest
+
+from app.main import app, get_image_service
+from app.services.image_service import ImageService
+from app.services.result_cache import ResultCache
+from app.services.worker_pool import WorkerPool
+from app.tools.loadtest import (compare_to_baseline, format_report, is_cache_hit, parse_mix, parse_server_timing,
+                                run_load)
+from tests.test_image_service import create_receipt_photo
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    root = tmp_path / "in"
+    root.mkdir()
+    (root / "a.png").write_bytes(create_receipt_photo())
+    (root / "b.jpg").write_bytes(create_receipt_photo(".jpg"))
+    return str(root)
+
+
+@pytest.fixture
+def service(tmp_path):
+    svc = ImageService(upload_dir=str(tmp_path / "uploads"), worker_pool=WorkerPool(kind="thread", size=2))
+    app.dependency_overrides[get_image_service] = lambda: svc
+    yield svc
+    app.dependency_overrides.clear()
+    svc.shutdown()
+
+
+class TestLoadTest:
+    """Tests the HTTP load generator against the in-process app."""
+
+    def test_parses_mix_and_server_timing(self):
+        assert parse_mix("process=9,submit=1") == {'process': 9.0, 'submit': 1.0}
+        with pytest.raises(ValueError):
+            parse_mix("delete=1")
+        assert parse_server_timing("decode_heic;dur=12.30, encode;dur=4.1") == {'decode_heic': 12.3, 'encode': 4.1}
+        assert is_cache_hit('cache;desc="hit"') and not is_cache_hit("decode_heic;dur=12.30")
+
+    def test_reports_throughput_latency_and_server_stages(self, corpus, service):
+        report = asyncio.run(run_load(corpus, concurrency=2, duration=0, requests=12, ramp_up=0.05,
+                                      mix="process=3,submit=1", seed=1))
+
+        assert report['requests'] == 12
+        assert report['error_rate'] == 0.0
+        assert report['rps'] > 0
+        assert set(report['latency_ms']) >= {'p50', 'p95', 'p99'}
+        assert sum(s['requests'] for s in report['endpoints'].values()) == 12
+        assert 'decode_opencv' in report['server_stages']
+        assert set(report['by_concurrency']) <= {'1', '2'}
+        assert report['cache_hits'] == 0
+
+    def test_result_cache_hits_are_counted_and_flagged(self, corpus, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path / "cached"), worker_pool=WorkerPool(kind="thread", size=2),
+                           result_cache=ResultCache())
+        app.dependency_overrides[get_image_service] = lambda: svc
+        try:
+            report = asyncio.run(run_load(corpus, concurrency=1, duration=0, requests=6))
+        finally:
+            app.dependency_overrides.clear()
+            svc.shutdown()
+
+        # Two images: every request after the first pass is served from the cache
+        assert report['cache_hits'] == 4
+        assert "WARNING: 4 of 6 responses came from the result cache" in format_report(report)
+
+    def test_capacity_regression_is_reported(self):
+        baseline = {'rps': 100.0, 'latency_ms': {'p95': 50.0}, 'error_rate': 0.0}
+        assert compare_to_baseline({'rps': 95.0, 'latency_ms': {'p95': 52.0}, 'error_rate': 0.0}, baseline) == []
+        regressions = compare_to_baseline({'rps': 70.0, 'latency_ms': {'p95': 80.0}, 'error_rate': 0.05}, baseline)
+        assert len(regressions) == 3
@@ -0,0 +1,35 @@
+# tests/test_metrics.py
+
+from app.services.metrics import Counter, Histogram, Registry, server_timing_header
+
+
+class TestMetricPrimitives:
+    """Tests the Prometheus text rendering of the in-repo metric types."""
+
+    def test_counter_renders_labels(self):
+        registry = Registry()
+        counter = registry.register(Counter("jobs_total", "Jobs.", ("outcome",)))
+        counter.inc(outcome="ok")
+        counter.inc(2, outcome="ok")
+
+        text = registry.render()
+        assert "# TYPE jobs_total counter" in text
+        assert 'jobs_total{outcome="ok"} 3' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value)
+
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{le="1"} 2' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert 'latency_seconds_count 3' in lines
+
+    def test_server_timing_splits_decode_by_decoder(self):
+        header = server_timing_header({'decoder': 'heic', 'timings': {'decode': 812.5, 'encode': 20.0}})
+        assert header == "decode_heic;dur=812.50, encode;dur=20.00"
+
+    def test_server_timing_marks_cache_hits(self):
+        assert server_timing_header({'timings': {}, 'cache': "hit"}) == "cache;desc=hit"
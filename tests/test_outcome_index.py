@@ -0,0 +1,156 @@
+# tests/test_outcome_index.py
+
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from app.services.image_service import ImageService, UploadTooLargeError
+from app.services.outcome_index import OutcomeIndex
+from app.services.probe import UnsupportedImageError
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, create_receipt_photo, make_upload
+
+
+@pytest.fixture
+def index(tmp_path):
+    i = OutcomeIndex(str(tmp_path / "outcomes.sqlite3"), batch_size=2)
+    yield i
+    i.close()
+
+
+def success(n: int) -> dict:
+    return {'status': "Processed and Coordinates Found", 'saved_filename': f"r{n}.jpg", 'digest': f"d{n % 3}",
+            'x': n, 'y': 0, 'w': 10, 'h': 10, 'timings': {'decode': 1.5}}
+
+
+# =========================================================================
+# I. Batched Writes
+# =========================================================================
+
+class TestWrites:
+    """Tests that record() stays in memory until a batch is flushed."""
+
+    def test_record_does_not_touch_the_database(self, index: OutcomeIndex):
+        index.record("process", "a.jpg", success(1))
+
+        assert not os.path.exists(index.db_path)
+        assert index.flush() == 1
+        assert index.flush() == 0
+        assert index.stats()['written'] == 1
+
+    def test_full_batch_wakes_the_flusher(self, index: OutcomeIndex):
+        async def run():
+            flusher = asyncio.create_task(index.flush_periodically(60))
+            await asyncio.sleep(0)
+            index.record("process", "a.jpg", success(1))
+            index.record("process", "b.jpg", success(2))
+            for _ in range(100):
+                if index.written:
+                    break
+                await asyncio.sleep(0.01)
+            flusher.cancel()
+
+        asyncio.run(run())
+        assert index.written == 2
+
+    def test_oldest_rows_dropped_beyond_max_pending(self, tmp_path):
+        index = OutcomeIndex(str(tmp_path / "o.sqlite3"), max_pending=2)
+        for n in range(3):
+            index.record("process", f"{n}.jpg", success(n))
+
+        assert index.dropped == 1
+        assert [row['filename'] for row in index.query()[0]] == ["2.jpg", "1.jpg"]
+
+
+# =========================================================================
+# II. Queries
+# =========================================================================
+
+class TestQueries:
+    """Tests filters, keyset pagination and that queries use an index."""
+
+    def test_filters(self, index: OutcomeIndex):
+        for n in range(6):
+            index.record("process", f"{n}.jpg", success(n))
+        index.record("process", "bad.jpg", {'status': "Error: Could not decode"})
+        index.record("submission", "big.jpg", {'status': "Rejected: too large"}, outcome="rejected")
+
+        assert [row['filename'] for row in index.query(status="error")[0]] == ["bad.jpg"]
+        assert [row['filename'] for row in index.query(kind="submission")[0]] == ["big.jpg"]
+        assert [row['filename'] for row in index.query(digest="d1")[0]] == ["4.jpg", "1.jpg"]
+        assert index.query(saved_filename="r3.jpg")[0][0]['timings'] == {'decode': 1.5}
+
+    def test_time_range(self, index: OutcomeIndex):
+        index.record("process", "a.jpg", success(1))
+        index.flush()
+        first = index.query()[0][0]['created_at']
+        index.record("process", "b.jpg", success(2))
+
+        assert [row['filename'] for row in index.query(until=first + 1e-6)[0]] == ["a.jpg"]
+        assert [row['filename'] for row in index.query(since=first + 1e-6)[0]] == ["b.jpg"]
+
+    def test_pages_cover_every_row_once(self, index: OutcomeIndex):
+        for n in range(7):
+            index.record("process", f"{n}.jpg", success(n))
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = index.query(limit=3, cursor=cursor)
+            seen += [row['filename'] for row in rows]
+            if cursor is None:
+                break
+        assert seen == [f"{n}.jpg" for n in reversed(range(7))]
+
+    @pytest.mark.parametrize("bad", [{'status': "meh"}, {'kind': "meh"}, {'cursor': "meh"}])
+    def test_invalid_arguments(self, index: OutcomeIndex, bad):
+        with pytest.raises(ValueError):
+            index.query(**bad)
+
+    @pytest.mark.parametrize("where", ["outcome = 'error'", "digest = 'd1'", "created_at >= 0", "saved_filename = 'x'"])
+    def test_filtered_queries_never_scan_the_table(self, index: OutcomeIndex, where):
+        plan = index.conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM outcomes WHERE {where} ORDER BY created_at DESC, id DESC").fetchall()
+
+        details = " ".join(row[-1] for row in plan)
+        assert "USING INDEX" in details
+        assert "TEMP B-TREE" not in details
+
+
+# =========================================================================
+# III. ImageService Integration
+# =========================================================================
+
+class TestServiceOutcomes:
+    """Tests that the service records crops, rejections and submissions."""
+
+    def test_crop_and_rejection_are_recorded(self, tmp_path, index: OutcomeIndex):
+        svc = ImageService(upload_dir=str(tmp_path / "up"), worker_pool=WorkerPool(kind="thread", size=1),
+                           max_upload_bytes=10_000_000, outcomes=index)
+        content = create_receipt_photo()
+        try:
+            result = asyncio.run(svc.image_cropping(make_upload(content, "receipt.png")))
+            with pytest.raises(UnsupportedImageError):
+                asyncio.run(svc.image_cropping(make_upload(b"not an image", "junk.jpg")))
+        finally:
+            svc.shutdown()
+
+        rejected, crop = index.query()[0]
+        assert rejected['outcome'] == "rejected" and rejected['filename'] == "junk.jpg"
+        assert crop['outcome'] == "success"
+        assert crop['saved_filename'] == result['saved_filename']
+        assert crop['original_filename'] == svc._original_filename(result['saved_filename'])
+        assert crop['digest'] == hashlib.sha256(content).hexdigest()
+        assert (crop['x'], crop['y'], crop['w'], crop['h']) == PAPER_BOX
+        assert 'upload_read' in crop['timings']
+
+    def test_submissions_are_recorded(self, tmp_path, index: OutcomeIndex):
+        svc = ImageService(upload_dir=str(tmp_path / "up"), max_upload_bytes=100, outcomes=index)
+        asyncio.run(svc.save_cropped_file(make_upload(b"x" * 10, "final.jpg")))
+        with pytest.raises(UploadTooLargeError):
+            asyncio.run(svc.save_cropped_file(make_upload(b"x" * 1000, "big.jpg")))
+
+        rows = index.query(kind="submission")[0]
+        assert [(row['filename'], row['outcome']) for row in rows] == [("big.jpg", "rejected"), ("final.jpg", "success")]
+        assert rows[1]['saved_filename'].endswith("_final.jpg")
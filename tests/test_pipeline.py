@@ -0,0 +1,250 @@
+# tests/test_pipeline.py
+
+import io
+import os
+
+import cv2
+import numpy as np
+import pillow_heif
+import pytest
+
+from app.services import pipeline
+from app.services.encoder import EncodeOptions
+from app.services.pipeline import DetectionOptions
+
+
+# --- Test Data ---
+
+def create_large_photo(box=(413, 287, 1201, 1630), size=(2400, 1800)) -> np.ndarray:
+    """A 'phone sized' dark frame with a white paper box at awkward offsets."""
+    x, y, w, h = box
+    img = np.full((size[0], size[1], 3), 35, np.uint8)
+    img[y:y + h, x:x + w] = 245
+    return img
+
+
+# =========================================================================
+# I. Detection Modes
+# =========================================================================
+
+class TestDetection:
+    """Tests full-resolution vs. downscaled paper detection."""
+
+    def test_full_mode_reports_unit_scale(self):
+        box = (413, 287, 1201, 1630)
+        coords, scale = pipeline.detect_paper(create_large_photo(box))
+        assert coords == box
+        assert scale == 1.0
+
+    @pytest.mark.parametrize("options", [
+        DetectionOptions(mode="downscale", scale=0.25),
+        DetectionOptions(mode="downscale", scale=0.125),
+        DetectionOptions(mode="downscale", max_side=300),
+    ])
+    def test_downscale_with_refine_matches_full_resolution(self, options):
+        box = (413, 287, 1201, 1630)
+        coords, scale = pipeline.detect_paper(create_large_photo(box), options)
+        assert scale < 1.0
+        assert coords == box
+
+    def test_downscale_without_refine_is_within_one_reduced_pixel(self):
+        box = (413, 287, 1201, 1630)
+        options = DetectionOptions(mode="downscale", scale=0.125, refine=False)
+        coords, scale = pipeline.detect_paper(create_large_photo(box), options)
+        tolerance = int(np.ceil(1 / scale)) * 2
+        assert all(abs(a - b) <= tolerance for a, b in zip(coords, box))
+
+    def test_small_images_are_not_upscaled(self):
+        options = DetectionOptions(mode="downscale", max_side=4096)
+        _, scale = pipeline.detect_paper(create_large_photo(), options)
+        assert scale == 1.0
+
+    def test_unknown_mode_is_rejected(self):
+        with pytest.raises(ValueError):
+            DetectionOptions(mode="magic")
+
+
+# =========================================================================
+# II. Crop Transforms
+# =========================================================================
+
+class TestTransform:
+    """Tests the Cropper.js rotate/scale transform applied before a manual crop."""
+
+    def _marked(self) -> np.ndarray:
+        img = np.zeros((20, 40, 3), np.uint8)
+        img[0, 0] = 255  # top-left marker
+        return img
+
+    def test_right_angle_rotation_is_clockwise(self):
+        rotated = pipeline.transform_image(self._marked(), rotate=90)
+
+        assert rotated.shape[:2] == (40, 20)
+        assert rotated[0, -1, 0] == 255  # top-left moves to top-right
+
+    def test_negative_scale_flips(self):
+        flipped = pipeline.transform_image(self._marked(), scale_x=-1)
+
+        assert flipped[0, -1, 0] == 255
+
+    def test_free_rotation_enlarges_canvas(self):
+        rotated = pipeline.transform_image(self._marked(), rotate=45)
+
+        assert rotated.shape[0] > 20 and rotated.shape[1] > 40
+
+    def test_crop_to_box_clamps_and_writes(self, tmp_path):
+        img = create_large_photo((10, 10, 50, 50), size=(100, 80))
+        out = str(tmp_path / "final.png")
+
+        result = pipeline.crop_to_box(img, "", out, (70.4, -5, 40, 30))
+
+        assert (result['x'], result['y'], result['w'], result['h']) == (70, 0, 10, 25)
+        assert (tmp_path / "final.png").exists()
+
+    def test_crop_to_box_outside_image(self, tmp_path):
+        img = create_large_photo((10, 10, 50, 50), size=(100, 80))
+        result = pipeline.crop_to_box(img, "", str(tmp_path / "final.png"), (200, 200, 10, 10))
+
+        assert result['status'].startswith("Error:")
+
+
+# =========================================================================
+# III. HEIC Decode
+# =========================================================================
+
+def create_heic(thumbnail: int = 120) -> bytes:
+    """480x360 HEIC with a white box at (80, 60, 320, 240) and an embedded thumbnail."""
+    img = create_large_photo((80, 60, 320, 240), size=(360, 480))
+    heif_file = pillow_heif.from_bytes(mode="BGR", size=(480, 360), data=img.tobytes())
+    heif_file.info["thumbnails"] = [thumbnail] if thumbnail else []
+    buffer = io.BytesIO()
+    heif_file.save(buffer, quality=95)
+    return buffer.getvalue()
+
+
+# The test thumbnails (120 px) are under the default thumbnail_min_side
+THUMBNAIL = DetectionOptions(mode="thumbnail", thumbnail_min_side=100)
+
+
+class TestHeicDecode:
+    """Tests the direct-BGR decode and thumbnail-first detection for HEIC."""
+
+    def test_decodes_straight_to_bgr(self):
+        img = pipeline.decode_image_bytes(create_heic(), "r.heic")
+
+        assert img.shape == (360, 480, 3)
+        # Paper is white, table is dark: channel order survived
+        assert img[200, 200].min() > 200 and img[10, 10].max() < 80
+
+    def test_thumbnail_mode_matches_full_detection(self, tmp_path):
+        data = create_heic()
+        full = pipeline.crop_image_bytes(data, "r.heic", str(tmp_path), DetectionOptions())
+        thumb = pipeline.crop_image_bytes(data, "t.heic", str(tmp_path), THUMBNAIL)
+
+        assert 'decode_thumbnail' in thumb['timings']
+        for a, b in zip((full['x'], full['y'], full['w'], full['h']), (thumb['x'], thumb['y'], thumb['w'], thumb['h'])):
+            assert abs(a - b) <= 4
+        assert thumb['decode_bytes'] > full['decode_bytes']  # thumbnail + full frame
+
+    def test_thumbnail_satisfies_small_output_without_full_decode(self, tmp_path):
+        result = pipeline.crop_image_bytes(create_heic(), "r.heic", str(tmp_path), THUMBNAIL,
+                                           encoding=EncodeOptions(max_side=60))
+
+        assert 'decode' not in result['timings']
+        assert result['decode_bytes'] < 480 * 360 * 3
+        assert abs(result['w'] - 320) <= 8
+
+    def test_small_thumbnail_is_ignored(self, tmp_path):
+        result = pipeline.crop_image_bytes(create_heic(), "r.heic", str(tmp_path), DetectionOptions(mode="thumbnail"),
+                                           encoding=EncodeOptions(max_side=60))
+
+        assert 'decode' in result['timings']
+        assert result['decode_bytes'] == 480 * 360 * 3  # full frame only
+        assert abs(result['w'] - 320) <= 4
+
+    def test_without_thumbnail_falls_back_to_downscale(self, tmp_path):
+        result = pipeline.crop_image_bytes(create_heic(thumbnail=0), "r.heic", str(tmp_path),
+                                           DetectionOptions(mode="thumbnail"))
+
+        assert result['status'] == 'Processed and Coordinates Found'
+        assert 'decode' in result['timings']
+
+
+# =========================================================================
+# IV. Multiple Receipts
+# =========================================================================
+
+# Three receipts on a table, largest first, plus a crumb under the area threshold
+RECEIPTS = [(1000, 300, 600, 1500), (150, 200, 500, 1100), (200, 1500, 400, 700)]
+
+
+def create_table_photo(size=(2400, 1800)) -> np.ndarray:
+    img = np.full((size[0], size[1], 3), 35, np.uint8)
+    for x, y, w, h in RECEIPTS + [(1500, 2200, 30, 30)]:
+        img[y:y + h, x:x + w] = 245
+    return img
+
+
+class TestMultipleReceipts:
+    """Tests multiple=True: every region over min_area, one crop each."""
+
+    @pytest.mark.parametrize("options", [
+        DetectionOptions(multiple=True),
+        DetectionOptions(multiple=True, mode="downscale", scale=0.25),
+    ])
+    def test_every_receipt_is_found_largest_first(self, options):
+        boxes, _ = pipeline.detect_papers(create_table_photo(), options)
+        assert boxes == RECEIPTS
+
+    def test_area_threshold_and_region_cap(self):
+        photo = create_table_photo()
+        assert len(pipeline.detect_papers(photo, DetectionOptions(multiple=True, min_area=0.1))[0]) == 2
+        assert pipeline.detect_papers(photo, DetectionOptions(multiple=True, max_regions=1))[0] == RECEIPTS[:1]
+        with pytest.raises(ValueError):
+            DetectionOptions(min_area=0)
+
+    def test_one_decode_one_crop_per_receipt(self, tmp_path):
+        ok, buf = cv2.imencode(".png", create_table_photo())
+        result = pipeline.crop_image_bytes(buf.tobytes(), "table.png", str(tmp_path), DetectionOptions(multiple=True))
+
+        assert [r['saved_filename'] for r in result['regions']] == [
+            "table.png", "table_region2.png", "table_region3.png"]
+        assert (result['x'], result['y'], result['w'], result['h']) == RECEIPTS[0]
+        for region, (x, y, w, h) in zip(result['regions'], RECEIPTS):
+            crop = cv2.imread(str(tmp_path / region['saved_filename']))
+            assert crop.shape[:2] == (h, w)
+        assert result['output_bytes'] == sum(r['output_bytes'] for r in result['regions'])
+        assert result['timings']['decode'] > 0
+
+    @pytest.mark.parametrize("failure", ["encode", "write"])
+    def test_failed_region_removes_the_ones_written(self, tmp_path, monkeypatch, failure):
+        crop_and_overwrite, calls = pipeline.crop_and_overwrite, []
+
+        def second_write_fails(img, path, *args, **kwargs):
+            calls.append(path)
+            if len(calls) == 2:
+                if failure == "write":
+                    raise OSError("disk full")
+                return 0
+            return crop_and_overwrite(img, path, *args, **kwargs)
+
+        monkeypatch.setattr(pipeline, "crop_and_overwrite", second_write_fails)
+        ok, buf = cv2.imencode(".png", create_table_photo())
+        if failure == "write":
+            with pytest.raises(OSError):
+                pipeline.crop_image_bytes(buf.tobytes(), "table.png", str(tmp_path), DetectionOptions(multiple=True))
+        else:
+            result = pipeline.crop_image_bytes(buf.tobytes(), "table.png", str(tmp_path),
+                                               DetectionOptions(multiple=True))
+            assert result['status'] == "Error: Failed to save crop 2 of 3"
+
+        assert len(calls) == 2
+        assert os.listdir(tmp_path) == []
+
+    def test_single_mode_is_unchanged(self, tmp_path):
+        ok, buf = cv2.imencode(".png", create_table_photo())
+        result = pipeline.crop_image_bytes(buf.tobytes(), "table.png", str(tmp_path))
+
+        assert 'regions' not in result
+        assert (result['x'], result['y'], result['w'], result['h']) == RECEIPTS[0]
+        assert os.listdir(tmp_path) == ["table.png"]
@@ -0,0 +1,124 @@
+# tests/test_probe.py
+
+import asyncio
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app.services.image_service import ImageService
+from app.services.probe import (PROBE_BYTES, ImageDimensionsError, ImageProbe, UnknownDimensionsError,
+                                UnsupportedImageError, check_pixels, probe_image)
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, chunked, create_receipt_photo, make_upload
+from tests.test_pipeline import create_heic
+
+
+def encode(ext: str, size=(37, 53)) -> bytes:
+    ok, buf = cv2.imencode(ext, np.zeros((size[0], size[1], 3), np.uint8))
+    assert ok
+    return buf.tobytes()
+
+
+def with_icc_segments(jpeg: bytes, count: int = 2) -> bytes:
+    """The JPEG with `count` maximum-size APP2 segments after SOI, pushing its SOF past PROBE_BYTES."""
+    app2 = b"\xff\xe2\xff\xff" + b"\x00" * 0xFFFD
+    return jpeg[:2] + app2 * count + jpeg[2:]
+
+
+# =========================================================================
+# I. Header Parsing
+# =========================================================================
+
+class TestProbe:
+    """Tests format sniffing and dimension parsing from the first bytes."""
+
+    @pytest.mark.parametrize("ext, fmt", [(".jpg", "jpeg"), (".png", "png"), (".webp", "webp"), (".bmp", "bmp")])
+    def test_opencv_formats(self, ext, fmt):
+        probe = probe_image(encode(ext))
+
+        assert (probe.format, probe.width, probe.height) == (fmt, 53, 37)
+        assert probe.decoder == "opencv"
+
+    def test_heic_dimensions_from_ispe(self):
+        probe = probe_image(create_heic())
+
+        assert (probe.format, probe.width, probe.height) == ("heic", 480, 360)
+        assert probe.decoder == "heic"
+
+    def test_unknown_content_is_rejected(self):
+        with pytest.raises(UnsupportedImageError):
+            probe_image(b"%PDF-1.7 not an image")
+
+    def test_jpeg_sof_behind_large_segments(self):
+        data = with_icc_segments(encode(".jpg"))
+        head = probe_image(data[:PROBE_BYTES])
+
+        assert head.pixels is None and PROBE_BYTES < head.needs < len(data)
+        probe = head
+        while probe.pixels is None:
+            probe = probe_image(data[:probe.needs])
+        assert (probe.width, probe.height) == (53, 37)
+
+    def test_tiff_dimensions_from_trailing_ifd(self):
+        data = encode(".tif")
+        head = probe_image(data[:64])
+
+        assert head.pixels is None and head.needs > 64
+        assert (probe_image(data).width, probe_image(data).height) == (53, 37)
+
+    def test_unknown_dimensions_fail_a_pixel_limit(self):
+        check_pixels(ImageProbe("tiff"), max_pixels=0)
+        with pytest.raises(UnknownDimensionsError):
+            check_pixels(ImageProbe("tiff"), max_pixels=1_000_000)
+
+    def test_pixel_limit(self):
+        with pytest.raises(ImageDimensionsError):
+            check_pixels(probe_image(encode(".png", (1000, 1000))), max_pixels=999_999)
+
+
+# =========================================================================
+# II. ImageService Routing and Limits
+# =========================================================================
+
+class TestServiceProbe:
+    """Tests that the service decodes by content and rejects before decoding."""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), worker_pool=WorkerPool(kind="thread", size=1),
+                           max_image_pixels=100_000)
+        yield svc
+        svc.shutdown()
+
+    def test_misnamed_heic_uses_heic_decoder(self, service: ImageService):
+        # 480x360 is over the fixture's pixel cap, so lift it for this test
+        service.max_image_pixels = 0
+        result = asyncio.run(service.image_cropping(make_upload(create_heic(), "photo.jpg")))
+
+        assert result['decoder'] == "heic"
+        assert result['status'] == 'Processed and Coordinates Found'
+
+    def test_misnamed_png_still_crops(self, service: ImageService):
+        result = asyncio.run(service.image_cropping(make_upload(create_receipt_photo(), "photo.heic")))
+
+        assert result['decoder'] == "opencv"
+        assert (result['x'], result['y'], result['w'], result['h']) == PAPER_BOX
+        assert 'probe' in result['timings']
+
+    def test_oversized_dimensions_rejected_without_writing(self, service: ImageService):
+        with pytest.raises(ImageDimensionsError):
+            asyncio.run(service.image_cropping(make_upload(encode(".png", (400, 400)))))
+
+        assert os.listdir(service.upload_dir) == []
+
+    @pytest.mark.parametrize("data", [with_icc_segments(encode(".jpg", (400, 400))), encode(".tif", (400, 400))],
+                             ids=["jpeg-icc", "tiff"])
+    def test_dimensions_past_the_probe_are_still_capped(self, service: ImageService, data):
+        with pytest.raises(ImageDimensionsError):
+            asyncio.run(service.image_cropping(make_upload(data, "photo.jpg")))
+        with pytest.raises(ImageDimensionsError):
+            asyncio.run(service._read_stream(chunked(data), len(data)))
+
+        assert os.listdir(service.upload_dir) == []
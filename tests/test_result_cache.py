@@ -0,0 +1,135 @@
+# tests/test_result_cache.py
+
+import asyncio
+import json
+import os
+
+from app.services.image_service import ImageService
+from app.services.pipeline import DetectionOptions
+from app.services.result_cache import ResultCache, make_key
+from tests.test_image_service import PAPER_BOX, create_receipt_photo, make_upload
+
+RESULT = {'x': 1, 'y': 2, 'w': 3, 'h': 4, 'status': 'Processed and Coordinates Found',
+          'saved_filename': 'receipt_abc.png'}
+
+
+# =========================================================================
+# I. ResultCache
+# =========================================================================
+
+class TestResultCache:
+    """Tests the two-tier content-hash cache in isolation."""
+
+    def test_key_depends_on_detector_parameters(self):
+        assert make_key("abc", DetectionOptions()) != make_key("abc", DetectionOptions(mode="downscale"))
+        assert make_key("abc", DetectionOptions()) == make_key("abc", DetectionOptions())
+
+    def test_hit_and_miss_counters(self):
+        cache = ResultCache(max_entries=4)
+        assert cache.get("k") is None
+        cache.put("k", RESULT)
+        assert cache.get("k") == RESULT
+
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", RESULT)
+        cache.put("b", RESULT)
+        cache.get("a")          # "b" is now least recently used
+        cache.put("c", RESULT)
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats()['evictions'] == 1
+
+    def test_memory_tier_is_bounded_in_bytes(self):
+        big = {**RESULT, 'regions': [dict(RESULT) for _ in range(20)]}
+        cache = ResultCache(max_entries=100, max_bytes=3 * len(json.dumps(big)))
+        for key in "abcd":
+            cache.put(key, big)
+
+        assert cache.get("a") is None and cache.get("d") is not None
+        stats = cache.stats()
+        assert stats['entries'] == 3 and stats['bytes'] <= stats['max_bytes']
+        assert stats['evictions'] == 1
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        ResultCache(max_entries=2, disk_dir=str(tmp_path)).put("k", RESULT)
+
+        restarted = ResultCache(max_entries=2, disk_dir=str(tmp_path))
+        assert restarted.get("k") == RESULT
+        assert restarted.stats()['disk_hits'] == 1
+
+    def test_rejected_entry_is_a_miss_not_a_hit(self):
+        cache = ResultCache(max_entries=4)
+        cache.put("k", RESULT)
+
+        assert cache.get("k", is_valid=lambda value: False) is None
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['stale'], stats['entries']) == (0, 1, 1, 0)
+
+    def test_disk_tier_is_bounded_least_recently_used_first(self, tmp_path):
+        cache = ResultCache(max_entries=0, disk_dir=str(tmp_path), max_disk_entries=2)
+        cache.put("a", RESULT)
+        cache.put("b", RESULT)
+        os.utime(tmp_path / "a.json", (0, 0))
+        os.utime(tmp_path / "b.json", (0, 0))
+        cache.get("a")          # "b" is now least recently used, here and after a restart
+        cache.put("c", RESULT)
+
+        assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+        assert cache.stats()['disk_evictions'] == 1
+        os.utime(tmp_path / "c.json", (0, 0))
+        restarted = ResultCache(max_entries=0, disk_dir=str(tmp_path), max_disk_entries=1)
+        assert os.listdir(tmp_path) == ["a.json"]
+        assert restarted.stats()['disk_entries'] == 1
+
+    def test_interrupted_writes_are_swept_on_start(self, tmp_path):
+        (tmp_path / "k.json.123.tmp").write_text("{")
+        os.utime(tmp_path / "k.json.123.tmp", (0, 0))
+        (tmp_path / "fresh.json.456.tmp").write_text("{")
+
+        ResultCache(disk_dir=str(tmp_path))
+        assert os.listdir(tmp_path) == ["fresh.json.456.tmp"]
+
+
+# =========================================================================
+# II. ImageService Integration
+# =========================================================================
+
+class TestImageServiceCaching:
+    """Tests that repeated uploads skip the pipeline."""
+
+    def test_repeated_upload_returns_cached_crop(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), result_cache=ResultCache())
+        content = create_receipt_photo()
+        try:
+            first = asyncio.run(svc.image_cropping(make_upload(content)))
+            second = asyncio.run(svc.image_cropping(make_upload(content)))
+        finally:
+            svc.shutdown()
+
+        assert second['saved_filename'] == first['saved_filename']
+        assert second['cache'] == "hit"
+        assert (second['x'], second['y'], second['w'], second['h']) == PAPER_BOX
+        # The duplicate original was discarded; the first crop and its original remain
+        assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+            [first['saved_filename'], svc._original_filename(first['saved_filename'])])
+        assert svc.cache_stats()['hits'] == 1
+
+    def test_deleted_crop_is_recomputed(self, tmp_path):
+        svc = ImageService(upload_dir=str(tmp_path), result_cache=ResultCache())
+        content = create_receipt_photo()
+        try:
+            first = asyncio.run(svc.image_cropping(make_upload(content)))
+            (tmp_path / first['saved_filename']).unlink()
+            second = asyncio.run(svc.image_cropping(make_upload(content)))
+        finally:
+            svc.shutdown()
+
+        assert second['saved_filename'] != first['saved_filename']
+        assert (tmp_path / second['saved_filename']).exists()
+        stats = svc.cache_stats()
+        assert (stats['hits'], stats['stale']) == (0, 1)
@@ -0,0 +1,71 @@
+# tests/test_scratch.py
+
+import threading
+
+import cv2
+import numpy as np
+
+from app.services.detectors import get_detector, paper_mask
+from app.services.scratch import ScratchBuffers
+from tests.test_image_service import PAPER_BOX, create_receipt_photo
+
+
+class TestScratchBuffers:
+    """Tests reuse, growth and the per-thread split of scratch arrays."""
+
+    def test_same_memory_until_a_larger_frame(self):
+        scratch = ScratchBuffers()
+        first = scratch.get("mask", (10, 20))
+        smaller = scratch.get("mask", (5, 5))
+        larger = scratch.get("mask", (30, 20))
+
+        assert np.shares_memory(first, smaller)
+        assert not np.shares_memory(first, larger)
+        assert smaller.shape == (5, 5) and larger.shape == (30, 20)
+        assert scratch.stats() == {'allocations': 2, 'reuses': 1}
+        assert scratch.thread_bytes() == 600
+
+    def test_dtype_and_shape_are_honoured(self):
+        scratch = ScratchBuffers()
+        scratch.get("profile", (64,), np.uint8)
+        profile = scratch.get("profile", (4, 2), np.int32)
+
+        assert profile.dtype == np.int32 and profile.shape == (4, 2)
+        assert scratch.stats()['reuses'] == 1
+
+    def test_disabled_or_oversized_requests_are_not_kept(self):
+        scratch = ScratchBuffers(max_bytes=100)
+        scratch.get("mask", (20, 20))
+        scratch.enabled = False
+        scratch.get("other", (2, 2))
+
+        assert scratch.thread_bytes() == 0
+        assert scratch.stats() == {'allocations': 2, 'reuses': 0}
+
+    def test_threads_get_their_own_buffers(self):
+        scratch = ScratchBuffers()
+        mine = scratch.get("mask", (8, 8))
+        theirs = []
+        thread = threading.Thread(target=lambda: theirs.append(scratch.get("mask", (8, 8))))
+        thread.start()
+        thread.join()
+
+        assert not np.shares_memory(mine, theirs[0])
+
+
+class TestDetectorScratch:
+    """Tests that detection writes its masks into reused scratch memory."""
+
+    def test_paper_mask_reuses_its_buffer(self):
+        img = cv2.imdecode(np.frombuffer(create_receipt_photo(), np.uint8), cv2.IMREAD_COLOR)
+        first = paper_mask(img)
+        expected = first.copy()
+        second = paper_mask(img)
+
+        assert np.shares_memory(first, second)
+        assert np.array_equal(second, expected)
+
+    def test_detectors_still_find_the_paper(self):
+        img = cv2.imdecode(np.frombuffer(create_receipt_photo(), np.uint8), cv2.IMREAD_COLOR)
+        for _ in range(2):
+            assert get_detector("contour").detect(img) == PAPER_BOX
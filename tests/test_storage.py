@@ -0,0 +1,137 @@
+# tests/test_storage.py
+
+import asyncio
+import os
+import threading
+import time
+
+import cv2
+import pytest
+
+from app.services.image_service import ImageService
+from app.services.storage import INDEX_NAME, UploadStore, atomic_write, region_filename, temporary_path
+from app.services.worker_pool import WorkerPool
+from tests.test_image_service import PAPER_BOX, create_receipt_photo, make_upload
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = UploadStore(str(tmp_path))
+    yield s
+    s.close()
+
+
+# =========================================================================
+# I. Layout and Writes
+# =========================================================================
+
+class TestLayout:
+    """Tests sharded paths, atomic writes and the legacy flat fallback."""
+
+    def test_original_and_crop_share_a_shard(self, store: UploadStore, tmp_path):
+        crop = store.path_for("receipt_abc123.jpg")
+        original = store.path_for("receipt_abc123_original.heic")
+
+        assert os.path.dirname(crop) == os.path.dirname(original)
+        assert os.path.relpath(os.path.dirname(crop), tmp_path).count(os.sep) == 1  # ab/cd
+
+    def test_regions_share_the_original_shard(self, store: UploadStore):
+        assert region_filename("receipt_abc123.jpg", 1) == "receipt_abc123.jpg"
+        assert region_filename("receipt_abc123.jpg", 2) == "receipt_abc123_region2.jpg"
+        assert store.path_for("receipt_abc123_region2.jpg").rsplit(os.sep, 1)[0] == \
+            store.path_for("receipt_abc123.jpg").rsplit(os.sep, 1)[0]
+
+    def test_failed_write_leaves_nothing_behind(self, tmp_path):
+        path = str(tmp_path / "a.jpg")
+        with pytest.raises(TypeError):
+            atomic_write(path, object())
+        assert os.listdir(tmp_path) == []
+
+    def test_finds_files_from_before_sharding(self, store: UploadStore, tmp_path):
+        (tmp_path / "old.jpg").write_bytes(b"x")
+        store.write("new.jpg", b"y")
+
+        assert store.find("old.jpg") == str(tmp_path / "old.jpg")
+        assert store.find("new.jpg") == store.path_for("new.jpg")
+        assert store.find("missing.jpg") is None
+
+    def test_stale_temporary_files_are_swept(self, store: UploadStore):
+        stale, fresh = temporary_path(store.path_for("a.jpg")), temporary_path(store.path_for("b.jpg"))
+        assert os.path.dirname(stale) == store.dir_for("a.jpg")
+        for path in (stale, fresh):
+            with open(path, "wb") as f:
+                f.write(b"partial")
+        os.utime(stale, (0, 0))
+
+        assert store.sweep_temporary_files(now=time.time()) == 1
+        assert not os.path.exists(stale) and os.path.exists(fresh)
+
+
+# =========================================================================
+# II. Batched Index Writes
+# =========================================================================
+
+class TestIndexWrites:
+    """Tests that record()/remove() only queue, and never wait for a collection pass."""
+
+    def test_changes_are_applied_in_order_on_flush(self, store: UploadStore):
+        store.record("a.jpg", 10)
+        store.record("b.jpg", 20)
+        store.remove("a.jpg")
+
+        assert not os.path.exists(os.path.join(store.root, INDEX_NAME))
+        assert store.flush() == 3
+        assert store.conn.execute("SELECT name, size FROM files").fetchall() == [("b.jpg", 20)]
+
+    def test_record_does_not_wait_for_a_collection(self, store: UploadStore):
+        with store._lock:  # held by collect() for its whole scan
+            writer = threading.Thread(target=lambda: (store.record("a.jpg", 1), store.remove("a.jpg")))
+            writer.start()
+            writer.join(timeout=2)
+            assert not writer.is_alive()
+        assert store.stats()['files'] == 0
+
+
+# =========================================================================
+# III. Garbage Collection
+# =========================================================================
+
+class TestCollection:
+    """Tests eviction by age and by size budget, from the index alone."""
+
+    def test_evicts_expired_then_oldest_over_budget(self, tmp_path):
+        store = UploadStore(str(tmp_path), max_age_seconds=60, max_bytes=250)
+        for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg"):
+            store.write(name, b"x" * 100)
+        store.flush()
+        store.conn.execute("UPDATE files SET created_at = created_at - 120 WHERE name = 'a.jpg'")
+        store.conn.execute("UPDATE files SET created_at = created_at - 10 WHERE name = 'b.jpg'")
+
+        assert store.collect() == {'files': 2, 'bytes': 200}
+        assert store.find("a.jpg") is None and store.find("b.jpg") is None
+        assert store.find("c.jpg") is not None
+        assert store.stats()['bytes'] == 200
+        store.close()
+
+    def test_disabled_rules_collect_nothing(self, store: UploadStore):
+        store.write("a.jpg", b"x")
+        assert store.collect() == {'files': 0, 'bytes': 0}
+
+
+# =========================================================================
+# IV. ImageService Integration
+# =========================================================================
+
+class TestServiceStorage:
+    """Tests that the service writes originals and crops into the sharded store."""
+
+    def test_crop_is_sharded_indexed_and_served(self, store: UploadStore, tmp_path):
+        service = ImageService(worker_pool=WorkerPool(kind="thread", size=1), store=store)
+        result = asyncio.run(service.image_cropping(make_upload(create_receipt_photo())))
+        service.shutdown()
+
+        path = service.stored_image_path(result['saved_filename'])
+        assert os.path.dirname(path) != str(tmp_path)
+        assert cv2.imread(path).shape[:2] == (PAPER_BOX[3], PAPER_BOX[2])
+        # Original and crop are both indexed
+        assert store.stats()['files'] == 2
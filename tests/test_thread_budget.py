@@ -0,0 +1,58 @@
+# tests/test_thread_budget.py
+
+import cv2
+import pytest
+
+from app.serve import main as serve_main
+from app.services.thread_budget import apply_opencv_threads, plan_threads
+
+
+# =========================================================================
+# I. Layout Planning
+# =========================================================================
+
+class TestPlanThreads:
+    """Tests that web workers x pool x OpenCV threads stays within the budget."""
+
+    @pytest.mark.parametrize("cores, web_workers, pool_size", [(1, 1, 1), (8, 2, 4), (16, 4, 4), (6, 1, 6)])
+    def test_thread_pool_budget_is_split_across_levels(self, cores, web_workers, pool_size):
+        layout = plan_threads(cores=cores)
+
+        assert (layout.web_workers, layout.pool_size, layout.opencv_threads) == (web_workers, pool_size, 1)
+        assert layout.threads == cores
+        assert "oversubscribed" not in layout.report()
+
+    def test_process_pool_uses_one_web_worker(self):
+        layout = plan_threads(cores=8, pool_kind="process")
+        assert (layout.web_workers, layout.pool_size) == (1, 8)
+
+    def test_spare_cores_go_to_opencv(self):
+        layout = plan_threads(cores=8, web_workers=1, pool_size=2)
+        assert layout.opencv_threads == 4
+
+    def test_explicit_oversubscription_is_reported(self):
+        layout = plan_threads(cores=4, web_workers=2, pool_size=4, opencv_threads=-1)
+        assert layout.threads == 8
+        assert "oversubscribed 2.0x" in layout.report()
+
+
+# =========================================================================
+# II. Applying the Layout
+# =========================================================================
+
+class TestApply:
+    """Tests the OpenCV setting and the launcher's dry run."""
+
+    def test_sets_opencv_threads(self):
+        previous = cv2.getNumThreads()
+        try:
+            apply_opencv_threads(2)
+            assert cv2.getNumThreads() == 2
+            apply_opencv_threads(-1)  # leaves it alone
+            assert cv2.getNumThreads() == 2
+        finally:
+            cv2.setNumThreads(previous)
+
+    def test_dry_run_prints_layout(self, capsys):
+        serve_main(["--dry-run"])
+        assert capsys.readouterr().out.startswith("Thread layout:")